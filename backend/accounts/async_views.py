@@ -0,0 +1,169 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from accounts.cache import ConditionalResponseMixin
+from accounts.pagination import SelectablePagination
+from accounts.views import (
+    CityViewSet,
+    JobTitleHistoryViewSet,
+    SalaryHistoryViewSet,
+    UserProfileViewSet,
+)
+
+
+def json_response(data, status_code=status.HTTP_200_OK, headers=None):
+    return HttpResponse(
+        json.dumps(data, cls=JSONEncoder),
+        status=status_code,
+        headers=headers,
+        content_type="application/json",
+    )
+
+
+class AsyncReadOnlyView(View):
+    """
+    Async list/retrieve endpoint for a DRF viewset.
+    Authentication, permissions, filtering and serialization are delegated to the
+    viewset, so both paths share one definition; the count, page slice and
+    single-object get run on Django's async ORM. Filtering (which may call the
+    presence store) and serialization are blocking, so they run in a thread.
+    Pagination follows the viewset's settings: page numbers, or keyset pages for
+    SelectablePagination viewsets asked for ?pagination=cursor.
+    Viewsets with ConditionalResponseMixin get the same ETag/Last-Modified
+    handling, answering a matching conditional request with 304 before any query.
+    """
+    viewset_class = None
+    http_method_names = ["get", "head", "options"]
+
+    def get_viewset(self, request, pk):
+        viewset = self.viewset_class(
+            action="list" if pk is None else "retrieve",
+            kwargs={} if pk is None else {"pk": pk},
+            format_kwarg=None,
+        )
+        viewset.request = Request(
+            request,
+            authenticators=viewset.get_authenticators(),
+            parsers=viewset.get_parsers(),
+            negotiator=viewset.get_content_negotiator(),
+        )
+        viewset.headers = {}
+        return viewset
+
+    async def get(self, request, pk=None):
+        viewset = self.get_viewset(request, pk)
+        try:
+            # Authenticators may query the user table, keep them off the event loop
+            await sync_to_async(viewset.initial)(viewset.request)
+            validators = None
+            if isinstance(viewset, ConditionalResponseMixin):
+                # Collection versions come from the (possibly networked) cache
+                validators = await sync_to_async(viewset.get_validators)(viewset.request)
+            if validators is not None:
+                response = viewset.not_modified(request, validators)
+                if response is not None:
+                    return viewset.set_validators(response, validators)
+            if pk is None:
+                data = await self.list(viewset)
+            else:
+                data = await self.retrieve(viewset, pk)
+        except exceptions.APIException as exc:
+            headers = {}
+            if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+                # Same rule as APIView.handle_exception
+                header = viewset.get_authenticate_header(viewset.request)
+                if header:
+                    headers["WWW-Authenticate"] = header
+                else:
+                    exc.status_code = status.HTTP_403_FORBIDDEN
+            detail = exc.detail if isinstance(exc.detail, (list, dict)) else {"detail": exc.detail}
+            return json_response(detail, exc.status_code, headers)
+        response = json_response(data)
+        if validators is not None:
+            viewset.set_validators(response, validators)
+        return response
+
+    @staticmethod
+    def filtered_queryset(viewset):
+        return viewset.filter_queryset(viewset.get_queryset())
+
+    @staticmethod
+    def serialize(viewset, instance, many=False):
+        return viewset.get_serializer(instance, many=many).data
+
+    async def retrieve(self, viewset, pk):
+        queryset = await sync_to_async(self.filtered_queryset)(viewset)
+        try:
+            instance = await queryset.aget(**{viewset.lookup_field: pk})
+        except (queryset.model.DoesNotExist, ValueError):
+            raise exceptions.NotFound()
+        return await sync_to_async(self.serialize)(viewset, instance)
+
+    async def list(self, viewset):
+        request = viewset.request
+        paginator = viewset.paginator
+        queryset = await sync_to_async(self.filtered_queryset)(viewset)
+        if isinstance(paginator, SelectablePagination) and paginator.use_keyset(request):
+            page = await sync_to_async(paginator.paginate_queryset)(queryset, request, viewset)
+            return {
+                "next": paginator.keyset.get_next_link(),
+                "results": await sync_to_async(self.serialize)(viewset, page, many=True),
+            }
+        page_size = paginator.get_page_size(request)
+
+        count = await queryset.acount()
+        num_pages = max(1, -(-count // page_size))
+        try:
+            page_number = int(request.query_params.get(paginator.page_query_param) or 1)
+        except ValueError:
+            raise exceptions.NotFound(paginator.invalid_page_message)
+        if page_number < 1 or page_number > num_pages:
+            raise exceptions.NotFound(paginator.invalid_page_message)
+
+        offset = (page_number - 1) * page_size
+        page = [obj async for obj in queryset[offset:offset + page_size]]
+
+        url = request.build_absolute_uri()
+        previous_link = None
+        if page_number > 1:
+            previous_link = (
+                remove_query_param(url, paginator.page_query_param) if page_number == 2
+                else replace_query_param(url, paginator.page_query_param, page_number - 1)
+            )
+        next_link = None
+        if page_number < num_pages:
+            next_link = replace_query_param(url, paginator.page_query_param, page_number + 1)
+
+        return {
+            "count": count,
+            "next": next_link,
+            "previous": previous_link,
+            "results": await sync_to_async(self.serialize)(viewset, page, many=True),
+        }
+
+
+class AsyncUserProfileView(AsyncReadOnlyView):
+    """Async list/retrieve for UserProfile."""
+    viewset_class = UserProfileViewSet
+
+
+class AsyncCityView(AsyncReadOnlyView):
+    """Async list/retrieve for City."""
+    viewset_class = CityViewSet
+
+
+class AsyncJobTitleHistoryView(AsyncReadOnlyView):
+    """Async list/retrieve for JobTitleHistory."""
+    viewset_class = JobTitleHistoryViewSet
+
+
+class AsyncSalaryHistoryView(AsyncReadOnlyView):
+    """Async list/retrieve for SalaryHistory."""
+    viewset_class = SalaryHistoryViewSet
@@ -0,0 +1,111 @@
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+import jwt
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from .models import BlacklistedAccessToken
+
+
+def token_digest(token):
+    """Fixed-size SHA-256 digest of a raw JWT"""
+    if isinstance(token, bytes):
+        token = token.decode()
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def token_expiry(token):
+    """Read the exp claim of a token without verifying it, None if unreadable"""
+    try:
+        exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+    except jwt.PyJWTError:
+        return None
+    return datetime.fromtimestamp(exp, tz=dt_timezone.utc) if exp else None
+
+
+class RevocationList:
+    """
+    In-process set of revoked access-token digests.
+    New blacklist rows are pulled from the database at most every
+    refresh_interval seconds and the whole set is reloaded every reload_interval
+    seconds. Each refresh reads the rows created since the previous one, less
+    overlap seconds, so rows committed late by a slow transaction (or stamped by
+    a lagging clock) are still picked up; ids are not used as they can commit out
+    of order. Entries are dropped once their token expires, so the set never
+    holds more than the currently valid revoked tokens.
+    """
+    def __init__(self, refresh_interval=None, reload_interval=None, overlap=None):
+        self.refresh_interval = refresh_interval or getattr(
+            settings, "ACCOUNTS_REVOCATION_REFRESH_SECONDS", 10
+        )
+        self.reload_interval = reload_interval or self.refresh_interval * 30
+        self.overlap = timedelta(seconds=overlap or getattr(
+            settings, "ACCOUNTS_REVOCATION_OVERLAP_SECONDS", 60
+        ))
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self._entries = {}  # digest -> exp timestamp
+        self._since = None  # created_at watermark of the next refresh
+        self._refreshed_at = 0
+        self._reloaded_at = 0
+
+    def add(self, digest, expires_at):
+        """Revoke a token digest in this process immediately"""
+        self._entries[digest] = expires_at.timestamp()
+
+    def _load(self, rows):
+        for digest, expires_at in rows:
+            self.add(digest, expires_at)
+
+    def _prune(self, now):
+        self._entries = {
+            digest: expires for digest, expires in self._entries.items() if expires > now
+        }
+
+    def refresh(self, force=False):
+        now = time.time()
+        if not force and now - self._refreshed_at < self.refresh_interval:
+            return
+        with self._lock:
+            if not force and now - self._refreshed_at < self.refresh_interval:
+                return
+            if force or now - self._reloaded_at >= self.reload_interval:
+                self.clear()
+                self._reloaded_at = now
+            started = timezone.now()
+            rows = BlacklistedAccessToken.objects.filter(expires_at__gt=started)
+            if self._since is not None:
+                rows = rows.filter(created_at__gte=self._since - self.overlap)
+            self._load(rows.values_list("digest", "expires_at"))
+            self._since = started
+            self._prune(now)
+            self._refreshed_at = now
+
+    def is_revoked(self, token):
+        self.refresh()
+        expires = self._entries.get(token_digest(token))
+        return expires is not None and expires > time.time()
+
+
+revoked_tokens = RevocationList()
+
+
+class RevocationJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that also rejects blacklisted access tokens.
+    The check runs against the in-process RevocationList, so non-revoked tokens
+    do not cost a database round-trip.
+    """
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        if revoked_tokens.is_revoked(raw_token):
+            raise InvalidToken("Token is blacklisted")
+        return validated_token
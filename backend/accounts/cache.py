@@ -0,0 +1,189 @@
+import hashlib
+import math
+import time
+from datetime import date, datetime, timezone
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+VERSION_KEY = "accounts:version:{label}"
+MODIFIED_KEY = "accounts:modified:{label}"
+RESPONSE_KEY = "accounts:response:{basename}:{action}:{versions}:{request}"
+
+
+def new_version():
+    """
+    Starting version of a collection whose counter is missing.
+    Counters can be evicted or flushed; starting over from the clock instead of 1
+    keeps a restarted counter from reaching versions already handed out.
+    """
+    return time.time_ns()
+
+
+def collection_version(model):
+    """Current version of a model's collection, bumped on every write"""
+    return cache.get_or_set(VERSION_KEY.format(label=model._meta.label_lower), new_version, None)
+
+
+def collection_state(models):
+    """(versions, last modified timestamp) of several collections, in one cache round trip"""
+    labels = [model._meta.label_lower for model in models]
+    now = time.time()
+    version = new_version()
+    defaults = {
+        **{VERSION_KEY.format(label=label): version for label in labels},
+        # Unknown modification times count as now, so nothing is reported unmodified
+        **{MODIFIED_KEY.format(label=label): now for label in labels},
+    }
+    found = cache.get_many(list(defaults))
+    for key, value in defaults.items():
+        if key not in found:
+            cache.add(key, value, None)
+            found[key] = cache.get(key, value)
+    versions = [found[VERSION_KEY.format(label=label)] for label in labels]
+    modified = max(found[MODIFIED_KEY.format(label=label)] for label in labels)
+    return versions, modified
+
+
+def current_days():
+    """
+    (today's dates, start of the later one as a timestamp), on the local clock of
+    UserProfile.age and the UTC clock of years of service.
+    """
+    local, utc = date.today(), datetime.now(timezone.utc).date()
+    started = max(
+        datetime.combine(local, datetime.min.time()).timestamp(),
+        datetime.combine(utc, datetime.min.time(), tzinfo=timezone.utc).timestamp(),
+    )
+    return f"{local}:{utc}", started
+
+
+def _bump(model):
+    label = model._meta.label_lower
+    key = VERSION_KEY.format(label=label)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, new_version(), None)
+    cache.set(MODIFIED_KEY.format(label=label), time.time(), None)
+
+
+def bump_collection_version(model):
+    """
+    Invalidate everything cached for a model by moving it to a new version.
+    Inside a transaction this happens on commit, so the new version is never
+    served with the rows from before the write.
+    """
+    transaction.on_commit(partial(_bump, model))
+
+
+class CollectionMixin:
+    """Viewset whose responses depend on its model's collection and on cache_dependencies"""
+    cache_dependencies = ()
+
+    def get_cache_models(self):
+        return [self.queryset.model, *self.cache_dependencies]
+
+
+class CachedResponseMixin(CollectionMixin):
+    """
+    Cache list/retrieve responses of a viewset.
+    Responses are keyed on the full request URL (query params and pagination) and
+    on the collection version of the viewset's model and its cache_dependencies,
+    so a post_save/post_delete on any of them makes the cached entries unreachable.
+    """
+    cache_timeout = 60 * 15
+
+    def get_cache_key(self, request):
+        versions = "-".join(str(collection_version(model)) for model in self.get_cache_models())
+        params = sorted(request.query_params.lists())
+        url = f"{request.build_absolute_uri(request.path)}?{params}"
+        return RESPONSE_KEY.format(
+            basename=self.basename,
+            action=self.action,
+            versions=versions,
+            request=hashlib.md5(url.encode()).hexdigest(),
+        )
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        key = self.get_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, self.cache_timeout)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
+
+
+class ConditionalResponseMixin(CollectionMixin):
+    """
+    Conditional GET for list/retrieve.
+    The ETag and Last-Modified come from the collection versions of the viewset's
+    model and its cache_dependencies, so a matching If-None-Match or
+    If-Modified-Since is answered with 304 before any query or serializer runs.
+    Requests using conditional_exempt_params (data that is not versioned) are
+    always served in full. Responses of a date_dependent viewset (values computed
+    from today's date) also change validators when the day changes.
+    """
+    conditional_exempt_params = ()
+    date_dependent = False
+
+    def get_etag(self, request, versions):
+        params = sorted(request.query_params.lists())
+        key = (
+            f"{self.basename}:{self.action}:{versions}:{request.user.pk}:"
+            f"{request.accepted_renderer.format}:{request.path}?{params}"
+        )
+        return f'W/"{hashlib.md5(key.encode()).hexdigest()}"'
+
+    def get_validators(self, request):
+        """(ETag, Last-Modified timestamp) of the response, None if request is exempt"""
+        if any(param in request.query_params for param in self.conditional_exempt_params):
+            return None
+        versions, modified = collection_state(self.get_cache_models())
+        if self.date_dependent:
+            days, started = current_days()
+            versions = [*versions, days]
+            modified = max(modified, started)
+        return self.get_etag(request, versions), math.ceil(modified)
+
+    @staticmethod
+    def not_modified(request, validators):
+        """The 304 (or 412) response for request if its validators still match, else None"""
+        etag, last_modified = validators
+        return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+    @staticmethod
+    def set_validators(response, validators):
+        if response.status_code in (200, 304):
+            etag, last_modified = validators
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(last_modified)
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def conditional_response(self, request, handler, *args, **kwargs):
+        validators = self.get_validators(request)
+        if validators is None:
+            return handler(request, *args, **kwargs)
+        response = self.not_modified(request, validators)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        return self.set_validators(response, validators)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().retrieve, *args, **kwargs)
@@ -1,5 +1,36 @@
+import json
+
 import django_filters
-from .models import UserProfile
+from django.db.models import BooleanField, Func
+
+from .models import Deduction, PayrollRollup, UserProfile
+from .presence import presence
+
+
+class ContainedIn(Func):
+    """
+    Whether an expression is one of values, with the values bound as a single
+    parameter (a PostgreSQL array, a JSON list on SQLite). The statement stays
+    the same size however many values there are, unlike an IN list.
+    """
+    output_field = BooleanField()
+
+    def __init__(self, expression, values):
+        super().__init__(expression)
+        self.values = list(values)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.get_source_expressions()[0])
+        placeholders = ", ".join(["%s"] * len(self.values))
+        return f"{sql} IN ({placeholders})", (*params, *self.values)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.get_source_expressions()[0])
+        return f"{sql} = ANY(%s)", (*params, self.values)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.get_source_expressions()[0])
+        return f"{sql} IN (SELECT value FROM json_each(%s))", (*params, json.dumps(self.values))
 
 
 class UserProfileFilter(django_filters.FilterSet):
@@ -11,8 +42,10 @@ class UserProfileFilter(django_filters.FilterSet):
     first_name = django_filters.CharFilter(field_name='user__first_name', lookup_expr='icontains')
     last_name = django_filters.CharFilter(field_name='user__last_name', lookup_expr='icontains')
     job_title = django_filters.CharFilter(field_name='job_title__name', lookup_expr='icontains')  # Filter by job title
-    country = django_filters.CharFilter(field_name='city__governorate__country__name', lookup_expr='icontains')  # Filter by country
-    governorate = django_filters.CharFilter(field_name='city__governorate__name', lookup_expr='icontains')  # Filter by governorate
+    country = django_filters.CharFilter(field_name='country__name', lookup_expr='icontains')  # Filter by country
+    governorate = django_filters.CharFilter(field_name='governorate__name', lookup_expr='icontains')  # Filter by governorate
+    country_id = django_filters.NumberFilter(field_name='country')  # Filter by country, without a join
+    governorate_id = django_filters.NumberFilter(field_name='governorate')  # Filter by governorate, without a join
     city = django_filters.CharFilter(field_name='city__name', lookup_expr='icontains')  # Filter by city
     
     # Date range filters
@@ -28,14 +61,47 @@ class UserProfileFilter(django_filters.FilterSet):
     # Gender filter
     gender = django_filters.ChoiceFilter(choices=UserProfile.GENDER_CHOICES)  # Assuming gender has predefined choices
     
-    # Online status filter
-    is_online = django_filters.BooleanFilter(field_name='user__logged_in_user__is_online')
+    # Online status filter, answered from the presence store
+    is_online = django_filters.BooleanFilter(method='filter_is_online')
     
     class Meta:
         model = UserProfile
         fields = [
             'user', 'email', 'first_name', 'last_name', 'job_title', 'country',
-            'governorate', 'city', 'gender', 'min_salary',
+            'governorate', 'country_id', 'governorate_id', 'city', 'gender', 'min_salary',
             'max_salary', 'start_date_after', 'start_date_before',
             'birth_date_after', 'birth_date_before', 'is_online'
         ]
+
+    def filter_is_online(self, queryset, name, value):
+        # Every online id is read from the store and sent as one parameter
+        ids = presence.online_ids()
+        if not ids:
+            return queryset.none() if value else queryset
+        online = ContainedIn('user_id', ids)
+        return queryset.filter(online) if value else queryset.exclude(online)
+
+
+class DeductionFilter(django_filters.FilterSet):
+    """
+    FilterSet for Deduction, used by the deduction list and the deduction summaries.
+    """
+    date_after = django_filters.DateTimeFilter(field_name='date', lookup_expr='gte')
+    date_before = django_filters.DateTimeFilter(field_name='date', lookup_expr='lte')
+
+    class Meta:
+        model = Deduction
+        fields = ['user_profile', 'date_after', 'date_before']
+
+
+class PayrollRollupFilter(django_filters.FilterSet):
+    """
+    FilterSet for PayrollRollup, e.g. ?period=2024-05-01 for a month-end report.
+    """
+    user = django_filters.CharFilter(field_name='user_profile__user__username', lookup_expr='icontains')
+    period_after = django_filters.DateFilter(field_name='period', lookup_expr='gte')
+    period_before = django_filters.DateFilter(field_name='period', lookup_expr='lte')
+
+    class Meta:
+        model = PayrollRollup
+        fields = ['user_profile', 'user', 'period', 'period_after', 'period_before']
@@ -0,0 +1,202 @@
+import gzip
+import hashlib
+import json
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .cache import bump_collection_version, collection_state
+from .models import City, Country, Governorate, UserProfile
+
+GEOGRAPHY_MODELS = (Country, Governorate, City)
+DOCUMENT_KEY = "accounts:geography:{scope}:{versions}"
+# Documents of older versions are unreachable and left to expire
+DOCUMENT_TIMEOUT = 60 * 60 * 24
+
+
+class GeographyDocument:
+    """
+    One Country → Governorate → City tree, encoded once as JSON and gzip.
+    The ETag is a hash of the JSON, so it stays right even when the collection
+    versions start over after a cache flush.
+    """
+    def __init__(self, data):
+        self.body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+        self.gzipped = gzip.compress(self.body, mtime=0)
+        self.etag = f'W/"{hashlib.md5(self.body).hexdigest()}"'
+
+
+def nest(countries, governorates, cities):
+    """Nest governorate and city rows (values() dicts) under their parents"""
+    cities_of = defaultdict(list)
+    for city in cities:
+        cities_of[city.pop("governorate_id")].append(city)
+    governorates_of = defaultdict(list)
+    for governorate in governorates:
+        governorate["cities"] = cities_of[governorate["id"]]
+        governorates_of[governorate.pop("country_id")].append(governorate)
+    for country in countries:
+        country["governorates"] = governorates_of[country["id"]]
+    return countries
+
+
+def build(scope, pk=None):
+    """
+    The tree of scope ("all", "country" or "governorate" pk), or None when the
+    root does not exist. Governorates without a country and cities without a
+    governorate belong to no tree.
+    """
+    countries = Country.objects.order_by("name", "pk").values("id", "name")
+    governorates = Governorate.objects.order_by("name", "pk").values("id", "name", "country_id")
+    cities = City.objects.order_by("name", "pk").values("id", "name", "governorate_id")
+
+    if scope == "governorate":
+        governorates = list(governorates.filter(pk=pk))
+        if not governorates:
+            return None
+        cities = cities.filter(governorate_id=pk)
+        governorate = governorates[0]
+        governorate.pop("country_id")
+        governorate["cities"] = list(cities)
+        for city in governorate["cities"]:
+            city.pop("governorate_id")
+        return {"governorate": governorate}
+
+    if scope == "country":
+        countries = countries.filter(pk=pk)
+        governorates = governorates.filter(country_id=pk)
+        cities = cities.filter(governorate__country_id=pk)
+    else:
+        governorates = governorates.filter(country__isnull=False)
+        cities = cities.filter(governorate__country__isnull=False)
+
+    tree = nest(list(countries), governorates, cities)
+    if scope == "country":
+        return {"country": tree[0]} if tree else None
+    return {"countries": tree}
+
+
+def get_document(scope="all", pk=None):
+    """
+    The GeographyDocument of a tree, from the cache when it was built since the
+    last geography write. Writes to Country, Governorate or City move their
+    collection version, so the next request rebuilds the tree.
+    """
+    versions, _ = collection_state(GEOGRAPHY_MODELS)
+    key = DOCUMENT_KEY.format(
+        scope=scope if pk is None else f"{scope}:{pk}",
+        versions="-".join(map(str, versions)),
+    )
+    document = cache.get(key)
+    if document is None:
+        data = build(scope, pk)
+        if data is None:
+            return None
+        document = GeographyDocument(data)
+        cache.set(key, document, DOCUMENT_TIMEOUT)
+    return document
+
+
+# Denormalized profile keys
+# UserProfile.governorate and .country copy city.governorate and
+# city.governorate.country, so regional filters and headcounts need no joins.
+# The receivers in accounts.signals keep them in step; bulk writers call
+# assign_geography, and check_profile_geography reports any drift.
+
+def city_geography(city_ids):
+    """{city id: (governorate id, country id)} for the given cities, in one query"""
+    city_ids = [pk for pk in set(city_ids) if pk is not None]
+    if not city_ids:
+        return {}
+    return {
+        pk: (governorate_id, country_id)
+        for pk, governorate_id, country_id in City.objects.filter(pk__in=city_ids).values_list(
+            "pk", "governorate_id", "governorate__country_id"
+        )
+    }
+
+
+def assign_geography(profiles):
+    """Set the geography keys of profile instances about to be written from their cities"""
+    geography = city_geography(profile.city_id for profile in profiles)
+    for profile in profiles:
+        profile.governorate_id, profile.country_id = geography.get(profile.city_id, (None, None))
+
+
+def differs(field, value):
+    """Rows whose field is not value, NULLs included"""
+    return Q(**{f"{field}__isnull": False}) if value is None else ~Q(**{field: value})
+
+
+def update_profiles(profiles, **keys):
+    """Set keys on the profiles that do not have them yet, returning how many changed"""
+    stale = Q()
+    for field, value in keys.items():
+        stale |= differs(field, value)
+    count = profiles.filter(stale).update(**keys, updated_at=timezone.now())
+    if count:
+        bump_collection_version(UserProfile)
+    return count
+
+
+def sync_city_profiles(city):
+    """Move the profiles of a city along with its governorate"""
+    country_id = None
+    if city.governorate_id is not None:
+        country_id = Governorate.objects.filter(pk=city.governorate_id).values_list("country_id", flat=True).first()
+    return update_profiles(
+        UserProfile.objects.filter(city_id=city.pk),
+        governorate_id=city.governorate_id, country_id=country_id,
+    )
+
+
+def sync_governorate_profiles(governorate):
+    """Move the profiles of a governorate along with its country"""
+    return update_profiles(UserProfile.objects.filter(governorate_id=governorate.pk), country_id=governorate.country_id)
+
+
+def clear_city_geography(city):
+    """
+    Clear the keys of the profiles of a city, before a delete leaves them without
+    one. Cities without profiles, the usual case, cost a lookup and no write.
+    """
+    profiles = UserProfile.objects.filter(city_id=city.pk)
+    if not profiles.exists():
+        return 0
+    return update_profiles(profiles, governorate_id=None, country_id=None)
+
+
+def inconsistent_profiles():
+    """Profiles whose geography keys do not match their city"""
+    return UserProfile.objects.annotate(
+        expected_governorate=Coalesce("city__governorate_id", 0),
+        expected_country=Coalesce("city__governorate__country_id", 0),
+        actual_governorate=Coalesce("governorate_id", 0),
+        actual_country=Coalesce("country_id", 0),
+    ).exclude(
+        expected_governorate=F("actual_governorate"), expected_country=F("actual_country"),
+    )
+
+
+def backfill_geography(batch_size=500):
+    """Recompute the keys of the inconsistent profiles from their cities, returning how many changed"""
+    changed = 0
+    ids = list(inconsistent_profiles().order_by("pk").values_list("pk", flat=True))
+    for offset in range(0, len(ids), batch_size):
+        batch = ids[offset:offset + batch_size]
+        profiles = list(UserProfile.objects.filter(pk__in=batch).only("pk", "city_id", "governorate_id", "country_id"))
+        current = {profile.pk: (profile.governorate_id, profile.country_id) for profile in profiles}
+        assign_geography(profiles)
+        stale = [profile for profile in profiles if current[profile.pk] != (profile.governorate_id, profile.country_id)]
+        if stale:
+            now = timezone.now()
+            for profile in stale:
+                profile.updated_at = now
+            UserProfile.objects.bulk_update(stale, ["governorate", "country", "updated_at"], batch_size=batch_size)
+            changed += len(stale)
+    if changed:
+        bump_collection_version(UserProfile)
+    return changed
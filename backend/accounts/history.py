@@ -0,0 +1,175 @@
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .cache import bump_collection_version
+from .models import JobTitleHistory, SalaryHistory, UserProfile
+from .payroll import refresh_profile_rollups
+
+
+class ProfileHistoryTracker:
+    """
+    Diff-driven history engine for UserProfile.
+    Locks and loads the stored state of every tracked profile in one query, works
+    out which tracked fields changed and writes the JobTitleHistory/SalaryHistory
+    rows for the whole batch inside a single transaction. The lock keeps two
+    concurrent saves of a profile from both closing its current period.
+    """
+    tracked_fields = ("job_title_id", "salary", "start")
+
+    def __init__(self, profiles, previous=None):
+        self.profiles = [profile for profile in profiles if profile.pk]
+        # previous may be captured earlier, e.g. by a deferred receiver batch;
+        # otherwise it is read by lock()
+        self.previous = previous
+
+    def lock(self):
+        """
+        Lock the profile rows and read their stored values. Call it inside a
+        transaction and before the profiles are written; apply() does so itself
+        when nothing was read yet.
+        """
+        if not self.profiles:
+            self.previous = {}
+            return
+        rows = UserProfile.objects.select_for_update().filter(
+            pk__in=[profile.pk for profile in self.profiles]
+        ).order_by("pk").values("pk", *self.tracked_fields)
+        self.previous = {row.pop("pk"): row for row in rows}
+
+    @classmethod
+    def stored_values(cls, profiles):
+        """
+        The stored tracked values of profiles, keyed by pk, without a query for
+        the instances that remember them (see UserProfile.stored_values) and
+        with a single in_bulk() for the rest.
+        """
+        previous, missing = {}, []
+        for profile in profiles:
+            if not profile.pk:
+                continue
+            stored = profile.stored_values(cls.tracked_fields)
+            if stored is None:
+                missing.append(profile.pk)
+            else:
+                previous[profile.pk] = stored
+        if missing:
+            rows = UserProfile.objects.only(*cls.tracked_fields).in_bulk(missing)
+            previous.update({pk: row.stored_values(cls.tracked_fields) for pk, row in rows.items()})
+        return previous
+
+    def changed_fields(self, profile):
+        """Return the tracked fields whose value differs from the stored row"""
+        previous = self.previous.get(profile.pk)
+        if previous is None:
+            # Not stored yet, creation is handled by the post_save receivers
+            return set()
+        return {
+            field for field in self.tracked_fields
+            if getattr(profile, field) != previous[field]
+        }
+
+    def _changed(self, field):
+        return [
+            profile for profile in self.profiles
+            if field in self.changed_fields(profile)
+        ]
+
+    def has_changes(self):
+        return any(self.changed_fields(profile) for profile in self.profiles)
+
+    def apply(self, now=None):
+        """Write every pending history change in one transaction"""
+        with transaction.atomic():
+            if self.previous is None:
+                self.lock()
+            if not self.has_changes():
+                return
+            now = now or timezone.now()
+            moved = self._changed("start")
+            raised = self._changed("salary")
+            retitled = self._changed("job_title_id")
+            self._update_first_job_titles(moved, now)
+            self._rotate_job_titles(retitled, now)
+            self._rotate_salaries(raised, now)
+            self._update_first_salaries(moved, now)
+            # Bulk writes send no signals, move the history collections on here
+            if moved or retitled:
+                bump_collection_version(JobTitleHistory)
+            if moved or raised:
+                bump_collection_version(SalaryHistory)
+            if raised or moved:
+                # Bulk history writes send no signals, refresh the rollups here
+                refresh_profile_rollups({profile.pk for profile in raised + moved})
+
+    @staticmethod
+    def _bounds(model, profiles):
+        """Map profile pk to the (first, last) history pk of the given model"""
+        rows = (
+            model.objects.filter(user_profile__in=profiles)
+            .values("user_profile")
+            .annotate(first=Min("pk"), last=Max("pk"))
+        )
+        return {row["user_profile"]: (row["first"], row["last"]) for row in rows}
+
+    def _update_first_job_titles(self, profiles, now):
+        """
+        Move the first JobTitleHistory record to the new start date, filling in
+        the job title when the record was created without one.
+        """
+        if not profiles:
+            return
+        by_pk = {profile.pk: profile for profile in profiles}
+        first_ids = [first for first, _ in self._bounds(JobTitleHistory, profiles).values()]
+        records = list(JobTitleHistory.objects.filter(pk__in=first_ids))
+        for record in records:
+            profile = by_pk[record.user_profile_id]
+            if record.job_title_id is None:
+                record.job_title_id = profile.job_title_id
+            record.start = profile.start
+            record.updated_at = now
+        JobTitleHistory.objects.bulk_update(records, ["job_title", "start", "updated_at"])
+
+    def _rotate_job_titles(self, profiles, now):
+        """Close the current JobTitleHistory record and open one for the new title"""
+        if not profiles:
+            return
+        by_pk = {profile.pk: profile for profile in profiles}
+        last_ids = [last for _, last in self._bounds(JobTitleHistory, profiles).values()]
+        current = JobTitleHistory.objects.filter(pk__in=last_ids).values_list(
+            "pk", "user_profile", "job_title"
+        )
+        closed, opened = [], []
+        for pk, profile_pk, job_title_pk in current:
+            profile = by_pk[profile_pk]
+            if job_title_pk != profile.job_title_id:
+                closed.append(pk)
+                opened.append(JobTitleHistory(
+                    job_title_id=profile.job_title_id, user_profile=profile, start=now
+                ))
+        JobTitleHistory.objects.filter(pk__in=closed).update(end=now, updated_at=now)
+        JobTitleHistory.objects.bulk_create(opened)
+
+    def _rotate_salaries(self, profiles, now):
+        """Close the current SalaryHistory record and open one for the new amount"""
+        if not profiles:
+            return
+        last_ids = [last for _, last in self._bounds(SalaryHistory, profiles).values()]
+        SalaryHistory.objects.filter(pk__in=last_ids).update(end=now, updated_at=now)
+        SalaryHistory.objects.bulk_create([
+            SalaryHistory(user_profile=profile, amount=profile.salary, start=now)
+            for profile in profiles
+        ])
+
+    def _update_first_salaries(self, profiles, now):
+        """Move the first SalaryHistory record to the new start date"""
+        if not profiles:
+            return
+        by_pk = {profile.pk: profile for profile in profiles}
+        records = list(SalaryHistory.objects.filter(
+            pk__in=[first for first, _ in self._bounds(SalaryHistory, profiles).values()]
+        ))
+        for record in records:
+            record.start = by_pk[record.user_profile_id].start
+            record.updated_at = now
+        SalaryHistory.objects.bulk_update(records, ["start", "updated_at"])
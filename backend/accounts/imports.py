@@ -0,0 +1,281 @@
+import io
+from datetime import date, datetime, time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import connection, transaction
+from django.utils import timezone
+from import_export import fields, resources, widgets
+from import_export.formats import base_formats
+
+from .cache import bump_collection_version
+from .models import City, JobTitle, JobTitleHistory, SalaryHistory, UserProfile
+from .payroll import refresh_profile_rollups
+
+IMPORT_FORMATS = {
+    fmt().get_extension(): fmt for fmt in (base_formats.CSV, base_formats.XLSX, base_formats.JSON)
+}
+MAX_SALARY = 1000000
+
+
+class EmployeeResource(resources.Resource):
+    """
+    Columns accepted by the employee import.
+    Only the field widgets are used here, to parse cell values; rows are loaded by
+    EmployeeImporter rather than Resource.import_data, which saves them one by one.
+    job_title and city are given by name; governorate is optional and only picks
+    between cities that share a name.
+    """
+    username = fields.Field(widget=widgets.CharWidget())
+    email = fields.Field(widget=widgets.CharWidget())
+    first_name = fields.Field(widget=widgets.CharWidget())
+    last_name = fields.Field(widget=widgets.CharWidget())
+    password = fields.Field(widget=widgets.CharWidget())
+    job_title = fields.Field(widget=widgets.CharWidget())
+    city = fields.Field(widget=widgets.CharWidget())
+    governorate = fields.Field(widget=widgets.CharWidget())
+    date_of_birth = fields.Field(widget=widgets.DateWidget())
+    start = fields.Field(widget=widgets.DateWidget())
+    address = fields.Field(widget=widgets.CharWidget())
+    gender = fields.Field(widget=widgets.CharWidget())
+    salary = fields.Field(widget=widgets.IntegerWidget())
+
+
+def load_dataset(stream, extension):
+    """Read an uploaded CSV/XLSX/JSON file into a list of row dicts"""
+    fmt = IMPORT_FORMATS[extension]()
+    data = stream.read()
+    if not fmt.is_binary() and isinstance(data, bytes):
+        data = data.decode("utf-8-sig")
+    return fmt.create_dataset(data).dict
+
+
+def copy_value(value):
+    """Format a value for COPY ... WITH (FORMAT csv); an unquoted empty field is NULL"""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def insert_rows(model, field_names, rows, batch_size=1000):
+    """
+    Insert tuples of field values with one set-based statement per batch: COPY on
+    PostgreSQL, bulk_create elsewhere. Neither sends model signals, so the model's
+    collection version is bumped here.
+    """
+    if not rows:
+        return
+    bump_collection_version(model)
+    if connection.vendor != "postgresql":
+        model.objects.bulk_create(
+            [model(**dict(zip(field_names, row))) for row in rows], batch_size=batch_size
+        )
+        return
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(model._meta.get_field(name).column) for name in field_names)
+    sql = f"COPY {quote(model._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv)"
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(",".join(copy_value(value) for value in row) + "\n")
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        if hasattr(cursor, "copy_expert"):
+            cursor.copy_expert(sql, buffer)  # psycopg2
+        else:
+            with cursor.copy(sql) as copy:  # psycopg 3
+                copy.write(buffer.getvalue())
+
+
+def start_of_day(value):
+    """Aware datetime for a date, as assigning a date to a DateTimeField would give"""
+    return timezone.make_aware(datetime.combine(value, time.min)) if value else None
+
+
+class EmployeeImporter:
+    """
+    Bulk employee onboarding.
+    Rows are parsed with EmployeeResource into a staging list and validated as a
+    whole, with lookups and uniqueness checks done per batch instead of per row.
+    Nothing is written unless every row is valid. Users, profiles and their first
+    JobTitleHistory/SalaryHistory records are then loaded with set-based inserts,
+    which send no signals, so the work of create_user_profile and
+    create_job_title_history and the payroll rollup refresh is done here in bulk.
+    """
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.resource = EmployeeResource()
+        self.row_errors = {}
+
+    @property
+    def errors(self):
+        """Validation errors as [{"row": n, "errors": {field: [message]}}], by row"""
+        return [
+            {"row": number, "errors": errors}
+            for number, errors in sorted(self.row_errors.items())
+        ]
+
+    def run(self, rows, dry_run=False):
+        """Stage, validate and (unless dry_run) load the rows; returns the number of valid rows"""
+        staged = self.stage(rows)
+        self.validate(staged)
+        if self.row_errors:
+            return 0
+        if not dry_run:
+            self.load(staged)
+        return len(staged)
+
+    def add_error(self, row, field, message):
+        self.row_errors.setdefault(row["row"], {}).setdefault(field, []).append(message)
+
+    def resolve(self, row, field, value, pks, hint=""):
+        """Return the one pk a name matches, or record why it matches none or several"""
+        label = field.replace("_", " ")
+        if not value:
+            return None
+        if not pks:
+            self.add_error(row, field, f"Unknown {label} '{value}'.")
+            return None
+        if len(pks) > 1:
+            self.add_error(row, field, f"{label.capitalize()} '{value}' matches {len(pks)} records{hint}.")
+            return None
+        return pks[0]
+
+    def stage(self, rows):
+        """Parse each row through the resource widgets"""
+        import_fields = self.resource.get_import_fields()
+        staged = []
+        for number, raw in enumerate(rows, start=1):
+            data = {field.column_name: raw.get(field.column_name) for field in import_fields}
+            row = {"row": number}
+            for field in import_fields:
+                try:
+                    row[field.column_name] = field.clean(data)
+                except ValueError as exc:
+                    row[field.column_name] = None
+                    self.add_error(row, field.column_name, str(exc) or "Invalid value.")
+                except ArithmeticError:
+                    row[field.column_name] = None
+                    self.add_error(row, field.column_name, "Enter a whole number.")
+            for name in ("date_of_birth", "start"):
+                if isinstance(row[name], datetime):
+                    row[name] = row[name].date()
+            staged.append(row)
+        return staged
+
+    def validate(self, staged):
+        """Check the whole staging list, with set-based lookups"""
+        # Names are not unique: each maps to every row carrying it
+        job_titles = {}
+        for name, pk in JobTitle.objects.values_list("name", "pk"):
+            job_titles.setdefault(name, []).append(pk)
+        cities = {}
+        # City ids to the (governorate, country) ids their profiles copy
+        self.geography = {}
+        for name, pk, governorate, governorate_id, country_id in City.objects.values_list(
+            "name", "pk", "governorate__name", "governorate_id", "governorate__country_id"
+        ):
+            cities.setdefault(name, []).append((pk, governorate))
+            self.geography[pk] = (governorate_id, country_id)
+        username_validator = UnicodeUsernameValidator()
+        today = date.today()
+        seen = set()
+
+        for row in staged:
+            username = row["username"] = (row["username"] or "").strip()
+            if not username:
+                self.add_error(row, "username", "This field is required.")
+            elif len(username) > 150:
+                self.add_error(row, "username", "Ensure this field has no more than 150 characters.")
+            else:
+                try:
+                    username_validator(username)
+                except ValidationError as exc:
+                    self.add_error(row, "username", exc.messages[0])
+            if username and username in seen:
+                self.add_error(row, "username", "Duplicate username in the import.")
+            seen.add(username)
+
+            if row["email"]:
+                try:
+                    validate_email(row["email"])
+                except ValidationError as exc:
+                    self.add_error(row, "email", exc.messages[0])
+            title = row.pop("job_title") or None
+            row["job_title_id"] = self.resolve(row, "job_title", title, job_titles.get(title, []))
+            city = row.pop("city") or None
+            governorate = row.pop("governorate") or None
+            row["city_id"] = self.resolve(row, "city", city, [
+                pk for pk, name in cities.get(city, []) if not governorate or name == governorate
+            ], "" if governorate else "; add a governorate column")
+            row["gender"] = row["gender"] or "M"
+            if row["gender"] not in dict(UserProfile.GENDER_CHOICES):
+                self.add_error(row, "gender", "Gender must be M or F.")
+            if row["date_of_birth"] and row["date_of_birth"] > today:
+                self.add_error(row, "date_of_birth", "Date of birth cannot be in the future")
+            if row["salary"] is not None and not 0 <= row["salary"] <= MAX_SALARY:
+                self.add_error(row, "salary", "Salary must be between 0 and 1000000")
+
+        by_username = {row["username"]: row for row in staged if row["username"]}
+        usernames = list(by_username)
+        for offset in range(0, len(usernames), self.batch_size):
+            existing = User.objects.filter(
+                username__in=usernames[offset:offset + self.batch_size]
+            ).values_list("username", flat=True)
+            for username in existing:
+                self.add_error(by_username[username], "username", "A user with that username already exists.")
+
+    def load(self, staged):
+        with transaction.atomic():
+            for offset in range(0, len(staged), self.batch_size):
+                self.load_batch(staged[offset:offset + self.batch_size])
+
+    def load_batch(self, rows):
+        now = timezone.now()
+        insert_rows(User, (
+            "password", "username", "email", "first_name", "last_name",
+            "is_superuser", "is_staff", "is_active", "date_joined",
+        ), [(
+            # Rows without a password get an unusable one and go through password reset
+            make_password(row["password"] or None), row["username"], row["email"] or "",
+            row["first_name"] or "", row["last_name"] or "", False, False, True, now,
+        ) for row in rows], self.batch_size)
+        user_ids = dict(User.objects.filter(
+            username__in=[row["username"] for row in rows]
+        ).values_list("username", "pk"))
+
+        # What assign_profile_geography does for each new profile
+        insert_rows(UserProfile, (
+            "user_id", "job_title_id", "city_id", "governorate_id", "country_id",
+            "date_of_birth", "start", "address", "gender", "salary",
+        ), [(
+            user_ids[row["username"]], row["job_title_id"], row["city_id"],
+            *self.geography.get(row["city_id"], (None, None)),
+            row["date_of_birth"], row["start"], row["address"] or None,
+            row["gender"], row["salary"],
+        ) for row in rows], self.batch_size)
+        profile_ids = dict(UserProfile.objects.filter(
+            user_id__in=user_ids.values()
+        ).values_list("user_id", "pk"))
+        for row in rows:
+            row["profile_id"] = profile_ids[user_ids[row["username"]]]
+
+        # What create_job_title_history does for each new profile
+        insert_rows(JobTitleHistory, ("job_title_id", "user_profile_id", "start"), [
+            (row["job_title_id"], row["profile_id"], start_of_day(row["start"]))
+            for row in rows
+        ], self.batch_size)
+        salaried = [row for row in rows if row["salary"] is not None]
+        insert_rows(SalaryHistory, ("user_profile_id", "amount", "start"), [
+            (row["profile_id"], row["salary"], start_of_day(row["start"]))
+            for row in salaried
+        ], self.batch_size)
+        refresh_profile_rollups([row["profile_id"] for row in salaried])
@@ -0,0 +1,402 @@
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.backends.signals import connection_created
+from django.db.utils import ConnectionHandler
+from django.test import Client
+from django.utils import timezone
+
+from .cache import bump_collection_version
+from .imports import insert_rows, start_of_day
+from .models import (
+    City,
+    Country,
+    Deduction,
+    Governorate,
+    JobTitle,
+    JobTitleHistory,
+    SalaryHistory,
+    UserProfile,
+)
+from .payroll import rebuild_rollups
+
+DEDUCTION_NAMES = ["Insurance", "Tax", "Loan", "Absence", "Penalty", "Pension"]
+CONNECTION_MODES = ("none", "persistent", "pool")
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(0, -(-len(ordered) * pct // 100) - 1)]
+
+
+def timeline(rng, start, end, changes):
+    """changes + 1 consecutive periods covering start..end, as (start, end) datetimes"""
+    points = sorted(rng.uniform(0, 1) for _ in range(changes))
+    span = end - start
+    bounds = [start] + [start + span * point for point in points] + [None]
+    return list(zip(bounds, bounds[1:]))
+
+
+def generate_dataset(countries=5, governorates=6, cities=10, job_titles=20, users=1000,
+                     deductions=5000, changes=2, prefix="load", seed=0, batch_size=1000):
+    """
+    Generate a synthetic dataset with set-based inserts.
+    governorates and cities are per country and per governorate. Each user gets a
+    profile, changes job title and salary changes spread over their employment,
+    and deductions are spread over all users. Returns the number of rows per model.
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    now = timezone.now()
+
+    country_rows = Country.objects.bulk_create(
+        [Country(name=f"{prefix.title()} Country {i}") for i in range(countries)]
+    )
+    governorate_rows = Governorate.objects.bulk_create([
+        Governorate(name=f"{country.name} Governorate {i}", country=country)
+        for country in country_rows for i in range(governorates)
+    ])
+    city_rows = City.objects.bulk_create([
+        City(name=f"{governorate.name} City {i}", governorate=governorate)
+        for governorate in governorate_rows for i in range(cities)
+    ])
+    title_rows = JobTitle.objects.bulk_create(
+        [JobTitle(name=f"{prefix.title()} Title {i}") for i in range(job_titles)]
+    )
+    # Bulk inserts send no signals, so move the cached reference data on by hand
+    for model in (Country, Governorate, City, JobTitle):
+        bump_collection_version(model)
+    # (city, governorate, country) ids, the profile columns a city sets
+    city_keys = [(city.pk, city.governorate_id, city.governorate.country_id) for city in city_rows]
+    title_ids = [title.pk for title in title_rows]
+
+    password = make_password(None)
+    counts = defaultdict(int)
+    for offset in range(0, users, batch_size):
+        size = min(batch_size, users - offset)
+        names = [f"{prefix}{offset + i}" for i in range(size)]
+        with transaction.atomic():
+            insert_rows(User, (
+                "password", "username", "email", "first_name", "last_name",
+                "is_superuser", "is_staff", "is_active", "date_joined",
+            ), [
+                (password, name, f"{name}@example.com", f"First{offset + i}", f"Last{offset + i}",
+                 False, False, True, now)
+                for i, name in enumerate(names)
+            ], batch_size)
+            user_ids = dict(User.objects.filter(username__in=names).values_list("username", "pk"))
+
+            profiles = []
+            for name in names:
+                start = today - timedelta(days=rng.randint(30, 3650))
+                profiles.append({
+                    "user_id": user_ids[name],
+                    "start": start,
+                    "titles": [rng.choice(title_ids) for _ in range(changes + 1)],
+                    "salaries": sorted(rng.randrange(3000, 30000, 50) for _ in range(changes + 1)),
+                    "row": (
+                        *rng.choice(city_keys),
+                        today - timedelta(days=rng.randint(20 * 365, 60 * 365)),
+                        start,
+                        f"{rng.randint(1, 200)} {rng.choice(['Nile', 'Palm', 'Harbor', 'Market'])} Street",
+                        rng.choice("MF"),
+                    ),
+                })
+            insert_rows(UserProfile, (
+                "user_id", "job_title_id", "salary", "city_id", "governorate_id", "country_id",
+                "date_of_birth", "start", "address", "gender",
+            ), [
+                (p["user_id"], p["titles"][-1], p["salaries"][-1], *p["row"]) for p in profiles
+            ], batch_size)
+            profile_ids = dict(UserProfile.objects.filter(
+                user_id__in=user_ids.values()
+            ).values_list("user_id", "pk"))
+
+            title_history, salary_history = [], []
+            for p in profiles:
+                profile_id = profile_ids[p["user_id"]]
+                for periods, values, rows in (
+                    (timeline(rng, start_of_day(p["start"]), now, changes), p["titles"], title_history),
+                    (timeline(rng, start_of_day(p["start"]), now, changes), p["salaries"], salary_history),
+                ):
+                    rows.extend(
+                        (value, profile_id, start, end)
+                        for value, (start, end) in zip(values, periods)
+                    )
+            insert_rows(JobTitleHistory, ("job_title_id", "user_profile_id", "start", "end"),
+                        title_history, batch_size)
+            insert_rows(SalaryHistory, ("amount", "user_profile_id", "start", "end"),
+                        salary_history, batch_size)
+
+            share = deductions * (offset + size) // users - deductions * offset // users
+            batch_profiles = [(profile_ids[p["user_id"]], p["start"]) for p in profiles]
+            deduction_rows = []
+            for _ in range(share):
+                profile_id, start = rng.choice(batch_profiles)
+                moment = start_of_day(start) + (now - start_of_day(start)) * rng.random()
+                deduction_rows.append((
+                    profile_id, rng.choice(DEDUCTION_NAMES), Decimal(rng.randrange(1000, 50000)) / 100,
+                    "", moment,
+                ))
+            insert_rows(Deduction, ("user_profile_id", "name", "amount", "discription", "date"),
+                        deduction_rows, batch_size)
+
+        counts["users"] += size
+        counts["job title history"] += len(title_history)
+        counts["salary history"] += len(salary_history)
+        counts["deductions"] += len(deduction_rows)
+
+    rebuild_rollups()
+    return {
+        "countries": len(country_rows),
+        "governorates": len(governorate_rows),
+        "cities": len(city_rows),
+        "job titles": len(title_rows),
+        **counts,
+    }
+
+
+class LoadContext:
+    """Ids and names the request scenarios pick from"""
+    def __init__(self):
+        self.profile_ids = list(UserProfile.objects.values_list("pk", flat=True))
+        self.usernames = list(User.objects.values_list("username", flat=True)[:1000])
+        self.cities = list(City.objects.values_list("name", flat=True)[:1000])
+        self.job_titles = list(JobTitle.objects.values_list("name", flat=True))
+        self.pages = max(1, len(self.profile_ids) // 10)
+
+
+def scenario_list(rng, context):
+    return "get", f"/accounts/user-profiles/?page={rng.randint(1, min(context.pages, 50))}", None
+
+
+def scenario_search(rng, context):
+    term = rng.choice(context.usernames)[:4]
+    return "get", f"/accounts/user-profiles/?search={term}", None
+
+
+def scenario_filter(rng, context):
+    low = rng.randrange(3000, 20000, 1000)
+    params = [f"min_salary={low}", f"max_salary={low + 5000}", f"gender={rng.choice('MF')}"]
+    if context.job_titles:
+        params.append(f"job_title={rng.choice(context.job_titles)}")
+    return "get", "/accounts/user-profiles/?" + "&".join(rng.sample(params, 2)), None
+
+
+def scenario_detail(rng, context):
+    return "get", f"/accounts/user-profiles/{rng.choice(context.profile_ids)}/", None
+
+
+def scenario_history(rng, context):
+    path = rng.choice(["salary-history", "job-title-history"])
+    return "get", f"/accounts/{path}/?pagination=cursor", None
+
+
+def scenario_deductions(rng, context):
+    after = (date.today() - timedelta(days=rng.randint(30, 365))).isoformat()
+    return "get", f"/accounts/deduction/?date_after={after}&pagination=cursor", None
+
+
+def scenario_summary(rng, context):
+    ids = ",".join(str(pk) for pk in rng.sample(context.profile_ids, min(10, len(context.profile_ids))))
+    return "get", f"/accounts/user-profiles/deductions-summary/?ids={ids}", None
+
+
+def scenario_reference(rng, context):
+    return "get", f"/accounts/{rng.choice(['cities', 'country', 'governorate', 'job-title'])}/", None
+
+
+def scenario_update(rng, context):
+    body = {"salary": rng.randrange(3000, 30000, 50)}
+    return "patch", f"/accounts/user-profiles/{rng.choice(context.profile_ids)}/", body
+
+
+SCENARIOS = {
+    "list": scenario_list,
+    "search": scenario_search,
+    "filter": scenario_filter,
+    "detail": scenario_detail,
+    "history": scenario_history,
+    "deductions": scenario_deductions,
+    "summary": scenario_summary,
+    "reference": scenario_reference,
+    "update": scenario_update,
+}
+DEFAULT_MIX = "list=25,search=15,filter=15,detail=15,history=10,deductions=5,summary=5,reference=5,update=5"
+
+
+def parse_mix(mix):
+    """Parse 'list=30,search=10' into {scenario: weight}"""
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise ValueError(f"Unknown scenario '{name}', expected one of: {', '.join(SCENARIOS)}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+class InProcessTransport:
+    """Send requests through Django's request handler, without a server or network"""
+    def __init__(self, token):
+        self.client = Client(raise_request_exception=False, HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def request(self, method, path, body):
+        response = getattr(self.client, method)(
+            path, json.dumps(body) if body is not None else None, content_type="application/json"
+        )
+        if response.streaming:
+            b"".join(response.streaming_content)
+        return response.status_code
+
+
+class HTTPTransport:
+    """Send requests to a running server, e.g. http://localhost:8000"""
+    def __init__(self, token, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+
+    def request(self, method, path, body):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(
+            self.base_url + path, data=data, headers=self.headers, method=method.upper()
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as exc:
+            return exc.code
+
+
+def run_load(transport_factory, mix, requests=500, duration=None, concurrency=1, seed=0):
+    """
+    Replay a weighted mix of scenarios from concurrency threads until requests
+    have been sent or duration seconds have passed.
+    Returns ({scenario: [(seconds, status)]}, elapsed seconds).
+    """
+    context = LoadContext()
+    if not context.profile_ids:
+        raise ValueError("No profiles to load test against, run generate_dataset first")
+    weights = parse_mix(mix)
+    names, cumulative = list(weights), list(weights.values())
+    results = defaultdict(list)
+    lock = threading.Lock()
+    sent = [0]
+    limit = float("inf") if duration else requests
+    deadline = time.monotonic() + duration if duration else None
+
+    def next_request():
+        with lock:
+            if sent[0] >= limit or (deadline and time.monotonic() >= deadline):
+                return False
+            sent[0] += 1
+            return True
+
+    def worker(number):
+        rng = random.Random(seed + number)
+        transport = transport_factory()
+        while next_request():
+            name = rng.choices(names, cumulative)[0]
+            method, path, body = SCENARIOS[name](rng, context)
+            started = time.perf_counter()
+            try:
+                status = transport.request(method, path, body)
+            except Exception:
+                status = None
+            elapsed = time.perf_counter() - started
+            with lock:
+                results[name].append((elapsed, status))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def format_report(results, elapsed):
+    """Per-scenario RPS, errors and latency percentiles, as text lines"""
+    lines = [f"{'scenario':<12} {'requests':>8} {'errors':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"]
+    total = 0
+    for name, samples in sorted(results.items()):
+        total += len(samples)
+        timings = [seconds for seconds, _ in samples]
+        errors = sum(1 for _, status in samples if status is None or status >= 400)
+        p50, p95, p99 = (percentile(timings, pct) * 1000 for pct in (50, 95, 99))
+        lines.append(
+            f"{name:<12} {len(samples):>8} {errors:>6} {len(samples) / elapsed:>8.1f} "
+            f"{p50:>8.1f} {p95:>8.1f} {p99:>8.1f}"
+        )
+    lines.append(f"{'total':<12} {total:>8} {'':>6} {total / elapsed:>8.1f}")
+    return lines
+
+
+def connection_settings(database, mode, max_age=60):
+    """Copy of a DATABASES entry switched to a connection mode (see P_CONN_MODE)"""
+    options = dict(database.get("OPTIONS", {}))
+    pool = options.pop("pool", None) or True
+    if mode == "pool":
+        options["pool"] = pool
+    return {
+        **database,
+        "CONN_MAX_AGE": max_age if mode == "persistent" else 0,
+        "OPTIONS": options,
+    }
+
+
+def connection_overhead(database, mode, requests=200):
+    """
+    Time requests that each run one trivial query through Django's per-request
+    connection handling (close_old_connections on request start and finish), on a
+    private connection using the given mode. Returns (timings, connections opened).
+    """
+    alias = f"benchmark_{mode}"  # Pools are kept per alias
+    handler = ConnectionHandler({DEFAULT_DB_ALIAS: database, alias: connection_settings(database, mode)})
+    conn = handler[alias]
+    opened = []
+
+    def count(sender, connection, **kwargs):
+        if connection is conn:
+            opened.append(connection)
+
+    connection_created.connect(count)
+    timings = []
+    try:
+        for _ in range(requests):
+            started = time.perf_counter()
+            conn.close_if_unusable_or_obsolete()
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+            conn.close_if_unusable_or_obsolete()
+            timings.append(time.perf_counter() - started)
+    finally:
+        connection_created.disconnect(count)
+        conn.close()
+        if getattr(conn, "pool", None) is not None:
+            conn.close_pool()
+    return timings, len(opened)
+
+
+def format_connection_report(results):
+    """Per-mode connections opened and request latency, as text lines"""
+    lines = [f"{'mode':<12} {'requests':>8} {'connects':>8} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8}"]
+    for mode, (timings, opened) in results.items():
+        mean = sum(timings) / len(timings) * 1000
+        p50, p95 = (percentile(timings, pct) * 1000 for pct in (50, 95))
+        lines.append(f"{mode:<12} {len(timings):>8} {opened:>8} {mean:>8.2f} {p50:>8.2f} {p95:>8.2f}")
+    return lines
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from accounts.geography import backfill_geography
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the denormalized governorate and country of every profile whose "
+        "keys do not match its city, e.g. after bulk writes that bypassed the receivers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=500,
+            help="Number of profiles updated per statement.",
+        )
+
+    def handle(self, *args, batch_size, **options):
+        count = backfill_geography(batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f"Backfilled the geography keys of {count} profiles."))
@@ -0,0 +1,44 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from accounts.loadtest import (
+    CONNECTION_MODES,
+    connection_overhead,
+    format_connection_report,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the per-request connection overhead of each connection mode "
+        "(new connection per request, persistent, pooled) against the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Requests per mode.")
+        parser.add_argument(
+            "--modes", default=",".join(CONNECTION_MODES),
+            help="Comma separated modes to compare; pool needs PostgreSQL and psycopg[pool].",
+        )
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, requests, modes, database, **options):
+        modes = [mode for mode in modes.split(",") if mode]
+        unknown = set(modes) - set(CONNECTION_MODES)
+        if unknown:
+            raise CommandError(f"Unknown mode(s): {', '.join(sorted(unknown))}")
+
+        connection = connections[database]
+        results = {}
+        for mode in modes:
+            if mode == "pool" and connection.vendor != "postgresql":
+                self.stderr.write(f"pool: skipped, not supported on {connection.vendor}")
+                continue
+            try:
+                results[mode] = connection_overhead(connection.settings_dict, mode, requests)
+            except ImproperlyConfigured as exc:
+                self.stderr.write(f"{mode}: skipped, {exc}")
+        for line in format_connection_report(results):
+            self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f"Benchmarked {len(results)} connection mode(s)."))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.geography import inconsistent_profiles
+
+
+class Command(BaseCommand):
+    help = (
+        "Check that every profile's denormalized governorate and country match its "
+        "city. Fails listing the first mismatches; fix them with backfill_profile_geography."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit", type=int, default=20,
+            help="Number of inconsistent profiles listed.",
+        )
+
+    def handle(self, *args, limit, **options):
+        stale = inconsistent_profiles()
+        count = stale.count()
+        if count:
+            for pk, city_id, governorate_id, country_id in stale.order_by("pk").values_list(
+                "pk", "city_id", "governorate_id", "country_id"
+            )[:limit]:
+                self.stderr.write(
+                    f"Profile {pk}: city {city_id}, governorate {governorate_id}, country {country_id}"
+                )
+            raise CommandError(f"{count} profiles have geography keys that do not match their city.")
+        self.stdout.write(self.style.SUCCESS("Every profile's geography keys match its city."))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from accounts.presence import flush_presence
+
+
+class Command(BaseCommand):
+    help = (
+        "Write online presence back to LoggedInUser.is_online in batches. "
+        "Meant to be scheduled, e.g. every minute from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Number of users updated per statement.",
+        )
+
+    def handle(self, *args, batch_size, **options):
+        online = flush_presence(batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f"{online} users online."))
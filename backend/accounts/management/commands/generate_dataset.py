@@ -0,0 +1,48 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.loadtest import generate_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic dataset for load testing: countries, governorates, "
+        "cities, job titles, users with profiles, salary and job title history, and "
+        "deductions. Works on SQLite and PostgreSQL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--countries", type=int, default=5)
+        parser.add_argument("--governorates", type=int, default=6, help="Governorates per country.")
+        parser.add_argument("--cities", type=int, default=10, help="Cities per governorate.")
+        parser.add_argument("--job-titles", type=int, default=20)
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--deductions", type=int, default=5000, help="Deductions in total.")
+        parser.add_argument(
+            "--changes", type=int, default=2,
+            help="Job title and salary changes per user over their employment.",
+        )
+        parser.add_argument("--prefix", default="load", help="Username prefix of the generated users.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Number of users inserted per batch.",
+        )
+
+    def handle(self, *args, prefix, **options):
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(f"Users named {prefix}* already exist, pick another --prefix.")
+        counts = generate_dataset(
+            countries=options["countries"],
+            governorates=options["governorates"],
+            cities=options["cities"],
+            job_titles=options["job_titles"],
+            users=options["users"],
+            deductions=options["deductions"],
+            changes=options["changes"],
+            prefix=prefix,
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+        )
+        summary = ", ".join(f"{count} {name}" for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Generated {summary}."))
@@ -0,0 +1,40 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.imports import IMPORT_FORMATS, EmployeeImporter, load_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk import employees (User, UserProfile and their first history records) "
+        "from a CSV, XLSX or JSON file. Nothing is imported unless every row is valid."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, the format is taken from its extension.")
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Number of rows inserted per statement.",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Validate the file without importing it.",
+        )
+
+    def handle(self, *args, path, batch_size, dry_run, **options):
+        extension = os.path.splitext(path)[1].lstrip(".").lower()
+        if extension not in IMPORT_FORMATS:
+            raise CommandError(f"Unsupported file type, use one of: {', '.join(IMPORT_FORMATS)}")
+        with open(path, "rb") as stream:
+            rows = load_dataset(stream, extension)
+
+        importer = EmployeeImporter(batch_size=batch_size)
+        count = importer.run(rows, dry_run=dry_run)
+        if importer.errors:
+            for error in importer.errors:
+                for field, messages in error["errors"].items():
+                    self.stderr.write(f"Row {error['row']}, {field}: {' '.join(messages)}")
+            raise CommandError(f"{len(importer.errors)} invalid rows, nothing was imported.")
+        verb = "validated" if dry_run else "imported"
+        self.stdout.write(self.style.SUCCESS(f"{count} employees {verb}."))
@@ -0,0 +1,66 @@
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.loadtest import (
+    DEFAULT_MIX,
+    HTTPTransport,
+    InProcessTransport,
+    format_report,
+    run_load,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a weighted mix of API requests in process, or against a local server "
+        "with --url, and report RPS and p50/p95/p99 latency per scenario."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--mix", default=DEFAULT_MIX,
+            help=f"Scenario weights, default: {DEFAULT_MIX}",
+        )
+        parser.add_argument("--requests", type=int, default=500, help="Number of requests to send.")
+        parser.add_argument(
+            "--duration", type=float, default=None,
+            help="Run for this many seconds instead of a fixed number of requests.",
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=1,
+            help="Number of client threads. SQLite serializes writes, use PostgreSQL above 1.",
+        )
+        parser.add_argument("--url", default=None, help="Base URL of a running server, e.g. http://localhost:8000")
+        parser.add_argument(
+            "--username", default="loadtest",
+            help="User the requests authenticate as, created if missing.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, mix, requests, duration, concurrency, url, username, seed, **options):
+        user, _ = User.objects.get_or_create(
+            username=username, defaults={"password": make_password(None), "is_staff": True}
+        )
+        token = str(AccessToken.for_user(user))
+        if url:
+            def transport():
+                return HTTPTransport(token, url)
+        else:
+            def transport():
+                return InProcessTransport(token)
+
+        # The in-process client sends Host: testserver
+        with override_settings(ALLOWED_HOSTS=["*"]):
+            try:
+                results, elapsed = run_load(
+                    transport, mix, requests=requests, duration=duration,
+                    concurrency=concurrency, seed=seed,
+                )
+            except ValueError as exc:
+                raise CommandError(exc)
+        for line in format_report(results, elapsed):
+            self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f"Sent {sum(map(len, results.values()))} requests in {elapsed:.1f}s."))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.models import BlacklistedAccessToken, LoggedInUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete blacklisted access tokens past their expiry and clear expired "
+        "LoggedInUser tokens. Meant to be scheduled, e.g. hourly from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Number of rows deleted or updated per statement.",
+        )
+
+    def handle(self, *args, batch_size, **options):
+        now = timezone.now()
+        expired = BlacklistedAccessToken.objects.filter(expires_at__lte=now)
+        deleted = self.in_batches(expired, batch_size, lambda rows: rows.delete()[0])
+
+        stale = LoggedInUser.objects.filter(access_token_expires_at__lte=now)
+        cleared = self.in_batches(stale, batch_size, lambda rows: rows.update(
+            access_token_digest=None, access_token_expires_at=None
+        ))
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} expired blacklisted tokens, cleared {cleared} expired sessions."
+        ))
+
+    @staticmethod
+    def in_batches(queryset, batch_size, apply):
+        """Apply a delete/update to the queryset in chunks of primary keys"""
+        total = 0
+        while True:
+            ids = list(queryset.order_by("pk").values_list("pk", flat=True)[:batch_size])
+            if not ids:
+                return total
+            total += apply(queryset.model.objects.filter(pk__in=ids))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from accounts.payroll import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the PayrollRollup table from deductions and salary history."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=500,
+            help="Number of profiles recomputed per batch.",
+        )
+
+    def handle(self, *args, batch_size, **options):
+        count = rebuild_rollups(batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt payroll rollups for {count} profiles."))
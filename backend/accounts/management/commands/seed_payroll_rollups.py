@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from accounts.payroll import seed_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the missing PayrollRollup rows of every profile, up to the current month. "
+        "Schedule it daily, or at least at the start of each month."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=500,
+            help="Number of profiles checked per batch.",
+        )
+
+    def handle(self, *args, batch_size, **options):
+        count = seed_rollups(batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f"Created {count} payroll rollup rows."))
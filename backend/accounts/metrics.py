@@ -0,0 +1,231 @@
+import hmac
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from rest_framework import serializers
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 500, 1000)
+
+REGISTRY = []
+
+
+def escape(value):
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels) + "}"
+
+
+def format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    """
+    In-process metric with labels, exposed in the Prometheus text format.
+    Values live in the worker process that recorded them, so with several workers
+    each one reports its own series.
+    """
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        REGISTRY.append(self)
+
+    def key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self):
+        """(suffix, label pairs, value) for every series"""
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{format_labels(labels)} {format_number(value)}")
+        return "\n".join(lines)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then the sum
+                series = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds spent in the block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self.lock:
+            values = {key: list(series) for key, series in self.values.items()}
+        for key, series in sorted(values.items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), series):
+                cumulative += count
+                yield "_bucket", [*labels, ("le", format_number(float(bound)))], cumulative
+            yield "_sum", labels, series[-1]
+            yield "_count", labels, cumulative
+
+
+REQUEST_SECONDS = Histogram(
+    "accounts_http_request_duration_seconds", "Time to produce a response, by view.",
+    ["view", "method", "status"],
+)
+REQUEST_QUERIES = Histogram(
+    "accounts_http_request_db_queries", "Database queries per request, by view.",
+    ["view"], buckets=QUERY_BUCKETS,
+)
+REQUEST_DB_SECONDS = Histogram(
+    "accounts_http_request_db_seconds", "Time spent in database queries per request, by view.",
+    ["view"],
+)
+SERIALIZER_SECONDS = Histogram(
+    "accounts_serializer_seconds", "Time to serialize a payload (one object or one list), by serializer.",
+    ["serializer"],
+)
+RECEIVER_SECONDS = Histogram(
+    "accounts_signal_receiver_seconds", "Time spent in a signal receiver, by receiver.",
+    ["receiver"],
+)
+
+
+def timed(histogram, **labels):
+    """
+    Decorator observing the seconds each call takes. Without labels, the
+    histogram's first label is set to the function's qualified name.
+    """
+    def decorator(func):
+        observed = labels or {histogram.labelnames[0]: func.__qualname__}
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**observed):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class QueryStats:
+    """
+    connection.execute_wrapper counting the queries of a request and their time.
+    The EXPLAINs silk runs for profiled requests are left out.
+    """
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.startswith("EXPLAIN"):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """
+    Record the latency, query count and query time of every request, labelled with
+    the resolved URL name. Queries run while a streaming response is consumed
+    happen after the middleware returns and are not counted.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        start = time.perf_counter()
+        with connection.execute_wrapper(stats):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.view_name if match else "<unresolved>"
+        REQUEST_SECONDS.observe(elapsed, view=view, method=request.method, status=response.status_code)
+        REQUEST_QUERIES.observe(stats.count, view=view)
+        REQUEST_DB_SECONDS.observe(stats.seconds, view=view)
+        return response
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    """ListSerializer recording SERIALIZER_SECONDS under its child's name"""
+    @property
+    def data(self):
+        with SERIALIZER_SECONDS.time(serializer=type(self.child).__name__):
+            return super().data
+
+
+class TimedSerializerMixin:
+    """Record SERIALIZER_SECONDS each time the serializer's data is built"""
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        serializer = super().many_init(*args, **kwargs)
+        # Keep a custom Meta.list_serializer_class as it is
+        if type(serializer) is serializers.ListSerializer:
+            serializer.__class__ = TimedListSerializer
+        return serializer
+
+    @property
+    def data(self):
+        with SERIALIZER_SECONDS.time(serializer=type(self).__name__):
+            return super().data
+
+
+def render():
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+def authorized(request):
+    """Whether the request carries ACCOUNTS_METRICS_TOKEN, when one is set"""
+    token = getattr(settings, "ACCOUNTS_METRICS_TOKEN", "")
+    if not token:
+        return True
+    return hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}")
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint"""
+    if not authorized(request):
+        response = HttpResponse("Unauthorized", status=401, content_type="text/plain")
+        response["WWW-Authenticate"] = "Bearer"
+        return response
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
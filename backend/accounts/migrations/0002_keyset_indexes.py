@@ -0,0 +1,25 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deduction',
+            index=models.Index(fields=['date', 'id'], name='deduction_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='jobtitlehistory',
+            index=models.Index(fields=['start', 'id'], name='jobtitlehist_start_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salaryhistory',
+            index=models.Index(fields=['start', 'id'], name='salaryhist_start_id_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deduction',
+            index=models.Index(fields=['user_profile', 'date'], name='deduction_profile_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deduction',
+            index=models.Index(fields=['amount'], name='deduction_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='jobtitlehistory',
+            index=models.Index(fields=['user_profile', 'start'], name='jobtitlehist_profile_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loggedinuser',
+            index=models.Index(fields=['is_online'], name='loggedinuser_online_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salaryhistory',
+            index=models.Index(fields=['user_profile', 'start'], name='salaryhist_profile_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['salary'], name='userprofile_salary_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['start'], name='userprofile_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['date_of_birth'], name='userprofile_birth_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['gender'], name='userprofile_gender_idx'),
+        ),
+    ]
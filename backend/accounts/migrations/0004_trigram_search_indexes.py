@@ -0,0 +1,57 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:40
+
+from django.conf import settings
+from django.db import migrations
+
+# (index name, app label, model name, column) for every icontains search/filter
+TRIGRAM_INDEXES = [
+    ('accounts_user_username_trgm', 'auth', 'user', 'username'),
+    ('accounts_user_email_trgm', 'auth', 'user', 'email'),
+    ('accounts_user_first_name_trgm', 'auth', 'user', 'first_name'),
+    ('accounts_user_last_name_trgm', 'auth', 'user', 'last_name'),
+    ('accounts_profile_address_trgm', 'accounts', 'userprofile', 'address'),
+    ('accounts_jobtitle_name_trgm', 'accounts', 'jobtitle', 'name'),
+    ('accounts_country_name_trgm', 'accounts', 'country', 'name'),
+    ('accounts_governorate_name_trgm', 'accounts', 'governorate', 'name'),
+    ('accounts_city_name_trgm', 'accounts', 'city', 'name'),
+    ('accounts_deduction_name_trgm', 'accounts', 'deduction', 'name'),
+    ('accounts_deduction_desc_trgm', 'accounts', 'deduction', 'discription'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """Index UPPER(column) with gin_trgm_ops, the expression Django emits for icontains"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    quote = schema_editor.quote_name
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, app_label, model_name, column in TRIGRAM_INDEXES:
+        table = apps.get_model(app_label, model_name)._meta.db_table
+        schema_editor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {quote(name)} '
+            f'ON {quote(table)} USING gin (UPPER({quote(column)}::text) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, *_ in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'DROP INDEX CONCURRENTLY IF EXISTS {schema_editor.quote_name(name)}'
+        )
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0003_filter_and_ordering_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
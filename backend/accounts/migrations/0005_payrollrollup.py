@@ -0,0 +1,31 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_trigram_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateField()),
+                ('salary', models.PositiveIntegerField(null=True)),
+                ('total_deductions', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('deduction_count', models.PositiveIntegerField(default=0)),
+                ('net', models.DecimalField(decimal_places=2, max_digits=12, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user_profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.userprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['period', 'id'], name='payrollrollup_period_id_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user_profile', 'period'), name='payrollrollup_profile_period_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:32
+
+import hashlib
+from datetime import datetime, timezone
+
+import jwt
+from django.db import migrations, models
+
+
+def digest_and_expiry(token, fallback):
+    """SHA-256 digest and exp of a raw JWT; unreadable tokens expire at the fallback"""
+    digest = hashlib.sha256(token.encode()).hexdigest()
+    try:
+        exp = jwt.decode(token, options={'verify_signature': False}).get('exp')
+    except jwt.PyJWTError:
+        exp = None
+    expires_at = datetime.fromtimestamp(exp, tz=timezone.utc) if exp else fallback
+    return digest, expires_at
+
+
+def convert_tokens(apps, schema_editor, batch_size=1000):
+    BlacklistedAccessToken = apps.get_model('accounts', 'BlacklistedAccessToken')
+    LoggedInUser = apps.get_model('accounts', 'LoggedInUser')
+
+    batch = []
+    for row in BlacklistedAccessToken.objects.only('token', 'created_at').iterator(chunk_size=batch_size):
+        row.digest, row.expires_at = digest_and_expiry(row.token, row.created_at)
+        batch.append(row)
+        if len(batch) >= batch_size:
+            BlacklistedAccessToken.objects.bulk_update(batch, ['digest', 'expires_at'])
+            batch = []
+    BlacklistedAccessToken.objects.bulk_update(batch, ['digest', 'expires_at'])
+
+    batch = []
+    for row in LoggedInUser.objects.exclude(access_token=None).exclude(access_token='').only('access_token').iterator(chunk_size=batch_size):
+        row.access_token_digest, row.access_token_expires_at = digest_and_expiry(row.access_token, None)
+        batch.append(row)
+        if len(batch) >= batch_size:
+            LoggedInUser.objects.bulk_update(batch, ['access_token_digest', 'access_token_expires_at'])
+            batch = []
+    LoggedInUser.objects.bulk_update(batch, ['access_token_digest', 'access_token_expires_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_payrollrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blacklistedaccesstoken',
+            name='digest',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='blacklistedaccesstoken',
+            name='expires_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='loggedinuser',
+            name='access_token_digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='loggedinuser',
+            name='access_token_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(convert_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Kept apart from 0006 so the schema changes don't share a transaction with the data migration
+    dependencies = [
+        ('accounts', '0006_token_digests'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='blacklistedaccesstoken',
+            name='token',
+        ),
+        migrations.RemoveField(
+            model_name='loggedinuser',
+            name='access_token',
+        ),
+        migrations.AlterField(
+            model_name='blacklistedaccesstoken',
+            name='digest',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='blacklistedaccesstoken',
+            name='expires_at',
+            field=models.DateTimeField(),
+        ),
+        migrations.AddIndex(
+            model_name='blacklistedaccesstoken',
+            index=models.Index(fields=['expires_at'], name='blacklist_expires_at_idx'),
+        ),
+    ]
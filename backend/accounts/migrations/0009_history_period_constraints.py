@@ -0,0 +1,82 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:20
+
+from itertools import groupby
+
+from django.db import migrations
+
+# Must match accounts.temporal.PERIOD_SQL, the expression EffectiveAt compares against
+PERIOD_SQL = "tstzrange({start}, CASE WHEN {end} < {start} THEN {start} ELSE {end} END, '[)')"
+
+# (constraint name, model name) of every per-profile history table
+PERIOD_CONSTRAINTS = [
+    ('jobtitlehist_no_overlap', 'jobtitlehistory'),
+    ('salaryhist_no_overlap', 'salaryhistory'),
+]
+
+
+def close_overlapping_periods(model, batch_size=500):
+    """
+    Make the history rows of model fit the no-overlap constraint, per profile.
+    Only a profile's first row (lowest pk) may keep an open start; later rows
+    without one start at their end, or at their last write when they have no end
+    either. Then, in (start, pk) order, each row is closed where the next begins.
+    Returns how many rows changed.
+    """
+    changed = []
+    rows = model.objects.filter(user_profile__isnull=False).order_by('user_profile_id', 'pk')
+    for _, periods in groupby(rows.iterator(chunk_size=batch_size), key=lambda row: row.user_profile_id):
+        periods = list(periods)
+        touched = set()
+        for row in periods[1:]:
+            if row.start is None:
+                row.start = row.end or row.updated_at
+                touched.add(row)
+        periods.sort(key=lambda row: (row.start is not None, row.start, row.pk))
+        for previous, row in zip(periods, periods[1:]):
+            if previous.end is None or previous.end > row.start:
+                previous.end = row.start
+                touched.add(previous)
+        changed.extend(touched)
+    model.objects.bulk_update(changed, ['start', 'end'], batch_size=batch_size)
+    return len(changed)
+
+
+def add_period_constraints(apps, schema_editor):
+    """
+    Forbid overlapping periods per profile. The exclusion constraint's GiST index
+    on (user_profile_id, period) also serves the ?as_of= containment lookups.
+    Existing rows are fixed up first, or adding the constraint would fail.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    quote = schema_editor.quote_name
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    period = PERIOD_SQL.format(start=quote('start'), end=quote('end'))
+    for name, model_name in PERIOD_CONSTRAINTS:
+        model = apps.get_model('accounts', model_name)
+        close_overlapping_periods(model)
+        table = model._meta.db_table
+        schema_editor.execute(
+            f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} '
+            f'EXCLUDE USING gist ({quote("user_profile_id")} WITH =, ({period}) WITH &&)'
+        )
+
+
+def drop_period_constraints(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    quote = schema_editor.quote_name
+    for name, model_name in PERIOD_CONSTRAINTS:
+        table = apps.get_model('accounts', model_name)._meta.db_table
+        schema_editor.execute(f'ALTER TABLE {quote(table)} DROP CONSTRAINT IF EXISTS {quote(name)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_period_constraints, drop_period_constraints),
+    ]
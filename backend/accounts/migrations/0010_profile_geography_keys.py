@@ -0,0 +1,37 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_geography_keys(apps, schema_editor):
+    """Copy every profile's governorate and country from its city, in one statement"""
+    City = apps.get_model('accounts', 'City')
+    UserProfile = apps.get_model('accounts', 'UserProfile')
+    city = City.objects.filter(pk=OuterRef('city_id'))
+    UserProfile.objects.update(
+        governorate_id=Subquery(city.values('governorate_id')[:1]),
+        country_id=Subquery(city.values('governorate__country_id')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_history_period_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='country',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='accounts.country'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='governorate',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='accounts.governorate'),
+        ),
+        migrations.RunPython(fill_geography_keys, migrations.RunPython.noop),
+    ]
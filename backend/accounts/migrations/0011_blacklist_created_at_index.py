@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_profile_geography_keys'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='blacklistedaccesstoken',
+            index=models.Index(fields=['created_at'], name='blacklist_created_at_idx'),
+        ),
+    ]
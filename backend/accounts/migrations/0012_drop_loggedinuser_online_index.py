@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:52
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_blacklist_created_at_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='loggedinuser',
+            name='loggedinuser_online_idx',
+        ),
+    ]
@@ -3,12 +3,54 @@ from datetime import date
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Now
+
+
+class StoredValuesMixin:
+    """
+    Remember the stored values of remembered_fields, as of the last load, save or
+    refresh, so receivers can tell what a save changes without reading the row.
+    """
+    remembered_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember()
+        return instance
+
+    def _remember(self, fields=None):
+        """Note the loaded values of the remembered fields (of fields only, if given) as stored"""
+        if fields is None:
+            self._stored = {}
+        else:
+            fields = {self._meta.get_field(name).attname for name in fields}
+        self._stored = {**getattr(self, "_stored", {}), **{
+            field: self.__dict__[field] for field in self.remembered_fields
+            if field in self.__dict__ and (fields is None or field in fields)
+        }}
+
+    def stored_values(self, fields):
+        """The stored values of the given remembered fields, or None when some were not loaded"""
+        stored = getattr(self, "_stored", {})
+        if not self.pk or not set(fields) <= stored.keys():
+            return None
+        return {field: stored[field] for field in fields}
+
+    def save(self, *args, update_fields=None, **kwargs):
+        super().save(*args, update_fields=update_fields, **kwargs)
+        self._remember(update_fields)
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._remember(fields)
 
 
 class JobTitle(models.Model):
     """Model to represent job titles."""
     name = models.CharField(max_length=255)
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now())
 
     def __str__(self):
         return self.name
@@ -17,30 +59,37 @@ class JobTitle(models.Model):
 class Country(models.Model):
     """Model to represent job country."""
     name = models.CharField(max_length=255)
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now())
 
     def __str__(self):
         return self.name
 
 
-class Governorate(models.Model):
+class Governorate(StoredValuesMixin, models.Model):
     """Model to represent job governorate within a country."""
     country = models.ForeignKey(Country, on_delete=models.CASCADE, null=True)
     name = models.CharField(max_length=255)
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now())
+
+    remembered_fields = ("country_id",)
 
     def __str__(self):
         return self.name
 
 
-class City(models.Model):
+class City(StoredValuesMixin, models.Model):
     """Model to represent job city within a governorate."""
     governorate = models.ForeignKey(Governorate, on_delete=models.CASCADE, null=True)
     name = models.CharField(max_length=255)
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now())
+
+    remembered_fields = ("governorate_id",)
 
     def __str__(self):
         return self.name
 
 
-class UserProfile(models.Model):
+class UserProfile(StoredValuesMixin, models.Model):
     """Extended user profile to include additional user details."""
     GENDER_CHOICES = [
         ("M", "Male"),
@@ -50,15 +99,40 @@ class UserProfile(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     job_title = models.ForeignKey(JobTitle, on_delete=models.SET_NULL, null=True)
     city = models.ForeignKey(City, on_delete=models.SET_NULL, null=True)
+    # Copies of city.governorate and city.governorate.country, see accounts.geography
+    governorate = models.ForeignKey(Governorate, on_delete=models.SET_NULL, null=True, editable=False)
+    country = models.ForeignKey(Country, on_delete=models.SET_NULL, null=True, editable=False)
     date_of_birth = models.DateField(null=True)
     start = models.DateField(null=True)
     address = models.TextField(null=True)
     gender = models.CharField(max_length=1, choices=GENDER_CHOICES, default="M")
     salary = models.PositiveIntegerField(null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now())
+
+    class Meta:
+        indexes = [
+            # Range filters and ordering used by the profile list endpoint
+            models.Index(fields=['salary'], name='userprofile_salary_idx'),
+            models.Index(fields=['start'], name='userprofile_start_idx'),
+            models.Index(fields=['date_of_birth'], name='userprofile_birth_idx'),
+            models.Index(fields=['gender'], name='userprofile_gender_idx'),
+        ]
 
     def __str__(self):
         return self.user.username
 
+    # Stored values read by the history tracker and the geography receivers
+    remembered_fields = ("job_title_id", "salary", "start", "city_id")
+
+    def save(self, *args, update_fields=None, **kwargs):
+        # A partial save of the city also writes the geography keys derived from it
+        if update_fields is not None and not {"city", "city_id"}.isdisjoint(update_fields):
+            update_fields = {*update_fields, "governorate", "country"}
+        # The pre_save history receivers lock the row and write history; keep the
+        # lock until the row itself is written, and roll the history back with it
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, update_fields=update_fields, **kwargs)
+
     @property
     def age(self):
         """Calculate the user's age based on their date of birth."""
@@ -82,6 +156,15 @@ class JobTitleHistory(models.Model):
     user_profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, null=True)
     start = models.DateTimeField(null=True)
     end = models.DateTimeField(null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now())
+
+    class Meta:
+        indexes = [
+            # Keyset pagination on (start, id)
+            models.Index(fields=['start', 'id'], name='jobtitlehist_start_id_idx'),
+            # Per-profile history ordered by start
+            models.Index(fields=['user_profile', 'start'], name='jobtitlehist_profile_start_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user_profile} - {self.job_title}"
@@ -93,6 +176,15 @@ class SalaryHistory(models.Model):
     amount = models.PositiveIntegerField(null=True)
     start = models.DateTimeField(null=True)
     end = models.DateTimeField(null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now())
+
+    class Meta:
+        indexes = [
+            # Keyset pagination on (start, id)
+            models.Index(fields=['start', 'id'], name='salaryhist_start_id_idx'),
+            # Per-profile history ordered by start
+            models.Index(fields=['user_profile', 'start'], name='salaryhist_profile_start_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user_profile} - {self.amount}"
@@ -105,15 +197,51 @@ class Deduction(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     discription = models.TextField(default="")
     date = models.DateTimeField(null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now())
+
+    class Meta:
+        indexes = [
+            # Keyset pagination on (date, id), scanned backwards for -date
+            models.Index(fields=['date', 'id'], name='deduction_date_id_idx'),
+            # Per-profile deductions ordered by date
+            models.Index(fields=['user_profile', 'date'], name='deduction_profile_date_idx'),
+            models.Index(fields=['amount'], name='deduction_amount_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class PayrollRollup(models.Model):
+    """Denormalized monthly payroll figures for a user, kept up to date incrementally."""
+    user_profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE)
+    period = models.DateField()  # First day of the month
+    salary = models.PositiveIntegerField(null=True)
+    total_deductions = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    deduction_count = models.PositiveIntegerField(default=0)
+    net = models.DecimalField(max_digits=12, decimal_places=2, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user_profile', 'period'], name='payrollrollup_profile_period_uniq'
+            ),
+        ]
+        indexes = [
+            # Month-end reports page through a period with keyset pagination
+            models.Index(fields=['period', 'id'], name='payrollrollup_period_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_profile} - {self.period:%Y-%m}"
+
+
 class LoggedInUser(models.Model):
     """Track currently logged-in users and their access tokens."""
     user = models.OneToOneField(User, related_name="logged_in_user", on_delete=models.CASCADE)
-    access_token = models.CharField(max_length=512, null=True, blank=True)  # Store the JWT access token here
+    access_token_digest = models.CharField(max_length=64, null=True, blank=True)  # SHA-256 of the JWT access token
+    access_token_expires_at = models.DateTimeField(null=True, blank=True)
     is_online = models.BooleanField(default=False)
 
     def __str__(self):
@@ -121,7 +249,15 @@ class LoggedInUser(models.Model):
 
 
 class BlacklistedAccessToken(models.Model):
-    """Track blacklisted JWT tokens."""
-    token = models.TextField(unique=True)
+    """Track blacklisted JWT tokens by their SHA-256 digest."""
+    digest = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Purging expired tokens
+            models.Index(fields=['expires_at'], name='blacklist_expires_at_idx'),
+            # Incremental refreshes of the revocation list
+            models.Index(fields=['created_at'], name='blacklist_created_at_idx'),
+        ]
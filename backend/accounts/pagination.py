@@ -0,0 +1,163 @@
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    """
+    Standard pagination class for consistent pagination across viewsets
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over a (value, id) pair such as (start, id).
+    Each page is fetched with a WHERE on the last row of the previous page instead
+    of COUNT(*) + OFFSET, so deep pages cost the same as the first one.
+    Rows with a NULL value are paged as a phase of their own, by id alone: after
+    the other rows when ascending, before them when descending. Keeping NULLs out
+    of the value range lets the (value, id) index serve each phase as a range scan.
+    Only forward paging is supported.
+    """
+    cursor_query_param = 'cursor'
+    page_size = StandardResultsSetPagination.page_size
+    page_size_query_param = StandardResultsSetPagination.page_size_query_param
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering):
+        # ordering is ('field', 'id') or ('-field', '-id')
+        self.descending = ordering[0].startswith('-')
+        self.field = ordering[0].lstrip('-')
+
+    def get_phases(self):
+        """Whether each phase pages the NULL values, in paging order"""
+        # Match the NULL placement of a plain B-tree index
+        return (True, False) if self.descending else (False, True)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def encode_cursor(self, value, pk):
+        # isoformat() keeps microseconds, which DjangoJSONEncoder would truncate
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        payload = json.dumps([value, pk])
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            value = model._meta.get_field(self.field).to_python(value)
+            return value, int(pk)
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def phase_queryset(self, queryset, nulls, position=None):
+        """The rows of one phase, after position when the cursor is in it"""
+        prefix = '-' if self.descending else ''
+        after = 'lt' if self.descending else 'gt'
+        if nulls:
+            queryset = queryset.filter(**{f'{self.field}__isnull': True}).order_by(f'{prefix}id')
+            if position is not None:
+                queryset = queryset.filter(**{f'id__{after}': position[1]})
+            return queryset
+        queryset = queryset.filter(**{f'{self.field}__isnull': False}).order_by(f'{prefix}{self.field}', f'{prefix}id')
+        if position is not None:
+            return queryset.filter(self.seek(position))
+        return queryset
+
+    def seek(self, position):
+        """
+        Rows strictly after a non-NULL cursor position, as field >= value AND
+        (field > value OR id > pk): the leading bound gives the index a range to scan.
+        """
+        value, pk = position
+        bound = 'lte' if self.descending else 'gte'
+        after = 'lt' if self.descending else 'gt'
+        return Q(**{f'{self.field}__{bound}': value}) & (
+            Q(**{f'{self.field}__{after}': value}) | Q(**{f'id__{after}': pk})
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, queryset.model)
+        phases = self.get_phases()
+        if position is not None:
+            # Phases before the cursor's one are done
+            phases = phases[phases.index(position[0] is None):]
+
+        rows = []
+        for nulls in phases:
+            phase = self.phase_queryset(queryset, nulls, position)
+            rows.extend(phase[:page_size + 1 - len(rows)])
+            if len(rows) > page_size:
+                break
+            position = None
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        cursor = self.encode_cursor(getattr(self.last, self.field), self.last.pk)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+class SelectablePagination(StandardResultsSetPagination):
+    """
+    Page-number pagination that switches to keyset pagination per request.
+    Clients opt in with ?pagination=cursor (first page) or by following a
+    ?cursor= link; everyone else keeps page numbers.
+    The view declares the keyset through its keyset_ordering attribute, which
+    replaces the view's ordering, so ?ordering= is rejected in cursor mode.
+    """
+    mode_query_param = 'pagination'
+    keyset_mode = 'cursor'
+    keyset_ordering_message = 'Cursor pagination has a fixed ordering.'
+
+    def use_keyset(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == self.keyset_mode
+            or KeysetPagination.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.use_keyset(request):
+            if api_settings.ORDERING_PARAM in request.query_params:
+                raise ValidationError({api_settings.ORDERING_PARAM: self.keyset_ordering_message})
+            self.keyset = KeysetPagination(view.keyset_ordering)
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
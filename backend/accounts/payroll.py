@@ -0,0 +1,194 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, DateField, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .cache import bump_collection_version
+from .models import Deduction, PayrollRollup, SalaryHistory, UserProfile
+
+
+def month_start(value):
+    """Return the rollup period (first day of the month) of a date or datetime"""
+    if isinstance(value, datetime):
+        value = timezone.localtime(value) if timezone.is_aware(value) else value
+        value = value.date()
+    return value.replace(day=1)
+
+
+def next_month(period):
+    return (period + timedelta(days=32)).replace(day=1)
+
+
+def period_bound(period):
+    """Aware datetime at the start of a period, for filtering DateTimeFields"""
+    return timezone.make_aware(datetime.combine(period, time.min))
+
+
+def current_period():
+    return month_start(timezone.now())
+
+
+def effective_salary(history, period, fallback):
+    """
+    Salary in effect at the end of the period, given (start, amount) rows ordered
+    by start. Periods before the first recorded change use the earliest amount,
+    profiles without any history use the fallback.
+    """
+    if not history:
+        return fallback
+    end = period_bound(next_month(period))
+    amount = history[0][1]
+    for start, value in history:
+        if start >= end:
+            break
+        amount = value
+    return amount
+
+
+# Rollup rows
+# A profile has a row for every month from the month its user joined through the
+# current period, so month-end reports list every employee, plus a row for any
+# other month it has deductions in. Receivers keep the rows of changed months up
+# to date; the months that start without any activity are filled in by
+# seed_rollups (the seed_payroll_rollups command, scheduled daily or at least at
+# the start of each month). rebuild_rollups recreates the same rows from scratch.
+
+def seeded_periods(joined, until=None):
+    """Periods from the month of joined through until (the current period by default)"""
+    period, until = month_start(joined), until or current_period()
+    periods = []
+    while period <= until:
+        periods.append(period)
+        period = next_month(period)
+    return periods
+
+
+def seeded_keys(profile_ids):
+    """The (profile pk, period) keys the profiles always have a row for"""
+    until = current_period()
+    return {
+        (profile_id, period)
+        for profile_id, joined in UserProfile.objects.filter(pk__in=profile_ids).values_list('pk', 'user__date_joined')
+        for period in seeded_periods(joined, until)
+    }
+
+
+def refresh_rollups(keys):
+    """
+    Recompute the rollup rows for the given (profile pk, period) keys.
+    Deductions of exactly those profile months are aggregated in one query and
+    the rows are upserted. Months left without deductions outside the profile's
+    seeded periods lose their row, as rebuild_rollups would not create it.
+    """
+    keys = {(profile_id, period) for profile_id, period in keys if period is not None}
+    if not keys:
+        return
+    profile_ids = {profile_id for profile_id, _ in keys}
+    profiles_by_period = defaultdict(set)
+    for profile_id, period in keys:
+        profiles_by_period[period].add(profile_id)
+    # Only the requested months of each profile, not the whole span between them
+    requested = Q()
+    for period, period_profile_ids in profiles_by_period.items():
+        requested |= Q(
+            user_profile__in=period_profile_ids,
+            date__gte=period_bound(period),
+            date__lt=period_bound(next_month(period)),
+        )
+
+    totals = (
+        Deduction.objects.filter(requested)
+        .annotate(period=TruncMonth('date', output_field=DateField()))
+        .values('user_profile', 'period')
+        .annotate(total=Sum('amount'), count=Count('pk'))
+    )
+    totals = {(row['user_profile'], row['period']): row for row in totals}
+
+    salaries, joined = {}, {}
+    for profile_id, salary, date_joined in UserProfile.objects.filter(pk__in=profile_ids).values_list(
+        'pk', 'salary', 'user__date_joined'
+    ):
+        salaries[profile_id], joined[profile_id] = salary, month_start(date_joined)
+    until = current_period()
+    history = defaultdict(list)
+    for profile_id, start, amount in (
+        SalaryHistory.objects.filter(user_profile__in=profile_ids, start__isnull=False)
+        .order_by('start', 'pk')
+        .values_list('user_profile', 'start', 'amount')
+    ):
+        history[profile_id].append((start, amount))
+
+    rows, emptied = [], Q()
+    for profile_id, period in keys:
+        if profile_id not in salaries:
+            continue
+        if (profile_id, period) not in totals and not joined[profile_id] <= period <= until:
+            emptied |= Q(user_profile=profile_id, period=period)
+            continue
+        row = totals.get((profile_id, period), {})
+        total = row.get('total') or 0
+        salary = effective_salary(history[profile_id], period, salaries[profile_id])
+        rows.append(PayrollRollup(
+            user_profile_id=profile_id,
+            period=period,
+            salary=salary,
+            total_deductions=total,
+            deduction_count=row.get('count', 0),
+            net=None if salary is None else salary - total,
+        ))
+    PayrollRollup.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['user_profile', 'period'],
+        update_fields=['salary', 'total_deductions', 'deduction_count', 'net', 'updated_at'],
+    )
+    if emptied:
+        PayrollRollup.objects.filter(emptied).delete()
+    bump_collection_version(PayrollRollup)
+
+
+def refresh_profile_rollups(profile_ids):
+    """Recompute every rollup row of the profiles, e.g. after a salary change"""
+    period = current_period()
+    keys = {(profile_id, period) for profile_id in profile_ids}
+    keys.update(
+        PayrollRollup.objects.filter(user_profile__in=profile_ids)
+        .values_list('user_profile', 'period')
+    )
+    refresh_rollups(keys)
+
+
+def seed_rollups(batch_size=500):
+    """Create the missing rows of the profiles' seeded periods, returning how many were created"""
+    created = 0
+    profile_ids = list(UserProfile.objects.order_by('pk').values_list('pk', flat=True))
+    for offset in range(0, len(profile_ids), batch_size):
+        batch = profile_ids[offset:offset + batch_size]
+        missing = seeded_keys(batch) - set(
+            PayrollRollup.objects.filter(user_profile__in=batch).values_list('user_profile', 'period')
+        )
+        refresh_rollups(missing)
+        created += len(missing)
+    return created
+
+
+def rebuild_rollups(batch_size=500):
+    """Rebuild the whole rollup table, one batch of profiles at a time"""
+    profile_ids = list(UserProfile.objects.order_by('pk').values_list('pk', flat=True))
+    with transaction.atomic():
+        PayrollRollup.objects.all().delete()
+        bump_collection_version(PayrollRollup)
+        for offset in range(0, len(profile_ids), batch_size):
+            batch = profile_ids[offset:offset + batch_size]
+            keys = seeded_keys(batch)
+            keys.update(
+                Deduction.objects.filter(user_profile__in=batch, date__isnull=False)
+                .annotate(period=TruncMonth('date', output_field=DateField()))
+                .values_list('user_profile', 'period')
+                .distinct()
+            )
+            refresh_rollups(keys)
+    return len(profile_ids)
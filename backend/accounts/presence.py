@@ -0,0 +1,155 @@
+import threading
+import time
+
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from django.utils.module_loading import import_string
+
+from .models import LoggedInUser
+
+
+class InMemoryPresenceStore:
+    """
+    Process-local presence store, used for development and tests.
+    Maps user ids to the time their last heartbeat expires. A heartbeat lasts
+    ttl seconds unless given its own (math.inf lasts until leave).
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._expires = {}
+
+    def heartbeat(self, user_id, ttl=None):
+        with self._lock:
+            self._expires[user_id] = time.time() + (self.ttl if ttl is None else ttl)
+
+    def leave(self, user_id):
+        with self._lock:
+            self._expires.pop(user_id, None)
+
+    def _prune(self):
+        now = time.time()
+        with self._lock:
+            self._expires = {
+                user_id: expires for user_id, expires in self._expires.items() if expires > now
+            }
+
+    def is_online(self, user_id):
+        return self._expires.get(user_id, 0) > time.time()
+
+    def count(self):
+        self._prune()
+        return len(self._expires)
+
+    def online_ids(self, offset=0, limit=None):
+        self._prune()
+        ids = sorted(self._expires)
+        return ids[offset:None if limit is None else offset + limit]
+
+    def clear(self):
+        with self._lock:
+            self._expires = {}
+
+
+class RedisPresenceStore:
+    """
+    Redis presence store shared by every worker.
+    Online users live in one sorted set scored by heartbeat expiry, so count and
+    list are range queries and expired members are trimmed on read.
+    """
+    key = "accounts:presence"
+
+    def __init__(self, ttl, url=None):
+        import redis
+
+        self.ttl = ttl
+        self.client = redis.Redis.from_url(url or settings.REDIS_URL)
+
+    def heartbeat(self, user_id, ttl=None):
+        self.client.zadd(self.key, {user_id: time.time() + (self.ttl if ttl is None else ttl)})
+
+    def leave(self, user_id):
+        self.client.zrem(self.key, user_id)
+
+    def _prune(self):
+        self.client.zremrangebyscore(self.key, "-inf", time.time())
+
+    def is_online(self, user_id):
+        expires = self.client.zscore(self.key, user_id)
+        return expires is not None and expires > time.time()
+
+    def count(self):
+        return self.client.zcount(self.key, time.time(), "+inf")
+
+    def online_ids(self, offset=0, limit=None):
+        self._prune()
+        end = -1 if limit is None else offset + limit - 1
+        return [int(user_id) for user_id in self.client.zrange(self.key, offset, end)]
+
+    def clear(self):
+        self.client.delete(self.key)
+
+
+def get_presence_store():
+    """
+    Build the configured presence store.
+    ACCOUNTS_PRESENCE_STORE overrides the default of Redis when REDIS_URL is set.
+    """
+    ttl = getattr(settings, "ACCOUNTS_PRESENCE_TTL", 120)
+    store_path = getattr(settings, "ACCOUNTS_PRESENCE_STORE", None)
+    if store_path:
+        return import_string(store_path)(ttl)
+    if getattr(settings, "REDIS_URL", None):
+        return RedisPresenceStore(ttl)
+    return InMemoryPresenceStore(ttl)
+
+
+presence = SimpleLazyObject(get_presence_store)
+
+
+class OnlineIds:
+    """
+    Sequence view of the online user ids that reads the store one slice at a
+    time, so a paginator can page through presence without loading every id.
+    """
+    def __init__(self, store=presence):
+        self.store = store
+
+    def count(self):
+        return self.store.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start = index.start or 0
+            limit = None if index.stop is None else index.stop - start
+            if limit is not None and limit <= 0:
+                return []
+            return self.store.online_ids(start, limit)
+        return self.store.online_ids(index, 1)[0]
+
+
+def flush_presence(batch_size=1000):
+    """
+    Write the presence store back to LoggedInUser.is_online with set-based updates.
+    Returns the number of users marked online.
+    """
+    online = presence.online_ids()
+    for offset in range(0, len(online), batch_size):
+        batch = online[offset:offset + batch_size]
+        LoggedInUser.objects.bulk_create(
+            [LoggedInUser(user_id=user_id, is_online=True) for user_id in batch],
+            ignore_conflicts=True,
+        )
+        LoggedInUser.objects.filter(user_id__in=batch, is_online=False).update(is_online=True)
+
+    online_set = set(online)
+    stale = LoggedInUser.objects.filter(is_online=True).values_list("user_id", flat=True)
+    stale = [user_id for user_id in stale.iterator() if user_id not in online_set]
+    for offset in range(0, len(stale), batch_size):
+        LoggedInUser.objects.filter(
+            user_id__in=stale[offset:offset + batch_size]
+        ).update(is_online=False)
+    return len(online)
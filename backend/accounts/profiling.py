@@ -0,0 +1,129 @@
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models.sql.compiler import SQLCompiler
+from silk import models
+from silk import sql as silk_sql
+from silk.collector import DataCollector
+from silk.config import SilkyConfig
+from silk.middleware import SilkyMiddleware, _should_intercept
+from silk.model_factory import RequestModelFactory
+from silk.sql import execute_sql
+
+logger = logging.getLogger(__name__)
+
+# This module leans on silk internals (checked against django-silk 5.3): the
+# SQLCompiler.execute_sql wrapper in silk.sql and the _explain_query it calls
+# for every recorded query, DataCollector's per-thread request and query dicts,
+# and the RequestModelFactory building blocks. Recheck them when upgrading silk.
+explain_query = silk_sql._explain_query
+
+
+class PendingPlan:
+    """The arguments of an EXPLAIN that silk asked for, run only if the request is kept"""
+    def __init__(self, connection, sql, params):
+        self.connection = connection
+        self.sql = sql
+        self.params = params
+
+    def explain(self):
+        try:
+            return explain_query(self.connection, self.sql, self.params)
+        except DatabaseError:
+            logger.debug("Query plan not recorded", exc_info=True)
+            return None
+
+
+def explain_plans(queries):
+    """
+    Replace the pending plans of the recorded queries (silk's query dicts) with
+    their EXPLAIN output, or drop them when ACCOUNTS_PROFILING_EXPLAIN is off.
+    """
+    explain = getattr(settings, "ACCOUNTS_PROFILING_EXPLAIN", True)
+    for query in queries.values():
+        plan = query.get("analysis")
+        if isinstance(plan, PendingPlan):
+            query["analysis"] = plan.explain() if explain else None
+
+
+def should_intercept(request):
+    """
+    Profile ACCOUNTS_PROFILING_SAMPLE_PERCENT of the requests whose path starts
+    with one of ACCOUNTS_PROFILING_PATHS (every path when empty).
+    """
+    paths = tuple(getattr(settings, "ACCOUNTS_PROFILING_PATHS", ()))
+    if paths and not request.path.startswith(paths):
+        return False
+    return random.random() * 100 < getattr(settings, "ACCOUNTS_PROFILING_SAMPLE_PERCENT", 100)
+
+
+class DeferredRequestModelFactory(RequestModelFactory):
+    """Build the silk Request like RequestModelFactory, without saving it"""
+    def construct_request_model(self):
+        body, raw_body = self.body()
+        request_model = models.Request(
+            path=self.request.path,
+            encoded_headers=self.encoded_headers(),
+            method=self.request.method,
+            query_params=self.query_params(),
+            view_name=self.view_name(),
+            body=body,
+        )
+        try:
+            request_model.raw_body = raw_body
+        except UnicodeDecodeError:
+            logger.debug("Binary request body not recorded")
+        return request_model
+
+
+class ProfilingMiddleware(SilkyMiddleware):
+    """
+    SilkyMiddleware that only stores the requests worth keeping.
+    Which requests are profiled is decided by should_intercept, on top of silk's
+    own exclusions (its UI and SILKY_IGNORE_PATHS).
+    Their request, response and SQL rows are collected in memory and written only
+    when the request took at least ACCOUNTS_PROFILING_SLOW_MS, so fast requests
+    cost no profiler writes. The query plans silk records are only explained for
+    the stored requests. Stored requests are capped by SILKY_MAX_RECORDED_REQUESTS.
+    """
+    def process_request(self, request):
+        DataCollector().clear()
+        if not (should_intercept(request) and _should_intercept(request)):
+            return
+
+        request.silk_is_intercepted = True
+        request.silk_started = time.perf_counter()
+        self._apply_dynamic_mappings()
+        if not hasattr(SQLCompiler, "_execute_sql"):
+            SQLCompiler._execute_sql = SQLCompiler.execute_sql
+            SQLCompiler.execute_sql = execute_sql
+            # silk runs an EXPLAIN next to every recorded query; hold it back
+            # until the request is known to be slow enough to keep
+            silk_sql._explain_query = PendingPlan
+
+        silky_config = SilkyConfig()
+        should_profile = silky_config.SILKY_PYTHON_PROFILER
+        if silky_config.SILKY_PYTHON_PROFILER_FUNC:
+            should_profile = silky_config.SILKY_PYTHON_PROFILER_FUNC(request)
+
+        request_model = DeferredRequestModelFactory(request).construct_request_model()
+        DataCollector().configure(request_model, should_profile=should_profile)
+
+    def process_response(self, request, response):
+        if not getattr(request, "silk_is_intercepted", False):
+            return response
+
+        collector = DataCollector()
+        elapsed = (time.perf_counter() - request.silk_started) * 1000
+        if elapsed < getattr(settings, "ACCOUNTS_PROFILING_SLOW_MS", 0):
+            collector.stop_python_profiler()
+            collector.clear()
+            return response
+        explain_plans(collector.queries)
+        if collector.request:
+            # The response and SQL rows reference it
+            collector.request.save()
+        return super().process_response(request, response)
@@ -0,0 +1,129 @@
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+
+from django.db import transaction
+
+from .cache import bump_collection_version
+from .history import ProfileHistoryTracker
+from .models import JobTitleHistory, UserProfile
+from .payroll import refresh_profile_rollups, refresh_rollups
+
+SUPPRESSED = object()
+
+# SUPPRESSED, the ReceiverBatch being deferred into, or None when receivers run normally
+_mode = ContextVar("accounts_receivers", default=None)
+
+
+def receivers_suppressed():
+    return _mode.get() is SUPPRESSED
+
+
+def deferred_batch():
+    """The batch collecting deferred receiver work, or None"""
+    mode = _mode.get()
+    return mode if isinstance(mode, ReceiverBatch) else None
+
+
+class ReceiverBatch:
+    """
+    History and rollup work queued by the deferred receivers.
+    Profiles keep the tracked values they had before their first save in the
+    block, so flush records the net change of each profile once.
+    """
+    def __init__(self):
+        self.created = []  # (profile, job_title_id, start) for each new profile
+        self.profiles = {}
+        self.previous = {}
+        self.rollup_keys = set()
+        self.rollup_profiles = set()
+
+    def create_profile_history(self, profile):
+        self.created.append((profile, profile.job_title_id, profile.start))
+
+    def remember(self, profiles):
+        """
+        Capture the stored values of profiles about to be saved in the block, in
+        at most one query for the ones not loaded from the database.
+        """
+        profiles = [profile for profile in profiles if profile.pk not in self.previous]
+        self.previous.update(ProfileHistoryTracker.stored_values(profiles))
+
+    def track_profile(self, profile):
+        self.remember([profile])
+        self.profiles[profile.pk] = profile
+
+    def flush(self):
+        """Write the queued work with set-based statements, in one transaction"""
+        profile_ids = {profile.pk for profile, _, _ in self.created} | set(self.profiles)
+        with transaction.atomic():
+            # Profiles deleted later in the block have nothing left to record;
+            # the others stay locked until their history is written
+            existing = set(
+                UserProfile.objects.select_for_update().filter(pk__in=profile_ids)
+                .order_by("pk").values_list("pk", flat=True)
+            )
+            created = JobTitleHistory.objects.bulk_create([
+                JobTitleHistory(job_title_id=job_title_id, user_profile=profile, start=start)
+                for profile, job_title_id, start in self.created if profile.pk in existing
+            ])
+            if created:
+                bump_collection_version(JobTitleHistory)
+            ProfileHistoryTracker(
+                [profile for pk, profile in self.profiles.items() if pk in existing],
+                previous=self.previous,
+            ).apply()
+            refresh_rollups(self.rollup_keys)
+            refresh_profile_rollups(self.rollup_profiles & existing)
+
+
+class SuppressReceivers(ContextDecorator):
+    """
+    Skip the accounts model receivers (profile creation, history and payroll
+    rollups) inside the block, for callers that write those rows themselves.
+    Cache invalidation, profile geography and token revocation receivers still run.
+    """
+    def _recreate_cm(self):
+        return type(self)()
+
+    def __enter__(self):
+        self.token = _mode.set(SUPPRESSED)
+
+    def __exit__(self, exc_type, exc, tb):
+        _mode.reset(self.token)
+        return False
+
+
+class DeferReceivers(ContextDecorator):
+    """
+    Queue the history and payroll rollup work of the accounts receivers and flush
+    it in one batch when the outermost block exits without an error. Profiles are
+    still created right away. Use inside transaction.atomic() so a failure leaves
+    neither the rows nor their history behind. Profiles loaded from the database
+    need no query to be tracked; callers saving other instances can pass them
+    to the batch's remember() first.
+    """
+    def _recreate_cm(self):
+        return type(self)()
+
+    def __enter__(self):
+        current = deferred_batch()
+        self.outermost = current is None
+        self.batch = ReceiverBatch() if self.outermost else current
+        self.token = _mode.set(self.batch)
+        return self.batch
+
+    def __exit__(self, exc_type, exc, tb):
+        _mode.reset(self.token)
+        if self.outermost and exc_type is None:
+            self.batch.flush()
+        return False
+
+
+def suppress_receivers():
+    """Context manager and decorator, see SuppressReceivers"""
+    return SuppressReceivers()
+
+
+def defer_receivers():
+    """Context manager and decorator, see DeferReceivers"""
+    return DeferReceivers()
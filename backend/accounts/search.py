@@ -0,0 +1,104 @@
+from django.conf import settings
+from django.db import connections
+from django.db.models import Value
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.functions import Greatest
+from django.utils.module_loading import import_string
+from rest_framework import filters
+
+
+class ContainsSearchBackend:
+    """
+    Default search backend, plain case-insensitive substring matching.
+    Used on databases without trigram support (e.g. SQLite); ranking is a no-op.
+    """
+    def rank(self, queryset, search_fields, terms):
+        return queryset
+
+
+class TrigramSearchBackend(ContainsSearchBackend):
+    """
+    PostgreSQL search backend built on pg_trgm.
+    Substring filters keep using icontains, which Postgres serves from the
+    GIN (UPPER(column) gin_trgm_ops) indexes created by the accounts migrations,
+    as long as each predicate reads one table (see RankedSearchFilter.search).
+    Ranking orders the matches by their best trigram word similarity.
+    """
+    def rank(self, queryset, search_fields, terms):
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        query = Value(' '.join(terms))
+        scores = [TrigramWordSimilarity(query, field) for field in search_fields]
+        score = Greatest(*scores) if len(scores) > 1 else scores[0]
+        ordering = queryset.query.order_by
+        return queryset.annotate(search_rank=score).order_by('-search_rank', *ordering)
+
+
+SEARCH_BACKENDS = {
+    'postgresql': TrigramSearchBackend,
+}
+
+
+def get_search_backend(using='default'):
+    """
+    Return the search backend for a database alias.
+    ACCOUNTS_SEARCH_BACKEND in settings overrides the per-vendor default.
+    """
+    backend_path = getattr(settings, 'ACCOUNTS_SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)()
+    vendor = connections[using].vendor
+    return SEARCH_BACKENDS.get(vendor, ContainsSearchBackend)()
+
+
+class RankedSearchFilter(filters.SearchFilter):
+    """
+    SearchFilter that can order results by relevance with ?rank=true.
+    Place it after OrderingFilter so the requested ordering becomes the tie-breaker.
+    """
+    rank_param = 'rank'
+
+    def wants_rank(self, request):
+        return request.query_params.get(self.rank_param, '').lower() in ('1', 'true')
+
+    def matching(self, model, lookup, term):
+        """
+        Return the pks of model rows matching lookup, one table per query.
+        A lookup through a forward relation becomes related_id IN (a query on the
+        related table), so every substring predicate can use its own table's index.
+        """
+        name, _, rest = lookup.partition(LOOKUP_SEP)
+        field = model._meta.get_field(name)
+        if rest and field.is_relation and field.concrete and not field.many_to_many:
+            related = self.matching(field.related_model, rest, term)
+            return model._default_manager.filter(**{f'{name}__in': related}).values('pk')
+        return model._default_manager.filter(**{lookup: term}).values('pk')
+
+    def search(self, request, queryset, view):
+        """
+        Filter like SearchFilter, but as a union of single-table queries.
+        An OR across joined tables cannot be served by the trigram indexes and
+        leaves Postgres scanning the join, so when search_fields span tables each
+        term matches the union of the per-table pks instead.
+        """
+        search_fields = self.get_search_fields(view, request)
+        terms = self.get_search_terms(request)
+        if not search_fields or not terms:
+            return queryset
+        lookups = [self.construct_search(str(field), queryset) for field in search_fields]
+        opts = queryset.model._meta
+        if not any(opts.get_field(lookup.split(LOOKUP_SEP)[0]).is_relation for lookup in lookups):
+            return super().filter_queryset(request, queryset, view)
+        for term in terms:
+            matches = [self.matching(queryset.model, lookup, term) for lookup in lookups]
+            queryset = queryset.filter(pk__in=matches[0].union(*matches[1:]))
+        return queryset
+
+    def filter_queryset(self, request, queryset, view):
+        filtered = self.search(request, queryset, view)
+        search_fields = self.get_search_fields(view, request)
+        terms = self.get_search_terms(request)
+        if not search_fields or not terms or not self.wants_rank(request):
+            return filtered
+        fields = [field.lstrip('^=@$') for field in search_fields]
+        return get_search_backend(filtered.db).rank(filtered, fields, terms)
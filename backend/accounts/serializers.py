@@ -1,5 +1,26 @@
+from abc import ABC, abstractmethod
+from datetime import date
+
+from django.db import transaction
+from django.db.models import (
+    Case,
+    DateField,
+    DurationField,
+    ExpressionWrapper,
+    F,
+    Q,
+    Value,
+    When,
+)
+from django.db.models.functions import ExtractYear
+from django.utils import timezone
 from rest_framework import serializers
 
+from accounts.authentication import token_digest, token_expiry
+from accounts.cache import bump_collection_version
+from accounts.geography import assign_geography
+from accounts.history import ProfileHistoryTracker
+from accounts.metrics import SERIALIZER_SECONDS, TimedSerializerMixin
 from accounts.models import (
     BlacklistedAccessToken,
     City,
@@ -9,12 +30,14 @@ from accounts.models import (
     JobTitle,
     JobTitleHistory,
     LoggedInUser,
+    PayrollRollup,
     SalaryHistory,
     UserProfile,
 )
+from accounts.temporal import effective_value
 
 
-class JobTitleSerializer(serializers.ModelSerializer):
+class JobTitleSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the JobTitle model.
     Handles serialization and deserialization of JobTitle objects.
@@ -24,7 +47,7 @@ class JobTitleSerializer(serializers.ModelSerializer):
         fields = ('name',)
 
 
-class CountrySerializer(serializers.ModelSerializer):
+class CountrySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the Country model.
     Used for retrieving and creating Country data.
@@ -33,7 +56,7 @@ class CountrySerializer(serializers.ModelSerializer):
         model = Country
         fields = ('name',)
 
-class GovernorateDetailSerializer(serializers.ModelSerializer):
+class GovernorateDetailSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for retrieving Governorate details (GET requests).
     Includes nested relationships.
@@ -43,7 +66,7 @@ class GovernorateDetailSerializer(serializers.ModelSerializer):
         model = Governorate
         fields = ('country', 'name')
 
-class GovernorateUpdateSerializer(serializers.ModelSerializer):
+class GovernorateUpdateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for updating Governorate (POST, PUT, PATCH, DELETE requests).
     Does not include nested relationships.
@@ -53,7 +76,7 @@ class GovernorateUpdateSerializer(serializers.ModelSerializer):
         fields = ('country', 'name')
 
 
-class CityDetailSerializer(serializers.ModelSerializer):
+class CityDetailSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for retrieving City details (GET requests).
     Includes nested relationships.
@@ -65,7 +88,7 @@ class CityDetailSerializer(serializers.ModelSerializer):
         fields = ('country', 'governorate', 'name')
 
 
-class CityUpdateSerializer(serializers.ModelSerializer):
+class CityUpdateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for updating City (POST, PUT, PATCH, DELETE requests).
     Does not include nested relationships.
@@ -75,7 +98,7 @@ class CityUpdateSerializer(serializers.ModelSerializer):
         fields = ('governorate', 'name')
 
 
-class UserProfileDetailSerializer(serializers.ModelSerializer):
+class UserProfileDetailSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for retrieving UserProfile details (GET requests).
     Includes nested relationships and calculated fields.
@@ -112,15 +135,11 @@ class UserProfileDetailSerializer(serializers.ModelSerializer):
 
     def get_country(self, obj):
         """Get country name, handling null values"""
-        if obj.city and obj.city.governorate and obj.city.governorate.country:
-            return obj.city.governorate.country.name
-        return None
+        return obj.country.name if obj.country else None
 
     def get_governorate(self, obj):
         """Get governorate name, handling null values"""
-        if obj.city and obj.city.governorate:
-            return obj.city.governorate.name
-        return None
+        return obj.governorate.name if obj.governorate else None
 
     def get_city(self, obj):
         """Get city name, handling null values"""
@@ -128,14 +147,179 @@ class UserProfileDetailSerializer(serializers.ModelSerializer):
 
     def get_years_of_service(self, obj):
         """Calculate years of service from start date to now"""
-        from django.utils import timezone
         if obj.start:
             delta = timezone.now().date() - obj.start
             return round(delta.days / 365, 1)
         return 0
-    
 
-class UserProfileUpdateSerializer(serializers.ModelSerializer):
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if hasattr(instance, 'as_of_salary'):
+            # Queried with ?as_of=, report the job title and salary in effect then
+            data['job_title'] = instance.as_of_job_title
+            data['salary'] = instance.as_of_salary
+        return data
+
+
+class ValuesSerializer(ABC):
+    """
+    Read-only serializer over values_list() rows.
+    Subclasses map every output field to a column expression in get_columns; rows
+    are zipped into dicts without DRF's per-field machinery, which keeps large
+    lists and exports cheap.
+    """
+    fields = ()
+
+    @abstractmethod
+    def get_columns(self):
+        """Map each name in fields to the column or expression it is read from"""
+
+    def get_queryset(self, queryset):
+        """Turn a (filtered, ordered) queryset into rows of output columns"""
+        columns = self.get_columns()
+        return queryset.values_list(*(columns[name] for name in self.fields))
+
+    def to_representation(self, row):
+        return dict(zip(self.fields, row))
+
+    def many(self, rows):
+        with SERIALIZER_SECONDS.time(serializer=type(self).__name__):
+            return [self.to_representation(row) for row in rows]
+
+
+class UserProfileListSerializer(ValuesSerializer):
+    """
+    Read-only fast path for UserProfileDetailSerializer in list responses.
+    Related names are joined into a single values_list() query and age and days of
+    service are computed by the database, so each row becomes a dict directly
+    instead of going through DRF's per-field machinery. The output matches
+    UserProfileDetailSerializer field for field.
+    """
+    fields = UserProfileDetailSerializer.Meta.fields
+
+    def __init__(self, today=None, as_of=None):
+        # Same clocks as UserProfile.age and get_years_of_service
+        self.birthday_today = today or date.today()
+        self.service_today = today or timezone.now().date()
+        self.as_of = as_of
+
+    def get_columns(self):
+        today = self.birthday_today
+        birthday_passed = Q(date_of_birth__month__lt=today.month) | Q(
+            date_of_birth__month=today.month, date_of_birth__day__lte=today.day
+        )
+        # NULL date_of_birth propagates through the arithmetic, like age returning None
+        age = Value(today.year) - ExtractYear('date_of_birth') - Case(
+            When(birthday_passed, then=Value(0)), default=Value(1)
+        )
+        service = ExpressionWrapper(
+            Value(self.service_today, output_field=DateField()) - F('start'),
+            output_field=DurationField(),
+        )
+        columns = {
+            'user': F('user__username'),
+            'email': F('user__email'),
+            'job_title': F('job_title__name'),
+            'country': F('country__name'),
+            'governorate': F('governorate__name'),
+            'city': F('city__name'),
+            'age': age,
+            'date_of_birth': F('date_of_birth'),
+            'start': F('start'),
+            'address': F('address'),
+            'gender': F('gender'),
+            'salary': F('salary'),
+            'years_of_service': service,
+        }
+        if self.as_of is not None:
+            columns['job_title'] = effective_value(JobTitleHistory, 'job_title__name', self.as_of)
+            columns['salary'] = effective_value(SalaryHistory, 'amount', self.as_of)
+        return columns
+
+    def to_representation(self, row):
+        data = super().to_representation(row)
+        service = data['years_of_service']
+        data['years_of_service'] = round(service.days / 365, 1) if service is not None else 0
+        return data
+
+
+
+class UserProfileBulkUpdateSerializer(serializers.ListSerializer):
+    """
+    List serializer for bulk updating UserProfile (PATCH requests with a list body).
+    Every item carries the profile id, is validated against its own instance and
+    the whole batch is written with bulk_update and set-based history writes.
+    """
+    batch_size = 500
+    id_field = serializers.IntegerField(min_value=1)
+
+    @classmethod
+    def profile_ids(cls, data):
+        """The valid ids of a bulk payload, coerced the way run_child_validation does"""
+        ids = []
+        for item in data if isinstance(data, list) else []:
+            if isinstance(item, dict):
+                try:
+                    ids.append(cls.id_field.run_validation(item.get('id')))
+                except serializers.ValidationError:
+                    pass
+        return ids
+
+    def run_child_validation(self, data):
+        if not isinstance(data, dict):
+            return super().run_child_validation(data)
+        if not hasattr(self, '_instances'):
+            self._instances = {profile.pk: profile for profile in self.instance or []}
+        try:
+            pk = self.id_field.run_validation(data.get('id'))
+        except serializers.ValidationError as exc:
+            raise serializers.ValidationError({'id': exc.detail})
+        try:
+            self.child.instance = self._instances[pk]
+        except KeyError:
+            raise serializers.ValidationError({'id': 'User profile not found'})
+        self.child.initial_data = data
+        validated = super().run_child_validation(data)
+        validated['id'] = self.child.instance.pk
+        return validated
+
+    def validate(self, attrs):
+        """Reject payloads that update the same profile twice"""
+        ids = [item['id'] for item in attrs]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError('Each user profile may only appear once')
+        return attrs
+
+    def update(self, instance, validated_data):
+        """Apply the validated changes and record history for the whole batch"""
+        profiles = {profile.pk: profile for profile in instance}
+        updated, fields = [], set()
+        for attrs in validated_data:
+            profile = profiles[attrs.pop('id')]
+            for field, value in attrs.items():
+                setattr(profile, field, value)
+                fields.add(field)
+            updated.append(profile)
+
+        tracker = ProfileHistoryTracker(updated)
+        with transaction.atomic():
+            # Read the stored values before they are overwritten
+            tracker.lock()
+            if fields:
+                # bulk_update neither sends signals nor fills auto_now fields
+                if 'city' in fields:
+                    assign_geography(updated)
+                    fields.update(('governorate', 'country'))
+                now = timezone.now()
+                for profile in updated:
+                    profile.updated_at = now
+                UserProfile.objects.bulk_update(updated, [*fields, 'updated_at'], batch_size=self.batch_size)
+                bump_collection_version(UserProfile)
+            tracker.apply()
+        return updated
+
+
+class UserProfileUpdateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for updating UserProfile (POST, PUT, PATCH, DELETE requests).
     Includes validation and custom field handling.
@@ -153,10 +337,10 @@ class UserProfileUpdateSerializer(serializers.ModelSerializer):
             'gender',
             'salary'
         )
+        list_serializer_class = UserProfileBulkUpdateSerializer
     
     def validate_date_of_birth(self, value):
         """Validate that date of birth is not in the future"""
-        from django.utils import timezone
         if value > timezone.now().date():
             raise serializers.ValidationError("Date of birth cannot be in the future")
         return value
@@ -179,19 +363,32 @@ class UserProfileUpdateSerializer(serializers.ModelSerializer):
                 })
         return data
 
-class JobTitleHistorySerializer(serializers.ModelSerializer):
+class JobTitleHistorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for JobTitleHistory.
     Tracks job title changes over time for a UserProfile.
     """
-    job_title = serializers.CharField(source = "job_title.name")
+    job_title = serializers.CharField(source = "job_title.name", allow_null=True)
     user_profile = serializers.CharField(source = 'user_profile.user.username')
     class Meta:
         model = JobTitleHistory
         fields = ('job_title', 'user_profile', 'start', 'end')
 
 
-class SalaryHistorySerializer(serializers.ModelSerializer):
+class JobTitleHistoryListSerializer(ValuesSerializer):
+    """Values-based JobTitleHistorySerializer, used for exports."""
+    fields = JobTitleHistorySerializer.Meta.fields
+
+    def get_columns(self):
+        return {
+            'job_title': F('job_title__name'),
+            'user_profile': F('user_profile__user__username'),
+            'start': F('start'),
+            'end': F('end'),
+        }
+
+
+class SalaryHistorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for SalaryHistory.
     Tracks salary changes over time for a UserProfile.
@@ -202,7 +399,20 @@ class SalaryHistorySerializer(serializers.ModelSerializer):
         fields = ('amount', 'user_profile', 'start', 'end')
 
 
-class DeductionDetailSerializer(serializers.ModelSerializer):
+class SalaryHistoryListSerializer(ValuesSerializer):
+    """Values-based SalaryHistorySerializer, used for exports."""
+    fields = SalaryHistorySerializer.Meta.fields
+
+    def get_columns(self):
+        return {
+            'amount': F('amount'),
+            'user_profile': F('user_profile__user__username'),
+            'start': F('start'),
+            'end': F('end'),
+        }
+
+
+class DeductionDetailSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for retrieving Deduction details (GET requests).
     Includes nested relationships and validation.
@@ -214,7 +424,21 @@ class DeductionDetailSerializer(serializers.ModelSerializer):
         fields = ('user_profile', 'name', 'amount', 'date', 'discription')
 
 
-class DeductionUpdateSerializer(serializers.ModelSerializer):
+class DeductionListSerializer(ValuesSerializer):
+    """Values-based DeductionDetailSerializer, used for exports."""
+    fields = DeductionDetailSerializer.Meta.fields
+
+    def get_columns(self):
+        return {
+            'user_profile': F('user_profile__user__username'),
+            'name': F('name'),
+            'amount': F('amount'),
+            'date': F('date'),
+            'discription': F('discription'),
+        }
+
+
+class DeductionUpdateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for updating Deduction (POST, PUT, PATCH, DELETE requests).
     Includes validation and custom field handling.
@@ -245,27 +469,88 @@ class DeductionUpdateSerializer(serializers.ModelSerializer):
     
     def validate_date(self, value):
         """Validate deduction date"""
-        from django.utils import timezone
         if value > timezone.now().date():
             raise serializers.ValidationError("Deduction date cannot be in the future")
         return value
 
 
-class LoggedInUserSerializer(serializers.ModelSerializer):
+class PayrollRollupSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    Serializer for PayrollRollup.
+    Read-only monthly payroll figures for a UserProfile.
+    """
+    user_profile = serializers.CharField(source='user_profile.user.username')
+
+    class Meta:
+        model = PayrollRollup
+        fields = (
+            'user_profile',
+            'period',
+            'salary',
+            'total_deductions',
+            'deduction_count',
+            'net',
+            'updated_at',
+        )
+
+
+class LoggedInUserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for LoggedInUser.
     Tracks user login sessions and access token status.
+    The access token is write-only, only its digest and expiry are stored.
     """
+    access_token = serializers.CharField(write_only=True, required=False, allow_blank=True)
+
     class Meta:
         model = LoggedInUser
-        fields = ('user', 'access_token', 'is_online')
+        fields = ('user', 'access_token', 'access_token_expires_at', 'is_online')
+        read_only_fields = ('access_token_expires_at',)
 
+    def _hash_access_token(self, validated_data):
+        token = validated_data.pop('access_token', None)
+        if token is not None:
+            validated_data['access_token_digest'] = token_digest(token) if token else None
+            validated_data['access_token_expires_at'] = token_expiry(token) if token else None
+        return validated_data
 
-class BlacklistedAccessTokenSerializer(serializers.ModelSerializer):
+    def create(self, validated_data):
+        return super().create(self._hash_access_token(validated_data))
+
+    def update(self, instance, validated_data):
+        return super().update(instance, self._hash_access_token(validated_data))
+
+
+class BlacklistedAccessTokenSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for BlacklistedAccessToken.
     Handles tokens that are revoked or invalidated.
+    The raw token is write-only and stored as a digest with its expiry.
     """
+    token = serializers.CharField(write_only=True)
+
     class Meta:
         model = BlacklistedAccessToken
-        fields = ('token',)
+        fields = ('token', 'digest', 'expires_at')
+        read_only_fields = ('digest', 'expires_at')
+
+    def validate_token(self, value):
+        """Only well-formed tokens can be blacklisted, and only once"""
+        if token_expiry(value) is None:
+            raise serializers.ValidationError("Token is invalid")
+        if BlacklistedAccessToken.objects.filter(digest=token_digest(value)).exists():
+            raise serializers.ValidationError("Token is already blacklisted")
+        return value
+
+    def create(self, validated_data):
+        token = validated_data.pop('token')
+        validated_data['digest'] = token_digest(token)
+        validated_data['expires_at'] = token_expiry(token)
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        token = validated_data.pop('token', None)
+        if token:
+            validated_data['digest'] = token_digest(token)
+            validated_data['expires_at'] = token_expiry(token)
+        return super().update(instance, validated_data)
@@ -1,16 +1,69 @@
+import math
+from functools import partial
+
+from django.conf import settings
 from django.contrib.auth import user_logged_in, user_logged_out
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save, pre_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
-from django.utils import timezone
 
-from .models import JobTitleHistory, LoggedInUser, SalaryHistory, UserProfile
+from .authentication import revoked_tokens
+from .cache import bump_collection_version
+from .geography import (
+    assign_geography,
+    clear_city_geography,
+    sync_city_profiles,
+    sync_governorate_profiles,
+)
+from .history import ProfileHistoryTracker
+from .metrics import RECEIVER_SECONDS, timed
+from .models import (
+    BlacklistedAccessToken,
+    City,
+    Country,
+    Deduction,
+    Governorate,
+    JobTitle,
+    JobTitleHistory,
+    SalaryHistory,
+    UserProfile,
+)
+from .payroll import month_start, refresh_profile_rollups, refresh_rollups
+from .presence import presence
+from .receivers import deferred_batch, receivers_suppressed
+
+# Fields whose saves affect the history and rollup rows, by name and attname
+PROFILE_HISTORY_FIELDS = {"job_title", "job_title_id", "salary", "start"}
+DEDUCTION_ROLLUP_FIELDS = {"user_profile", "user_profile_id", "amount", "date"}
+SALARY_ROLLUP_FIELDS = {"user_profile", "user_profile_id", "amount", "start"}
+# Fields the denormalized profile geography keys derive from
+PROFILE_GEOGRAPHY_FIELDS = {"city", "city_id"}
+CITY_GEOGRAPHY_FIELDS = {"governorate", "governorate_id"}
+GOVERNORATE_GEOGRAPHY_FIELDS = {"country", "country_id"}
+
+
+def touches(update_fields, tracked):
+    """Whether a save with these update_fields can change any tracked field"""
+    return update_fields is None or not tracked.isdisjoint(update_fields)
+
+
+def moved(instance, field):
+    """Whether field may differ from its stored value (unknown when it was not loaded)"""
+    stored = instance.stored_values([field])
+    return stored is None or stored[field] != getattr(instance, field)
+
 
 # Receivers
 """ Add a record to the JobTitleHistory when the UserProfile is created """
 @receiver(post_save, sender=UserProfile)
+@timed(RECEIVER_SECONDS)
 def create_job_title_history(sender, instance, created, **kwargs):
-    if created:
+    if created and not receivers_suppressed():
+        batch = deferred_batch()
+        if batch is not None:
+            batch.create_profile_history(instance)
+            return
         job_title = instance.job_title
         start = instance.start
         JobTitleHistory.objects.create(
@@ -18,123 +71,183 @@ def create_job_title_history(sender, instance, created, **kwargs):
         )
 
 
-"""
-    update the first record at JobTitleHistory when the UserProfile's jobtitle is changed 
-    and the first JobTitleHistory record is None
-"""
+""" record JobTitleHistory and SalaryHistory changes when an existing UserProfile is saved """
 @receiver(pre_save, sender=UserProfile)
-def update_first_job_title_history(sender, instance, **kwargs):
-    if (
-        instance.pk
-    ):  # Check if the instance is already in the database (i.e., being updated)
-        original_instance = UserProfile.objects.get(pk=instance.pk)
-        if original_instance.start != instance.start:
-            # Get the first job title history associated with the profile
-            first_job_title_history = instance.jobtitlehistory_set.first()
-            if first_job_title_history and first_job_title_history.job_title == None:
-                first_job_title_history.job_title = (
-                    instance.job_title
-                )  # Update the job title
-                first_job_title_history.start = instance.start  # Update the start time
-                first_job_title_history.save()
-            elif first_job_title_history.job_title != None:
-                first_job_title_history.start = instance.start  # Update the start time
-                first_job_title_history.save()
-                pass
-
-
-"""
-    update the JobTitleHistory when the UserProfile's jobtitle is changed
-    and the first JobTitleHistory record is not None 
-"""
+@timed(RECEIVER_SECONDS)
+def track_profile_history(sender, instance, update_fields=None, **kwargs):
+    if not instance.pk or receivers_suppressed():
+        return
+    if not touches(update_fields, PROFILE_HISTORY_FIELDS):
+        return
+    batch = deferred_batch()
+    if batch is not None:
+        batch.track_profile(instance)
+    else:
+        ProfileHistoryTracker([instance]).apply()
+
+
+""" copy the governorate and country of a profile's city onto the profile """
 @receiver(pre_save, sender=UserProfile)
-def update_job_title_history(sender, instance, **kwargs):
-    if (
-        instance.pk
-    ):  # Check if the instance is already in the database (i.e., being updated)
-        last_job_title_history = (
-            instance.jobtitlehistory_set.last()
-        )  # Get the last job title history
-        if last_job_title_history:
-            if (
-                last_job_title_history.job_title != instance.job_title
-            ):  # Check if job_title is changed
-                last_job_title_history.end = (
-                    timezone.now()
-                )  # End the current job title period
-                last_job_title_history.save()
-                # Create a new JobTitleHistory with the new job title
-                JobTitleHistory.objects.create(
-                    job_title=instance.job_title,
-                    user_profile=instance,
-                    start=timezone.now(),
-                )
-                # Cancel the saving process to prevent UserProfile changes
-                return
+@timed(RECEIVER_SECONDS)
+def assign_profile_geography(sender, instance, update_fields=None, **kwargs):
+    if touches(update_fields, PROFILE_GEOGRAPHY_FIELDS) and moved(instance, "city_id"):
+        assign_geography([instance])
+
+
+""" move the profiles of a city to its new governorate and country """
+@receiver(post_save, sender=City)
+@timed(RECEIVER_SECONDS)
+def move_city_profiles(sender, instance, created, update_fields=None, **kwargs):
+    if not created and touches(update_fields, CITY_GEOGRAPHY_FIELDS) and moved(instance, "governorate_id"):
+        sync_city_profiles(instance)
+
+
+""" move the profiles of a governorate to its new country """
+@receiver(post_save, sender=Governorate)
+@timed(RECEIVER_SECONDS)
+def move_governorate_profiles(sender, instance, created, update_fields=None, **kwargs):
+    if not created and touches(update_fields, GOVERNORATE_GEOGRAPHY_FIELDS) and moved(instance, "country_id"):
+        sync_governorate_profiles(instance)
+
+
+""" clear the geography keys of the profiles of a city about to be deleted (SET_NULL sends no signals) """
+@receiver(pre_delete, sender=City)
+@timed(RECEIVER_SECONDS)
+def clear_city_profiles(sender, instance, **kwargs):
+    clear_city_geography(instance)
 
 
 """ create UserProfile record when a new user is created """
 @receiver(post_save, sender=User)
+@timed(RECEIVER_SECONDS)
 def create_user_profile(sender, instance, created, **kwargs):
-    if created:
+    if created and not receivers_suppressed():
         UserProfile.objects.create(user=instance)
 
 
+""" save the profile along with the user, only when it was loaded through the user and may have changed """
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.userprofile.save()
+@timed(RECEIVER_SECONDS)
+def save_user_profile(sender, instance, created, update_fields=None, **kwargs):
+    # Creation and partial saves such as update_last_login never change the profile
+    if created or update_fields is not None or receivers_suppressed():
+        return
+    if User.userprofile.related.is_cached(instance):
+        instance.userprofile.save()
 
 
-""" add a new record the the SalaryHistory when the UserProfile's salary is changed """
-@receiver(pre_save, sender=UserProfile)
-def update_salary_history(sender, instance, **kwargs):
-    try:
-        old_instance = UserProfile.objects.get(pk=instance.pk)
-    except UserProfile.DoesNotExist:
-        # If UserProfile instance is being created, no need to update salary history
+""" remember where a Deduction was before it is saved, so its old rollup gets refreshed too """
+@receiver(pre_save, sender=Deduction)
+@timed(RECEIVER_SECONDS)
+def capture_deduction_rollup_key(sender, instance, update_fields=None, **kwargs):
+    instance._previous_rollup_key = None
+    if receivers_suppressed() or not touches(update_fields, DEDUCTION_ROLLUP_FIELDS):
+        return
+    if instance.pk:
+        previous = Deduction.objects.filter(pk=instance.pk).values_list(
+            "user_profile", "date"
+        ).first()
+        if previous and previous[1]:
+            instance._previous_rollup_key = (previous[0], month_start(previous[1]))
+
+
+""" update the PayrollRollup rows touched by a Deduction change """
+@receiver(post_save, sender=Deduction)
+@timed(RECEIVER_SECONDS)
+def update_deduction_rollup(sender, instance, update_fields=None, **kwargs):
+    if receivers_suppressed() or not touches(update_fields, DEDUCTION_ROLLUP_FIELDS):
         return
+    keys = {getattr(instance, "_previous_rollup_key", None)}
+    if instance.date:
+        keys.add((instance.user_profile_id, month_start(instance.date)))
+    keys.discard(None)
+    batch = deferred_batch()
+    if batch is not None:
+        batch.rollup_keys.update(keys)
+    else:
+        refresh_rollups(keys)
+
+
+@receiver(post_delete, sender=Deduction)
+@timed(RECEIVER_SECONDS)
+def remove_deduction_rollup(sender, instance, origin=None, **kwargs):
+    if receivers_suppressed() or not instance.date:
+        return
+    # Skip cascades from a deleted profile, its rollups are deleted with it
+    if isinstance(origin, Deduction) or getattr(origin, "model", None) is Deduction:
+        key = (instance.user_profile_id, month_start(instance.date))
+        batch = deferred_batch()
+        if batch is not None:
+            batch.rollup_keys.add(key)
+        else:
+            refresh_rollups([key])
+
+
+""" update the PayrollRollup salaries when a SalaryHistory record changes """
+@receiver(post_save, sender=SalaryHistory)
+@timed(RECEIVER_SECONDS)
+def update_salary_rollup(sender, instance, update_fields=None, **kwargs):
+    if receivers_suppressed() or not touches(update_fields, SALARY_ROLLUP_FIELDS):
+        return
+    refresh_salary_rollup(instance)
 
-    # Check if salary has changed
-    if old_instance.salary != instance.salary:
-        # If salary changed, update the end date of the last salary history
-        last_salary_history = (
-            SalaryHistory.objects.filter(user_profile=instance).order_by("start").last()
-        )
-        if last_salary_history:
-            last_salary_history.end = timezone.now()
-            last_salary_history.save()
-
-        # Create a new salary history record
-        SalaryHistory.objects.create(
-            user_profile=instance,
-            amount=instance.salary,
-            start=timezone.now(),
-            end=None,
-        )
 
+@receiver(post_delete, sender=SalaryHistory)
+@timed(RECEIVER_SECONDS)
+def remove_salary_rollup(sender, instance, origin=None, **kwargs):
+    if receivers_suppressed():
+        return
+    if isinstance(origin, SalaryHistory) or getattr(origin, "model", None) is SalaryHistory:
+        refresh_salary_rollup(instance)
+
+
+def refresh_salary_rollup(instance):
+    batch = deferred_batch()
+    if batch is not None:
+        batch.rollup_profiles.add(instance.user_profile_id)
+    else:
+        refresh_profile_rollups([instance.user_profile_id])
+
+
+""" move a collection to a new version when one of its rows changes, invalidating cached responses and ETags """
+@receiver([post_save, post_delete], sender=JobTitle)
+@receiver([post_save, post_delete], sender=Country)
+@receiver([post_save, post_delete], sender=Governorate)
+@receiver([post_save, post_delete], sender=City)
+@receiver([post_save, post_delete], sender=UserProfile)
+@receiver([post_save, post_delete], sender=JobTitleHistory)
+@receiver([post_save, post_delete], sender=SalaryHistory)
+@receiver([post_save, post_delete], sender=Deduction)
+@timed(RECEIVER_SECONDS)
+def invalidate_collection(sender, **kwargs):
+    bump_collection_version(sender)
+
+
+""" usernames and emails are part of the profile, history, deduction and payroll responses; logins are not """
+@receiver([post_save, post_delete], sender=User)
+@timed(RECEIVER_SECONDS)
+def invalidate_user_collection(sender, update_fields=None, **kwargs):
+    if update_fields is None or not set(update_fields) <= {"last_login"}:
+        bump_collection_version(sender)
+
+
+""" revoke a blacklisted token in this process once it is committed, other processes pick it up on refresh """
+@receiver(post_save, sender=BlacklistedAccessToken)
+@timed(RECEIVER_SECONDS)
+def revoke_blacklisted_token(sender, instance, **kwargs):
+    transaction.on_commit(partial(revoked_tokens.add, instance.digest, instance.expires_at))
 
-"""
-    update the SalaryHistory when the UserProfile's salary is changed
-    and the first SalaryHistory record is not None 
-"""
-@receiver(pre_save, sender=UserProfile)
-def update_first_salary_history(sender, instance, **kwargs):
-    if (
-        instance.pk
-    ):  # Check if the instance is already in the database (i.e., being updated)
-        original_instance = UserProfile.objects.get(pk=instance.pk)
-        if original_instance.start != instance.start:
-            # Get the first salary history associated with the profile
-            first_salary_history = instance.salaryhistory_set.first()
-            if first_salary_history:
-                first_salary_history.start = instance.start  # Update the start time
-                first_salary_history.save()
 
+""" track online presence in the presence store instead of writing LoggedInUser rows; a login lasts ACCOUNTS_PRESENCE_LOGIN_TTL """
 @receiver(user_logged_in)
+@timed(RECEIVER_SECONDS)
 def on_user_logged_in(sender, request, **kwargs):
-    LoggedInUser.objects.get_or_create(user=kwargs.get('user')) 
+    presence.heartbeat(kwargs.get('user').pk, ttl=getattr(settings, "ACCOUNTS_PRESENCE_LOGIN_TTL", math.inf))
 
 
 @receiver(user_logged_out)
+@timed(RECEIVER_SECONDS)
 def on_user_logged_out(sender, **kwargs):
-    LoggedInUser.objects.filter(user=kwargs.get('user')).delete()
+    user = kwargs.get('user')
+    if user is not None:
+        presence.leave(user.pk)
@@ -0,0 +1,84 @@
+from datetime import datetime, time
+
+from django.db.models import (
+    BooleanField,
+    DateTimeField,
+    F,
+    Func,
+    OuterRef,
+    Subquery,
+    Value,
+)
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+
+AS_OF_PARAM = "as_of"
+
+# The [start, end) period of a history row, as indexed by the accounts migrations.
+# A missing start or end leaves that side open; a period ending before it starts is empty.
+PERIOD_SQL = "tstzrange({start}, CASE WHEN {end} < {start} THEN {start} ELSE {end} END, '[)')"
+
+
+class EffectiveAt(Func):
+    """
+    Whether a history row's period contains a moment.
+    On PostgreSQL this is a range containment, served by the GiST index behind the
+    no-overlap exclusion constraints; elsewhere it compares the bounds.
+    """
+    output_field = BooleanField()
+
+    def __init__(self, moment, start="start", end="end"):
+        super().__init__(F(start), F(end), Value(moment, output_field=DateTimeField()))
+
+    def compile_parts(self, compiler):
+        start, end, moment = (compiler.compile(expression) for expression in self.get_source_expressions())
+        # The bounds are plain columns, only the moment carries a parameter
+        return start[0], end[0], moment
+
+    def as_sql(self, compiler, connection, **extra_context):
+        start, end, (moment, params) = self.compile_parts(compiler)
+        sql = f"(({start} IS NULL OR {start} <= {moment}) AND ({end} IS NULL OR {end} > {moment}))"
+        return sql, (*params, *params)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        start, end, (moment, params) = self.compile_parts(compiler)
+        return f"{PERIOD_SQL.format(start=start, end=end)} @> ({moment})::timestamptz", tuple(params)
+
+
+def effective_value(model, field, moment):
+    """Subquery for field on the profile's history row (of model) in effect at moment"""
+    return Subquery(
+        model.objects.filter(EffectiveAt(moment), user_profile=OuterRef("pk"))
+        .order_by("-start", "-pk")
+        .values(field)[:1]
+    )
+
+
+def parse_as_of(request):
+    """The ?as_of= date or date/time as an aware datetime, or None when not given"""
+    value = request.query_params.get(AS_OF_PARAM)
+    if not value:
+        return None
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            moment = day and datetime.combine(day, time.min)
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise ValidationError({AS_OF_PARAM: "Enter a valid date or date/time."})
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class AsOfFilter(filters.BaseFilterBackend):
+    """Limit a history viewset to the rows in effect at ?as_of="""
+    def filter_queryset(self, request, queryset, view):
+        moment = parse_as_of(request)
+        if moment is None:
+            return queryset
+        return queryset.filter(EffectiveAt(moment))
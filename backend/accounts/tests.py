@@ -1,3 +1,1514 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import importlib
+import io
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, models
+from django.db.models import F
+from django.db.models.functions import Length
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    modify_settings,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.tokens import AccessToken
+from silk import models as silk_models
+from silk.collector import DataCollector
+
+from accounts.authentication import (
+    RevocationList,
+    revoked_tokens,
+    token_digest,
+    token_expiry,
+)
+from accounts.cache import VERSION_KEY
+from accounts.filters import ContainedIn
+from accounts.loadtest import (
+    DEFAULT_MIX,
+    InProcessTransport,
+    format_report,
+    generate_dataset,
+    percentile,
+    run_load,
+)
+from accounts.metrics import REGISTRY, Histogram, Metric, metrics_view, timed
+from accounts.models import (
+    BlacklistedAccessToken,
+    City,
+    Country,
+    Deduction,
+    Governorate,
+    JobTitle,
+    JobTitleHistory,
+    LoggedInUser,
+    PayrollRollup,
+    SalaryHistory,
+    UserProfile,
+)
+from accounts.payroll import rebuild_rollups, seed_rollups, seeded_periods
+from accounts.presence import presence
+from accounts.profiling import should_intercept
+from accounts.receivers import ReceiverBatch, defer_receivers, suppress_receivers
+from accounts.search import (
+    ContainsSearchBackend,
+    RankedSearchFilter,
+    TrigramSearchBackend,
+    get_search_backend,
+)
+from accounts.serializers import (
+    DeductionListSerializer,
+    UserProfileDetailSerializer,
+    UserProfileListSerializer,
+    ValuesSerializer,
+)
+from accounts.urls import async_urlpatterns, router
+from accounts.views import UserProfileViewSet
+
+# Lookups that a B-tree index cannot serve; they go through the search backend
+TEXT_SEARCH_LOOKUPS = {'contains', 'icontains'}
+
+
+def indexed_columns(model):
+    """Return the columns of model that lead an index and can serve a filter or sort"""
+    columns = {model._meta.pk.name}
+    for field in model._meta.concrete_fields:
+        if field.db_index or field.unique:
+            columns.add(field.name)
+    for index in model._meta.indexes:
+        columns.add(index.fields[0].lstrip('-'))
+    return columns
+
+
+def resolve_field(model, path):
+    """Follow a field__path across relations and return (model, field name)"""
+    *relations, name = path.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model, name
+
+
+@modify_settings(MIDDLEWARE={'remove': 'accounts.profiling.ProfilingMiddleware'})
+class AdminAPITestCase(TestCase):
+    """API tests authenticated as a superuser, on an empty cache and without profiling"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+
+class IndexCoverageTests(SimpleTestCase):
+    """Every declared filter and ordering field must be backed by an index."""
+
+    def viewsets(self):
+        return [
+            viewset for _, viewset, _ in router.registry
+            if getattr(viewset, 'queryset', None) is not None
+        ]
+
+    def assert_indexed(self, model, path, source):
+        model, name = resolve_field(model, path)
+        field = model._meta.get_field(name)
+        if isinstance(field, models.ForeignObjectRel):
+            return
+        self.assertIn(
+            name, indexed_columns(model),
+            f'{source}: {model.__name__}.{name} has no supporting index',
+        )
+
+    def test_filter_fields_are_indexed(self):
+        for viewset in self.viewsets():
+            filterset_class = getattr(viewset, 'filterset_class', None)
+            if filterset_class is None:
+                continue
+            model = filterset_class._meta.model
+            for name, declared in filterset_class.base_filters.items():
+                # Method filters don't map to a column, e.g. is_online uses the presence store
+                if declared.method or declared.lookup_expr in TEXT_SEARCH_LOOKUPS:
+                    continue
+                with self.subTest(filterset=filterset_class.__name__, filter=name):
+                    self.assert_indexed(model, declared.field_name, filterset_class.__name__)
+
+    def test_ordering_fields_are_indexed(self):
+        for viewset in self.viewsets():
+            model = viewset.queryset.model
+            fields = list(getattr(viewset, 'ordering_fields', None) or [])
+            fields += list(getattr(viewset, 'ordering', None) or [])
+            for field in fields:
+                with self.subTest(viewset=viewset.__name__, field=field):
+                    self.assert_indexed(model, field.lstrip('-'), viewset.__name__)
+
+
+BENCHMARK_PROFILES = int(os.getenv('ACCOUNTS_BENCHMARK_PROFILES', 2000))
+BENCHMARK_ROUNDS = int(os.getenv('ACCOUNTS_BENCHMARK_ROUNDS', 1))
+
+# Most queries one request to each route may run, whatever the page or batch size.
+# Requests are force-authenticated, so authentication costs nothing here.
+QUERY_BUDGETS = {
+    'api-root': 0,
+    'blacklist-list': 2,
+    'blacklist-detail': 1,
+    'city-list': 2,
+    'city-detail': 1,
+    'country-list': 2,
+    'country-detail': 1,
+    'deduction-list': 2,
+    'deduction-detail': 1,
+    'deduction-export': 1,
+    'employee_import-list': 16,
+    'geography-list': 3,
+    'governorate-list': 2,
+    'governorate-detail': 1,
+    'jobtitle-list': 2,
+    'jobtitle-detail': 1,
+    'jobtitle_history-list': 2,
+    'jobtitle_history-detail': 1,
+    'jobtitle_history-export': 1,
+    'logged_in_user-list': 2,
+    'logged_in_user-detail': 1,
+    'payroll_rollup-list': 2,
+    'payroll_rollup-detail': 1,
+    'presence-list': 1,
+    'presence-count': 0,
+    'presence-heartbeat': 0,
+    'presence-leave': 0,
+    'salary_history-list': 2,
+    'salary_history-detail': 1,
+    'salary_history-export': 1,
+    'userprofile-list': 2,
+    'userprofile-detail': 1,
+    'userprofile-export': 1,
+    'userprofile-bulk-partial-update': 15,
+    'userprofile-deductions-summaries': 3,
+    'userprofile-deductions-summary': 2,
+    'userprofile-salary-history': 2,
+    'async_userprofile-list': 2,
+    'async_userprofile-detail': 1,
+    'async_city-list': 2,
+    'async_city-detail': 1,
+    'async_jobtitle_history-list': 2,
+    'async_jobtitle_history-detail': 1,
+    'async_salary_history-list': 2,
+    'async_salary_history-detail': 1,
+}
+
+
+def routes():
+    """(url name, URL pattern) of every route in accounts/urls.py, format suffixes left out"""
+    patterns = {}
+    for pattern in [*router.urls, *async_urlpatterns]:
+        patterns.setdefault(pattern.name, pattern)
+    return patterns
+
+
+class EndpointQueryBudgetTests(AdminAPITestCase):
+    """
+    Call every route in accounts/urls.py against a seeded dataset and hold it to a
+    query budget. Each request runs at two page/batch sizes and must cost the same
+    number of queries at both, so per-row queries (N+1) fail the test.
+    ACCOUNTS_BENCHMARK_PROFILES sets the data volume; ACCOUNTS_BENCHMARK_ROUNDS > 1
+    repeats every request and prints latency percentiles.
+    """
+    # Small enough that no bulk statement is split by SQLite's parameter limit
+    sizes = (5, 25)
+    timings = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        today = date.today()
+        now = timezone.now()
+        job_titles = JobTitle.objects.bulk_create([JobTitle(name=f'Title {i}') for i in range(20)])
+        countries = Country.objects.bulk_create([Country(name=f'Country {i}') for i in range(5)])
+        governorates = Governorate.objects.bulk_create([
+            Governorate(name=f'Governorate {i}', country=countries[i % 5]) for i in range(30)
+        ])
+        cities = City.objects.bulk_create([
+            City(name=f'City {i}', governorate=governorates[i % 30]) for i in range(300)
+        ])
+
+        unusable = make_password(None)
+        User.objects.bulk_create([
+            User(username=f'user{i}', email=f'user{i}@example.com', password=unusable)
+            for i in range(BENCHMARK_PROFILES)
+        ])
+        users = User.objects.filter(username__startswith='user').order_by('pk')
+        UserProfile.objects.bulk_create([
+            UserProfile(
+                user=user,
+                job_title=job_titles[i % 20],
+                city=cities[i % 300],
+                date_of_birth=today - timedelta(days=7000 + i * 7),
+                start=today - timedelta(days=30 + i),
+                address=f'{i} Main Street',
+                gender='MF'[i % 2],
+                salary=3000 + i,
+            )
+            for i, user in enumerate(users)
+        ])
+        profiles = list(UserProfile.objects.filter(user__in=users).order_by('pk'))
+
+        # Two job titles, two salaries and three deductions per employee
+        promoted = now - timedelta(days=15)
+        JobTitleHistory.objects.bulk_create([
+            JobTitleHistory(job_title=job_titles[(i + shift) % 20], user_profile=profile, start=start, end=end)
+            for i, profile in enumerate(profiles)
+            for shift, start, end in ((1, now - timedelta(days=400), promoted), (0, promoted, None))
+        ])
+        SalaryHistory.objects.bulk_create([
+            SalaryHistory(user_profile=profile, amount=amount, start=start, end=end)
+            for profile in profiles
+            for amount, start, end in (
+                (profile.salary - 500, now - timedelta(days=400), promoted),
+                (profile.salary, promoted, None),
+            )
+        ])
+        Deduction.objects.bulk_create([
+            Deduction(user_profile=profile, name=f'Deduction {n}', amount=10 + n, date=now - timedelta(days=31 * n))
+            for profile in profiles
+            for n in range(3)
+        ])
+        rebuild_rollups()
+
+        LoggedInUser.objects.bulk_create([
+            LoggedInUser(user=user, is_online=True) for user in users[:50]
+        ])
+        BlacklistedAccessToken.objects.bulk_create([
+            BlacklistedAccessToken(
+                digest=hashlib.sha256(str(i).encode()).hexdigest(),
+                expires_at=now + timedelta(hours=1),
+            )
+            for i in range(50)
+        ])
+        cls.user_ids = list(users.values_list('pk', flat=True))
+        cls.profile_ids = [profile.pk for profile in profiles]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if BENCHMARK_ROUNDS > 1:
+            sys.stderr.write(f'\n{"route":<40} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}\n')
+            for name, values in sorted(cls.timings.items()):
+                p50, p95, p99 = (percentile(values, pct) * 1000 for pct in (50, 95, 99))
+                sys.stderr.write(f'{name:<40} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f}\n')
+
+    def setUp(self):
+        super().setUp()
+        presence.clear()
+        for user_id in self.user_ids[:100]:
+            presence.heartbeat(user_id)
+
+    def detail_pk(self, name):
+        """Primary key of an object the detail route can return"""
+        if name in ('userprofile-detail', 'userprofile-deductions-summary',
+                    'userprofile-salary-history', 'async_userprofile-detail'):
+            return self.profile_ids[0]
+        basename = name.removeprefix('async_').rsplit('-', 1)[0]
+        viewset = next(viewset for _, viewset, base in router.registry if base == basename)
+        return viewset.queryset.order_by('pk').values_list('pk', flat=True).first()
+
+    def build_request(self, name, pattern, size):
+        """(method, path, data) of one request to a route, sized by size"""
+        kwargs = {}
+        if 'pk' in pattern.pattern.regex.groupindex:
+            kwargs['pk'] = self.detail_pk(name)
+        if 'export_format' in pattern.pattern.regex.groupindex:
+            kwargs['export_format'] = 'csv'
+        path = reverse(name, kwargs=kwargs)
+
+        if name == 'userprofile-bulk-partial-update':
+            return 'patch', path, [
+                {'id': pk, 'salary': 5000 + size} for pk in self.profile_ids[:size]
+            ]
+        if name == 'employee_import-list':
+            return 'post', path, [
+                {'username': f'import{size}-{i}', 'job_title': 'Title 1', 'city': 'City 1', 'salary': 1000}
+                for i in range(size)
+            ]
+        if name == 'geography-list':
+            # Every tree is built once per version, so each size asks for another country
+            country = Country.objects.order_by('pk')[self.sizes.index(size)]
+            return 'get', f'{path}?country={country.pk}', None
+        if name in ('presence-heartbeat', 'presence-leave'):
+            return 'post', path, None
+        return 'get', f'{path}?page_size={size}', None
+
+    def call(self, method, path, data):
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(path, data, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return response, len(queries), time.perf_counter() - started
+
+    def test_every_route_has_a_budget(self):
+        self.assertEqual(set(routes()), set(QUERY_BUDGETS))
+
+    def test_query_budgets(self):
+        for name, pattern in routes().items():
+            if name not in QUERY_BUDGETS:
+                continue
+            with self.subTest(route=name):
+                counts = []
+                for size in self.sizes:
+                    response, count, _ = self.call(*self.build_request(name, pattern, size))
+                    self.assertLess(response.status_code, 300, f'{name}: {response.status_code}')
+                    counts.append(count)
+                self.assertEqual(counts[0], counts[1], f'{name}: query count grows with the page size')
+                self.assertLessEqual(counts[0], QUERY_BUDGETS[name], f'{name}: over its query budget')
+
+                for _ in range(BENCHMARK_ROUNDS - 1):
+                    method, path, data = self.build_request(name, pattern, self.sizes[0])
+                    if method == 'get':
+                        self.timings.setdefault(name, []).append(self.call(method, path, data)[2])
+
+
+class ConditionalGetTests(AdminAPITestCase):
+    """Revalidation of list/detail responses through ETag and Last-Modified"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        governorate = Governorate.objects.create(name='Cairo', country=Country.objects.create(name='Egypt'))
+        cls.city = City.objects.create(name='Cairo', governorate=governorate)
+
+    def test_unchanged_collection_is_not_modified(self):
+        path = reverse('city-list')
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        with self.assertNumQueries(0):
+            response = self.client.get(path, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_async_views_revalidate(self):
+        detail = reverse('async_userprofile-detail', kwargs={'pk': self.admin.userprofile.pk})
+        for path in (reverse('async_city-list'), detail):
+            with self.subTest(path=path):
+                response = self.client.get(path)
+                self.assertEqual(response.status_code, 200)
+                with self.assertNumQueries(0):
+                    not_modified = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(not_modified.status_code, 304)
+                self.assertEqual(not_modified['ETag'], response['ETag'])
+        # Presence is not versioned, so ?is_online is always served in full
+        response = self.client.get(reverse('async_userprofile-list'), {'is_online': 'true'})
+        self.assertNotIn('ETag', response)
+
+    def test_write_changes_the_etag(self):
+        path = reverse('userprofile-detail', kwargs={'pk': self.admin.userprofile.pk})
+        etag = self.client.get(path)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.admin.pk).get().save(update_fields=['last_login'])
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.city.name = 'Giza'
+            self.city.save()
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_evicted_version_changes_the_etag(self):
+        path = reverse('city-list')
+        etag = self.client.get(path)['ETag']
+        cache.delete(VERSION_KEY.format(label=City._meta.label_lower))
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_profile_validators_change_with_the_day(self):
+        path = reverse('userprofile-detail', kwargs={'pk': self.admin.userprofile.pk})
+        midnight = time.time() + 3600
+        with mock.patch('accounts.cache.current_days', return_value=('today', 0)):
+            response = self.client.get(path)
+        with mock.patch('accounts.cache.current_days', return_value=('tomorrow', midnight)):
+            self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+            response = self.client.get(path, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Last-Modified'], http_date(math.ceil(midnight)))
+
+
+class StaticFilesTests(SimpleTestCase):
+    """uvicorn serves no files, the admin's static files come from WhiteNoise"""
+
+    @override_settings(WHITENOISE_USE_FINDERS=True)
+    def test_admin_static_files_are_served(self):
+        response = self.client.get(f'{settings.STATIC_URL}admin/css/base.css')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/css'))
+
+
+class AsOfTests(AdminAPITestCase):
+    """?as_of= answers with the job title and salary in effect at a past moment"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.profile = cls.admin.userprofile
+        cls.profile.salary = 2000
+        cls.profile.save()
+        SalaryHistory.objects.filter(user_profile=cls.profile).delete()
+        cls.moment = timezone.now() - timedelta(days=30)
+        SalaryHistory.objects.create(
+            user_profile=cls.profile, amount=1000,
+            start=cls.moment - timedelta(days=30), end=cls.moment + timedelta(days=1),
+        )
+        SalaryHistory.objects.create(user_profile=cls.profile, amount=2000, start=cls.moment + timedelta(days=1))
+
+    def test_profile_as_of(self):
+        path = reverse('userprofile-detail', kwargs={'pk': self.profile.pk})
+        self.assertEqual(self.client.get(path).data['salary'], 2000)
+        self.assertEqual(self.client.get(path, {'as_of': self.moment.isoformat()}).data['salary'], 1000)
+        self.assertEqual(self.client.get(path, {'as_of': 'yesterday'}).status_code, 400)
+
+        response = self.client.get(reverse('userprofile-list'), {'as_of': self.moment.date().isoformat()})
+        self.assertEqual([row['salary'] for row in response.data['results']], [1000])
+
+    def test_async_profile_as_of(self):
+        as_of = {'as_of': self.moment.date().isoformat()}
+        response = self.client.get(reverse('async_userprofile-list'), as_of)
+        self.assertEqual([row['salary'] for row in response.json()['results']], [1000])
+        path = reverse('async_userprofile-detail', kwargs={'pk': self.profile.pk})
+        self.assertEqual(self.client.get(path, as_of).json()['salary'], 1000)
+
+    def test_history_as_of(self):
+        response = self.client.get(reverse('salary_history-list'), {'as_of': self.moment.isoformat()})
+        self.assertEqual([row['amount'] for row in response.data['results']], [1000])
+
+
+class ProfileSerializerEquivalenceTests(TestCase):
+    """The values()-based list serializer renders exactly what the detail serializer does"""
+
+    @classmethod
+    def setUpTestData(cls):
+        governorate = Governorate.objects.create(name='Cairo', country=Country.objects.create(name='Egypt'))
+        city = City.objects.create(name='Maadi', governorate=governorate)
+        title = JobTitle.objects.create(name='Engineer')
+        # History is not under test, so the profiles are written without it
+        UserProfile.objects.filter(user=User.objects.create_user('leapling', 'leapling@example.com')).update(
+            date_of_birth=date(2000, 2, 29), start=date(2020, 2, 29), job_title=title, salary=1000,
+            city=city, governorate=governorate, country=governorate.country, address='Street 9', gender='F',
+        )
+        UserProfile.objects.filter(user=User.objects.create_user('regular')).update(
+            date_of_birth=date(1990, 3, 1), start=date(2024, 2, 28),
+        )
+        # And a profile with every date, name and amount left NULL
+        User.objects.create_user('blank')
+
+    def render(self, data):
+        return json.loads(json.dumps(data, cls=JSONEncoder))
+
+    def test_list_matches_detail(self):
+        queryset = UserProfileViewSet.queryset.order_by('pk')
+        days = [date(2024, 2, 28), date(2024, 2, 29), date(2024, 3, 1), date(2025, 2, 28), date(2025, 3, 1)]
+        for day in days:
+            with self.subTest(today=day), mock.patch('accounts.models.date') as model_date, mock.patch(
+                'accounts.serializers.timezone.now',
+                return_value=timezone.now().replace(year=day.year, month=day.month, day=day.day),
+            ):
+                model_date.today.return_value = day
+                serializer = UserProfileListSerializer(today=day)
+                rows = serializer.many(serializer.get_queryset(queryset))
+                details = [UserProfileDetailSerializer(profile).data for profile in queryset]
+                self.assertEqual(self.render(rows), self.render(details))
+        self.assertEqual([row['age'] for row in self.render(rows)], [25, 35, None])
+
+
+class GeographyTreeTests(AdminAPITestCase):
+    """The nested geography document is built once per version and served compressed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.country = Country.objects.create(name='Egypt')
+        cls.governorate = Governorate.objects.create(name='Cairo', country=cls.country)
+        cls.city = City.objects.create(name='Maadi', governorate=cls.governorate)
+
+    def test_tree_is_cached_until_geography_changes(self):
+        path = reverse('geography-list')
+        response = self.client.get(path)
+        self.assertEqual(response.json(), {'countries': [{
+            'id': self.country.pk, 'name': 'Egypt', 'governorates': [{
+                'id': self.governorate.pk, 'name': 'Cairo', 'cities': [{'id': self.city.pk, 'name': 'Maadi'}],
+            }],
+        }]})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.city.name = 'Zamalek'
+            self.city.save()
+        response = self.client.get(path, {'governorate': self.governorate.pk}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content))['governorate']['cities'][0]['name'], 'Zamalek')
+        self.assertEqual(self.client.get(path, {'country': 0}).status_code, 404)
+
+
+class ProfileGeographyTests(TestCase):
+    """The governorate and country copied onto profiles follow their city"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.egypt, cls.sudan = Country.objects.bulk_create([Country(name='Egypt'), Country(name='Sudan')])
+        cls.cairo = Governorate.objects.create(name='Cairo', country=cls.egypt)
+        cls.giza = Governorate.objects.create(name='Giza', country=cls.egypt)
+        cls.city = City.objects.create(name='Maadi', governorate=cls.cairo)
+        cls.profile = User.objects.create_user('employee').userprofile
+
+    def keys(self):
+        self.profile.refresh_from_db()
+        return self.profile.governorate_id, self.profile.country_id
+
+    def test_receivers_keep_keys_in_step(self):
+        self.profile.city = self.city
+        self.profile.save(update_fields=['city'])
+        self.assertEqual(self.keys(), (self.cairo.pk, self.egypt.pk))
+
+        self.city.governorate = self.giza
+        self.city.save()
+        self.assertEqual(self.keys(), (self.giza.pk, self.egypt.pk))
+        self.giza.country = self.sudan
+        self.giza.save()
+        self.assertEqual(self.keys(), (self.giza.pk, self.sudan.pk))
+
+        self.city.delete()
+        self.assertEqual(self.keys(), (None, None))
+
+    def test_unchanged_parents_are_not_synced(self):
+        self.profile.city = self.city
+        self.profile.save()
+
+        def statements(write):
+            with CaptureQueriesContext(connection) as queries:
+                write()
+            return [query['sql'] for query in queries]
+
+        def touching(sql, table):
+            return [statement for statement in sql if table in statement]
+
+        self.profile.address = 'Somewhere else'
+        self.assertFalse(touching(statements(self.profile.save), 'accounts_city'))
+        self.city.name = 'New Maadi'
+        self.assertFalse(touching(statements(self.city.save), 'accounts_userprofile'))
+        self.cairo.name = 'Greater Cairo'
+        self.assertFalse(touching(statements(self.cairo.save), 'accounts_userprofile'))
+        empty = City.objects.create(name='Empty', governorate=self.cairo)
+        deleted = statements(empty.delete)
+        # Only the SET NULL of the delete itself
+        self.assertEqual(len([sql for sql in touching(deleted, 'accounts_userprofile') if sql.startswith('UPDATE')]), 1)
+        self.assertEqual(self.keys(), (self.cairo.pk, self.egypt.pk))
+
+    def test_check_and_backfill(self):
+        UserProfile.objects.filter(pk=self.profile.pk).update(city=self.city)
+        with self.assertRaises(CommandError):
+            call_command('check_profile_geography', stderr=io.StringIO())
+        call_command('backfill_profile_geography', stdout=io.StringIO())
+        self.assertEqual(self.keys(), (self.cairo.pk, self.egypt.pk))
+        call_command('check_profile_geography', stdout=io.StringIO())
+
+
+class ProfileHistoryTests(TestCase):
+    """Saving a profile records its job title and salary periods"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.engineer, cls.manager = JobTitle.objects.bulk_create([JobTitle(name='Engineer'), JobTitle(name='Manager')])
+
+    def setUp(self):
+        self.profile = User.objects.create_user('employee').userprofile
+
+    def periods(self, model, field):
+        return list(model.objects.filter(user_profile=self.profile).order_by('pk').values_list(field, 'start', 'end'))
+
+    def save_at(self, **changes):
+        """Save the changes and return the time window the save happened in"""
+        for field, value in changes.items():
+            setattr(self.profile, field, value)
+        before = timezone.now()
+        self.profile.save()
+        return before, timezone.now()
+
+    def test_job_title_change_rotates_history(self):
+        self.save_at(job_title=self.engineer)
+        before, after = self.save_at(job_title=self.manager)
+
+        *_, (previous_title, _, closed_at), (title, opened_at, end) = self.periods(JobTitleHistory, 'job_title')
+        self.assertEqual((previous_title, title, end), (self.engineer.pk, self.manager.pk, None))
+        self.assertEqual(closed_at, opened_at)
+        self.assertTrue(before <= opened_at <= after)
+
+    def test_salary_change_rotates_history(self):
+        self.save_at(salary=1000)
+        before, after = self.save_at(salary=1500)
+
+        (first, _, closed_at), (second, opened_at, end) = self.periods(SalaryHistory, 'amount')
+        self.assertEqual((first, second, end), (1000, 1500, None))
+        self.assertEqual(closed_at, opened_at)
+        self.assertTrue(before <= opened_at <= after)
+
+    def test_failed_save_writes_no_history(self):
+        self.save_at(salary=1000)
+        rows = self.periods(SalaryHistory, 'amount')
+        with mock.patch.object(UserProfile, '_save_table', side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            self.save_at(salary=1500)
+        self.assertEqual(self.periods(SalaryHistory, 'amount'), rows)
+
+    def test_unchanged_save_writes_no_history(self):
+        self.save_at(salary=1000)
+        rows = self.periods(SalaryHistory, 'amount')
+        self.save_at(address='Somewhere else')
+        self.assertEqual(self.periods(SalaryHistory, 'amount'), rows)
+
+
+
+class HistoryPeriodCleanupTests(TestCase):
+    """Migration 0009 fixes up existing history rows before forbidding overlaps"""
+
+    def test_overlapping_periods_are_closed(self):
+        migration = importlib.import_module('accounts.migrations.0009_history_period_constraints')
+        with suppress_receivers():
+            broken, clean = UserProfile.objects.bulk_create([
+                UserProfile(user=User.objects.create_user(name)) for name in ('broken', 'clean')
+            ])
+        earlier = timezone.now() - timedelta(days=2)
+        later = earlier + timedelta(days=1)
+        first, second, third = SalaryHistory.objects.bulk_create([
+            SalaryHistory(user_profile=broken, amount=amount, start=start)
+            for amount, start in ((1000, None), (1100, None), (1200, earlier))
+        ])
+        SalaryHistory.objects.bulk_create([
+            SalaryHistory(user_profile=clean, amount=1000, start=earlier, end=later),
+            SalaryHistory(user_profile=clean, amount=1100, start=later),
+        ])
+
+        self.assertEqual(migration.close_overlapping_periods(SalaryHistory), 3)
+        for row in (first, second, third):
+            row.refresh_from_db()
+        # Only the first row stays open at the start, only the latest at the end
+        self.assertEqual((first.start, first.end), (None, earlier))
+        self.assertEqual((third.start, third.end), (earlier, second.updated_at))
+        self.assertEqual((second.start, second.end), (second.updated_at, None))
+        self.assertEqual(migration.close_overlapping_periods(SalaryHistory), 0)
+
+class ReceiverModeTests(TestCase):
+    """suppress_receivers skips the history receivers, defer_receivers batches them"""
+
+    def setUp(self):
+        User.objects.bulk_create([User(username=f'employee{n}') for n in range(3)])
+        with suppress_receivers():
+            UserProfile.objects.bulk_create([UserProfile(user=user, salary=1000) for user in User.objects.all()])
+        self.profiles = list(UserProfile.objects.order_by('pk'))
+
+    def salaries(self):
+        return list(SalaryHistory.objects.order_by('user_profile', 'pk').values_list('user_profile', 'amount', 'end'))
+
+    def raise_salaries(self, *amounts):
+        for amount in amounts:
+            for profile in self.profiles:
+                profile.salary = amount
+                profile.save()
+
+    def test_suppress_skips_history(self):
+        with suppress_receivers():
+            self.raise_salaries(1500)
+        self.assertEqual(self.salaries(), [])
+        self.raise_salaries(2000)
+        self.assertEqual(len(self.salaries()), 3)
+
+    def test_defer_records_net_change_once(self):
+        with defer_receivers():
+            self.raise_salaries(1200, 1500)
+            self.assertEqual(self.salaries(), [])
+        self.assertEqual([amount for _, amount, end in self.salaries() if end is None], [1500] * 3)
+        self.assertEqual(len(self.salaries()), 3)
+
+    def test_defer_reads_loaded_profiles_without_queries(self):
+        with defer_receivers(), CaptureQueriesContext(connection) as queries:
+            self.raise_salaries(1500)
+            selects = [query for query in queries if query['sql'].startswith('SELECT')]
+        self.assertEqual(selects, [])
+        # Instances not loaded from the database are read in one query
+        batch = ReceiverBatch()
+        with self.assertNumQueries(1):
+            batch.remember([UserProfile(pk=profile.pk) for profile in self.profiles])
+        self.assertEqual({row['salary'] for row in batch.previous.values()}, {1500})
+
+    def test_nested_defer_flushes_at_outermost_exit(self):
+        with defer_receivers() as outer:
+            with defer_receivers() as inner:
+                self.raise_salaries(1500)
+            self.assertIs(inner, outer)
+            self.assertEqual(self.salaries(), [])
+        self.assertEqual(len(self.salaries()), 3)
+
+    def test_error_skips_flush(self):
+        with self.assertRaises(RuntimeError), defer_receivers():
+            self.raise_salaries(1500)
+            raise RuntimeError
+        self.assertEqual(self.salaries(), [])
+
+
+class BulkProfileUpdateTests(AdminAPITestCase):
+    """PATCH /user-profiles/bulk/ updates many profiles and records their history"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.profiles = [User.objects.create_user(f'employee{i}').userprofile for i in range(3)]
+
+    def test_bulk_update_writes_history(self):
+        payload = [{'id': str(profile.pk), 'salary': 2000 + i} for i, profile in enumerate(self.profiles)]
+        response = self.client.patch(reverse('userprofile-bulk-partial-update'), payload, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data, {'updated': 3})
+
+        for i, profile in enumerate(self.profiles):
+            profile.refresh_from_db()
+            self.assertEqual(profile.salary, 2000 + i)
+            self.assertEqual(
+                list(SalaryHistory.objects.filter(user_profile=profile).values_list('amount', 'end')),
+                [(2000 + i, None)],
+            )
+
+    def test_invalid_ids_are_rejected(self):
+        path = reverse('userprofile-bulk-partial-update')
+        response = self.client.patch(path, [{'id': 'five', 'salary': 1}, {'id': 0, 'salary': 1}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('id', response.data[0])
+        self.assertIn('id', response.data[1])
+        self.assertFalse(SalaryHistory.objects.exists())
+
+
+class KeysetPaginationTests(AdminAPITestCase):
+    """?pagination=cursor walks every row once, ties and NULLs included"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        profile = cls.admin.userprofile
+        moment = timezone.now()
+        # Ties on start, and NULL starts that sort after every date
+        starts = [moment, None, moment - timedelta(days=1), moment, None, moment, moment - timedelta(days=2)]
+        SalaryHistory.objects.bulk_create([
+            SalaryHistory(user_profile=profile, amount=1000 + i, start=start) for i, start in enumerate(starts)
+        ])
+        Deduction.objects.bulk_create([
+            Deduction(user_profile=profile, name=f'Deduction {i}', amount=10, date=start)
+            for i, start in enumerate(starts)
+        ])
+
+    def walk(self, path, key):
+        """Follow the next links from the first cursor page, returning the keys seen"""
+        seen = []
+        response = self.client.get(path, {'pagination': 'cursor', 'page_size': 2})
+        while True:
+            self.assertEqual(response.status_code, 200, response.content)
+            seen.extend(row[key] for row in response.json()['results'])
+            if not response.json()['next']:
+                return seen
+            response = self.client.get(response.json()['next'])
+
+    def expected(self, queryset, field, descending):
+        rows = list(queryset.values_list(field, 'pk'))
+        dated = sorted((row for row in rows if row[0] is not None), reverse=descending)
+        undated = sorted((row for row in rows if row[0] is None), reverse=descending)
+        return undated + dated if descending else dated + undated
+
+    def test_ascending_with_ties_and_nulls(self):
+        expected = [pk for _, pk in self.expected(SalaryHistory.objects.all(), 'start', descending=False)]
+        amounts = dict(SalaryHistory.objects.values_list('amount', 'pk'))
+        for name in ('salary_history-list', 'async_salary_history-list'):
+            with self.subTest(route=name):
+                self.assertEqual([amounts[amount] for amount in self.walk(reverse(name), 'amount')], expected)
+
+    def test_descending_with_ties_and_nulls(self):
+        expected = [pk for _, pk in self.expected(Deduction.objects.all(), 'date', descending=True)]
+        names = dict(Deduction.objects.values_list('name', 'pk'))
+        self.assertEqual([names[name] for name in self.walk(reverse('deduction-list'), 'name')], expected)
+
+    def test_ordering_is_rejected_in_cursor_mode(self):
+        response = self.client.get(reverse('deduction-list'), {'pagination': 'cursor', 'ordering': 'amount'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ordering', response.data)
+
+
+class ShortestUsernameBackend(ContainsSearchBackend):
+    """Ranks the shortest usernames first, standing in for trigram similarity on SQLite"""
+
+    def rank(self, queryset, search_fields, terms):
+        ordering = queryset.query.order_by
+        return queryset.annotate(search_rank=-Length('user__username')).order_by('-search_rank', *ordering)
+
+
+class SearchTests(AdminAPITestCase):
+    """?search= matches every term on any search field, ?rank=true orders by relevance"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        names = ['alice', 'alicia', 'bob', 'alexandria']
+        cls.users = {name: User.objects.create_user(name, f'{name}@example.com') for name in names}
+        UserProfile.objects.filter(user=cls.users['bob']).update(address='12 Alice Street, Cairo', salary=200)
+        UserProfile.objects.filter(user=cls.users['alice']).update(address='Giza', salary=100)
+        UserProfile.objects.filter(user=cls.users['alicia']).update(salary=300)
+        UserProfile.objects.filter(user=cls.users['alexandria']).update(salary=400)
+
+    def search(self, **params):
+        response = self.client.get(reverse('userprofile-list'), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [row['user'] for row in response.json()['results']]
+
+    def test_terms_match_any_field(self):
+        self.assertCountEqual(self.search(search='ALIC'), ['alice', 'alicia', 'bob'])
+        # Every term has to match, each on any field
+        self.assertEqual(self.search(search='alic giza'), ['alice'])
+        self.assertEqual(self.search(search='example.com cairo'), ['bob'])
+        self.assertEqual(self.search(search='nobody'), [])
+
+    def test_predicates_are_single_table(self):
+        view = UserProfileViewSet()
+        request = Request(RequestFactory().get('/', {'search': 'alic giza'}))
+        queryset = RankedSearchFilter().filter_queryset(request, UserProfile.objects.all(), view)
+        # profile.id IN (a union of queries that each read one table), once per term
+        self.assertEqual(len(queryset.query.where.children), 2)
+        for condition in queryset.query.where.children:
+            self.assertEqual(condition.lhs.target, UserProfile._meta.pk)
+            self.assertEqual(len(condition.rhs.combined_queries), 3)
+        self.assertNotIn('JOIN', str(queryset.query))
+        self.assertEqual([profile.user.username for profile in queryset], ['alice'])
+
+    def test_single_table_fields_use_plain_search(self):
+        Deduction.objects.create(user_profile=self.admin.userprofile, name='Loan', discription='car', amount=10)
+        response = self.client.get(reverse('deduction-list'), {'search': 'loan car'})
+        self.assertEqual([row['name'] for row in response.json()['results']], ['Loan'])
+
+    @override_settings(ACCOUNTS_SEARCH_BACKEND='accounts.tests.ShortestUsernameBackend')
+    def test_rank_orders_by_relevance(self):
+        self.assertEqual(self.search(search='al', rank='true'), ['bob', 'alice', 'alicia', 'alexandria'])
+        # Without ?rank the requested ordering applies
+        self.assertEqual(self.search(search='al', ordering='-salary'), ['alexandria', 'alicia', 'bob', 'alice'])
+
+    def test_backend_selection(self):
+        self.assertIsInstance(get_search_backend(), ContainsSearchBackend)
+        self.assertNotIsInstance(get_search_backend(), TrigramSearchBackend)
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            self.assertIsInstance(get_search_backend(), TrigramSearchBackend)
+        with override_settings(ACCOUNTS_SEARCH_BACKEND='accounts.search.TrigramSearchBackend'):
+            self.assertIsInstance(get_search_backend(), TrigramSearchBackend)
+
+    def test_trigram_rank_keeps_ordering_as_tie_breaker(self):
+        queryset = TrigramSearchBackend().rank(
+            UserProfile.objects.order_by('-start'), ['user__username', 'address'], ['alic']
+        )
+        self.assertIn('search_rank', queryset.query.annotations)
+        self.assertEqual(queryset.query.order_by, ('-search_rank', '-start'))
+        # Unranked on SQLite
+        queryset = UserProfile.objects.order_by('-start')
+        self.assertIs(ContainsSearchBackend().rank(queryset, ['address'], ['alic']), queryset)
+
+
+class DeductionSummaryTests(AdminAPITestCase):
+    """Deduction summaries report the totals, counts and latest deduction per profile"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.profile = User.objects.create_user('employee').userprofile
+        cls.idle = User.objects.create_user('idle').userprofile
+        now = timezone.now()
+        Deduction.objects.bulk_create([
+            Deduction(user_profile=cls.profile, name='Old', amount=10, date=now - timedelta(days=60)),
+            Deduction(user_profile=cls.profile, name='Latest', amount=20, date=now - timedelta(days=1)),
+            Deduction(user_profile=cls.profile, name='Undated', amount=30, date=None),
+            Deduction(user_profile=cls.admin.userprofile, name='Other', amount=99, date=now),
+        ])
+        cls.cutoff = (now - timedelta(days=30)).isoformat()
+
+    def test_profile_summary(self):
+        path = reverse('userprofile-deductions-summary', kwargs={'pk': self.profile.pk})
+        data = self.client.get(path).data
+        self.assertEqual((data['total_deductions'], data['deduction_count']), (60, 3))
+        self.assertEqual(data['latest_deduction']['name'], 'Latest')
+
+        data = self.client.get(path, {'date_after': self.cutoff}).data
+        self.assertEqual((data['total_deductions'], data['deduction_count']), (20, 1))
+
+    def test_summaries_of_many_profiles(self):
+        response = self.client.get(
+            reverse('userprofile-deductions-summaries'), {'ids': f'{self.profile.pk},{self.idle.pk}'}
+        )
+        summaries = {row['user']: row for row in response.data['results']}
+        self.assertEqual(set(summaries), {'employee', 'idle'})
+        self.assertEqual(summaries['employee']['total_deductions'], 60)
+        self.assertEqual(
+            {key: summaries['idle'][key] for key in ('total_deductions', 'deduction_count', 'latest_deduction')},
+            {'total_deductions': 0, 'deduction_count': 0, 'latest_deduction': None},
+        )
+
+
+class PayrollRollupTests(TestCase):
+    """Rollups kept up to date by the receivers match a full rebuild"""
+
+    def snapshot(self):
+        return {
+            (row['user_profile'], row['period']): row
+            for row in PayrollRollup.objects.values(
+                'user_profile', 'period', 'salary', 'total_deductions', 'deduction_count', 'net'
+            )
+        }
+
+    def test_incremental_rollups_match_rebuild(self):
+        profiles = [User.objects.create_user(f'employee{i}').userprofile for i in range(3)]
+        now = timezone.now()
+        for i, profile in enumerate(profiles):
+            profile.salary = 5000 + i * 100
+            profile.save()
+        deductions = [
+            Deduction.objects.create(user_profile=profile, name=f'D{n}', amount=10 * (n + 1), date=now - timedelta(days=40 * n))
+            for profile in profiles for n in range(4)
+        ]
+        # Sparse changes: move one deduction to another month, delete one, raise one salary
+        deductions[1].date = now - timedelta(days=200)
+        deductions[1].save()
+        deductions[6].delete()
+        profiles[2].salary = 7000
+        profiles[2].save()
+
+        seed_rollups()
+        incremental = self.snapshot()
+        rebuild_rollups()
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_seed_covers_every_month_since_joining(self):
+        quiet = User.objects.create_user('quiet', date_joined=timezone.now() - timedelta(days=70)).userprofile
+        PayrollRollup.objects.all().delete()
+        periods = seeded_periods(quiet.user.date_joined)
+        self.assertEqual(len(periods), len(set(periods)))
+        self.assertTrue(3 <= len(periods) <= 4)
+
+        self.assertEqual(seed_rollups(), len(periods))
+        rows = PayrollRollup.objects.filter(user_profile=quiet).order_by('period')
+        self.assertEqual([row.period for row in rows], periods)
+        self.assertEqual({row.deduction_count for row in rows}, {0})
+        self.assertEqual(seed_rollups(), 0)
+
+
+class CachedResponseTests(AdminAPITestCase):
+    """Cached list/detail responses are dropped by writes to their collections"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.country = Country.objects.create(name='Egypt')
+
+    def names(self):
+        return [row['name'] for row in self.client.get(reverse('country-list')).data['results']]
+
+    def test_write_invalidates_list_and_detail(self):
+        detail = reverse('country-detail', kwargs={'pk': self.country.pk})
+        self.assertEqual(self.names(), ['Egypt'])
+        self.assertEqual(self.client.get(detail).data['name'], 'Egypt')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names(), ['Egypt'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.country.name = 'Sudan'
+            self.country.save()
+            Country.objects.create(name='Libya')
+        self.assertEqual(sorted(self.names()), ['Libya', 'Sudan'])
+        self.assertEqual(self.client.get(detail).data['name'], 'Sudan')
+
+    def test_evicted_version_does_not_revive_cached_responses(self):
+        self.assertEqual(self.names(), ['Egypt'])
+        # A write the cache never heard of, then the version counter is evicted
+        Country.objects.bulk_create([Country(name='Libya')])
+        cache.delete(VERSION_KEY.format(label=Country._meta.label_lower))
+        self.assertEqual(sorted(self.names()), ['Egypt', 'Libya'])
+
+
+class RevocationListTests(TestCase):
+    """Revoked access tokens are known in-process, refreshed from the blacklist table"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('employee')
+        self.token = str(AccessToken.for_user(self.user))
+        self.expires_at = token_expiry(self.token)
+        revoked_tokens.clear()
+        self.addCleanup(revoked_tokens.clear)
+
+    def test_add_and_expiry(self):
+        revocations = RevocationList(refresh_interval=60)
+        revocations.refresh()
+        revocations.add(token_digest(self.token), self.expires_at)
+        self.assertTrue(revocations.is_revoked(self.token))
+        revocations.add(token_digest(self.token), timezone.now() - timedelta(seconds=1))
+        self.assertFalse(revocations.is_revoked(self.token))
+
+    def test_refresh_picks_up_other_processes(self):
+        revocations = RevocationList(refresh_interval=60)
+        self.assertFalse(revocations.is_revoked(self.token))
+        # Written by another process: no receiver runs here
+        BlacklistedAccessToken.objects.bulk_create([
+            BlacklistedAccessToken(digest=token_digest(self.token), expires_at=self.expires_at)
+        ])
+        with self.assertNumQueries(0):
+            self.assertFalse(revocations.is_revoked(self.token))
+        revocations.refresh(force=True)
+        self.assertTrue(revocations.is_revoked(self.token))
+
+    def test_refresh_picks_up_late_commits(self):
+        revocations = RevocationList(refresh_interval=60, reload_interval=3600)
+        BlacklistedAccessToken.objects.bulk_create([
+            BlacklistedAccessToken(pk=100, digest='committed', expires_at=self.expires_at),
+        ])
+        now = time.time()
+        with mock.patch('accounts.authentication.time.time', return_value=now):
+            revocations.refresh()
+        # Created before that refresh but committed after it, behind a higher id
+        late, stale = BlacklistedAccessToken.objects.bulk_create([
+            BlacklistedAccessToken(pk=50, digest=token_digest(self.token), expires_at=self.expires_at),
+            BlacklistedAccessToken(pk=60, digest='stale', expires_at=self.expires_at),
+        ])
+        BlacklistedAccessToken.objects.filter(pk=late.pk).update(created_at=timezone.now() - timedelta(seconds=30))
+        BlacklistedAccessToken.objects.filter(pk=stale.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        with mock.patch('accounts.authentication.time.time', return_value=now + 61):
+            revocations.refresh()
+        self.assertTrue(revocations.is_revoked(self.token))
+        # Only the overlap is re-read, not the whole table
+        self.assertNotIn('stale', revocations._entries)
+
+    def test_receiver_revokes_on_commit(self):
+        revoked_tokens.refresh(force=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            BlacklistedAccessToken.objects.create(digest=token_digest(self.token), expires_at=self.expires_at)
+            self.assertFalse(revoked_tokens.is_revoked(self.token))
+        self.assertTrue(revoked_tokens.is_revoked(self.token))
+
+
+@modify_settings(MIDDLEWARE={'remove': 'accounts.profiling.ProfilingMiddleware'})
+class TokenBlacklistTests(TestCase):
+    """Blacklisted access tokens are refused, and expired ones are purged"""
+
+    def setUp(self):
+        revoked_tokens.clear()
+        self.addCleanup(revoked_tokens.clear)
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.token = str(AccessToken.for_user(self.admin))
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def test_blacklisted_token_is_refused(self):
+        path = reverse('country-list')
+        self.assertEqual(self.client.get(path).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('blacklist-list'), {'token': self.token}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['digest'], token_digest(self.token))
+        self.assertEqual(self.client.get(path).status_code, 401)
+
+    def test_purge_expired_tokens(self):
+        now = timezone.now()
+        BlacklistedAccessToken.objects.bulk_create([
+            BlacklistedAccessToken(digest='expired', expires_at=now - timedelta(minutes=1)),
+            BlacklistedAccessToken(digest='valid', expires_at=now + timedelta(minutes=1)),
+        ])
+        LoggedInUser.objects.create(
+            user=self.admin, access_token_digest='session', access_token_expires_at=now - timedelta(minutes=1)
+        )
+        call_command('purge_expired_tokens', batch_size=1, stdout=io.StringIO())
+        self.assertEqual(list(BlacklistedAccessToken.objects.values_list('digest', flat=True)), ['valid'])
+        self.assertEqual(
+            LoggedInUser.objects.values_list('access_token_digest', 'access_token_expires_at').get(),
+            (None, None),
+        )
+
+
+class PresenceTests(AdminAPITestCase):
+    """Presence is paged and filtered from the store and flushed to LoggedInUser"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.users = [User.objects.create_user(f'employee{i}') for i in range(5)]
+
+    def setUp(self):
+        super().setUp()
+        presence.clear()
+        self.addCleanup(presence.clear)
+        for user in self.users[:3]:
+            presence.heartbeat(user.pk)
+
+    def test_list_pages_through_the_store(self):
+        response = self.client.get(reverse('presence-list'), {'page_size': 2, 'page': 2})
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual([row['username'] for row in response.data['results']], ['employee2'])
+
+    def test_is_online_filter(self):
+        path = reverse('userprofile-list')
+        online = self.client.get(path, {'is_online': 'true'}).data['results']
+        self.assertEqual(sorted(row['user'] for row in online), ['employee0', 'employee1', 'employee2'])
+        offline = self.client.get(path, {'is_online': 'false'}).data['results']
+        self.assertEqual(sorted(row['user'] for row in offline), ['admin', 'employee3', 'employee4'])
+
+    def test_online_ids_are_one_parameter(self):
+        ids = [user.pk for user in self.users]
+        queryset = UserProfile.objects.filter(ContainedIn('user_id', ids))
+        _, params = queryset.query.sql_with_params()
+        self.assertEqual(len(params), 1)
+        self.assertEqual(sorted(queryset.values_list('user_id', flat=True)), ids)
+
+    def test_async_is_online_filter(self):
+        response = self.client.get(reverse('async_userprofile-list'), {'is_online': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(row['user'] for row in response.json()['results']), ['employee0', 'employee1', 'employee2'])
+
+    def test_login_lasts_until_logout(self):
+        user = self.users[4]
+        self.client.logout()
+        self.client.force_login(user)
+        with mock.patch('accounts.presence.time.time', return_value=time.time() + 24 * 60 * 60):
+            self.assertTrue(presence.is_online(user.pk))
+        self.client.logout()
+        self.assertFalse(presence.is_online(user.pk))
+
+    def test_flush_presence(self):
+        LoggedInUser.objects.create(user=self.users[4], is_online=True)
+        LoggedInUser.objects.create(user=self.users[0], is_online=False)
+        call_command('flush_presence', batch_size=2, stdout=io.StringIO())
+        self.assertEqual(
+            sorted(LoggedInUser.objects.filter(is_online=True).values_list('user__username', flat=True)),
+            ['employee0', 'employee1', 'employee2'],
+        )
+        self.assertFalse(LoggedInUser.objects.get(user=self.users[4]).is_online)
+
+
+class StreamingExportTests(AdminAPITestCase):
+    """Exports stream every filtered row, matching the list API's fields"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.profile = User.objects.create_user('employee').userprofile
+        now = timezone.now()
+        Deduction.objects.bulk_create([
+            Deduction(user_profile=cls.profile, name=f'Deduction, {i}', amount=10 + i, date=now - timedelta(days=i))
+            for i in range(7)
+        ] + [Deduction(user_profile=cls.admin.userprofile, name='Other', amount=1, date=now)])
+
+    def export(self, export_format, **params):
+        path = reverse('deduction-export', kwargs={'export_format': export_format})
+        response = self.client.get(path, {'user_profile': self.profile.pk, **params})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    @mock.patch('accounts.views.DeductionViewSet.export_lines_per_write', 3)
+    def test_csv(self):
+        response, content = self.export('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('attachment; filename="deduction.csv"', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(list(rows[0]), list(DeductionListSerializer.fields))
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[0]['name'], 'Deduction, 0')
+
+    def test_ndjson_matches_list(self):
+        _, content = self.export('ndjson', ordering='amount')
+        exported = [json.loads(line) for line in content.splitlines()]
+        listed = self.client.get(
+            reverse('deduction-list'), {'user_profile': self.profile.pk, 'ordering': 'amount', 'page_size': 100}
+        ).json()['results']
+        self.assertEqual(exported, listed)
+
+    def test_values_serializer_requires_columns(self):
+        class Incomplete(ValuesSerializer):
+            fields = ('name',)
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+
+class EmployeeImportTests(AdminAPITestCase):
+    """The staged import reports every invalid row, or loads all rows with their history"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.title = JobTitle.objects.create(name='Engineer')
+        governorate = Governorate.objects.create(name='Cairo', country=Country.objects.create(name='Egypt'))
+        cls.city = City.objects.create(name='Maadi', governorate=governorate)
+
+    def setUp(self):
+        super().setUp()
+        self.path = reverse('employee_import-list')
+
+    def test_errors_are_reported_per_row(self):
+        rows = [
+            {'username': 'new1', 'job_title': 'Engineer', 'city': 'Maadi', 'salary': 1000},
+            {'username': 'admin', 'email': 'not-an-email', 'job_title': 'Astronaut'},
+            {'username': 'new1', 'gender': 'X', 'salary': -5, 'date_of_birth': '2999-01-01'},
+        ]
+        response = self.client.post(self.path, rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        errors = {row['row']: row['errors'] for row in response.data['errors']}
+        self.assertEqual(set(errors), {2, 3})
+        self.assertEqual(set(errors[2]), {'username', 'email', 'job_title'})
+        self.assertEqual(set(errors[3]), {'username', 'gender', 'salary', 'date_of_birth'})
+        self.assertFalse(User.objects.filter(username='new1').exists())
+
+    def test_ambiguous_names_are_row_errors(self):
+        JobTitle.objects.create(name='Engineer')
+        giza = Governorate.objects.create(name='Giza', country=self.city.governorate.country)
+        other = City.objects.create(name='Maadi', governorate=giza)
+        rows = [
+            {'username': 'new1', 'city': 'Maadi'},
+            {'username': 'new2', 'city': 'Maadi', 'governorate': 'Giza'},
+            {'username': 'new3', 'city': 'Maadi', 'governorate': 'Alexandria'},
+            {'username': 'new4', 'job_title': 'Engineer'},
+        ]
+        response = self.client.post(self.path, rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        errors = {row['row']: row['errors'] for row in response.data['errors']}
+        self.assertEqual(errors, {
+            1: {'city': ["City 'Maadi' matches 2 records; add a governorate column."]},
+            3: {'city': ["Unknown city 'Maadi'."]},
+            4: {'job_title': ["Job title 'Engineer' matches 2 records."]},
+        })
+        # The governorate picks between cities of the same name
+        response = self.client.post(self.path, rows[1:2], format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(UserProfile.objects.get(user__username='new2').city_id, other.pk)
+
+    def test_rows_are_loaded_with_history(self):
+        rows = [
+            {'username': f'new{i}', 'job_title': 'Engineer', 'city': 'Maadi', 'salary': 1000 + i, 'start': '2024-01-01'}
+            for i in range(3)
+        ]
+        response = self.client.post(f'{self.path}?dry_run=true', rows, format='json')
+        self.assertEqual(response.data, {'valid': 3})
+        self.assertFalse(User.objects.filter(username='new0').exists())
+
+        response = self.client.post(self.path, rows, format='json')
+        self.assertEqual((response.status_code, response.data), (201, {'created': 3}))
+        profile = UserProfile.objects.get(user__username='new2')
+        self.assertEqual((profile.job_title_id, profile.city_id, profile.salary), (self.title.pk, self.city.pk, 1002))
+        self.assertEqual(profile.governorate_id, self.city.governorate_id)
+        self.assertEqual(list(profile.jobtitlehistory_set.values_list('job_title', flat=True)), [self.title.pk])
+        self.assertEqual(list(profile.salaryhistory_set.values_list('amount', flat=True)), [1002])
+
+
+@modify_settings(MIDDLEWARE={'append': 'accounts.profiling.ProfilingMiddleware'})
+class ProfilingTests(AdminAPITestCase):
+    """Sampled requests are profiled, and only the slow ones are stored"""
+
+    def tearDown(self):
+        # The collector is per thread; keep later tests from recording queries
+        DataCollector().clear()
+
+    @override_settings(ACCOUNTS_PROFILING_SAMPLE_PERCENT=25, ACCOUNTS_PROFILING_PATHS=['/api/'])
+    def test_sample_of_allowlisted_paths(self):
+        request = RequestFactory().get('/api/user-profiles/')
+        with mock.patch('accounts.profiling.random.random', return_value=0.2):
+            self.assertTrue(should_intercept(request))
+            self.assertFalse(should_intercept(RequestFactory().get('/admin/')))
+        with mock.patch('accounts.profiling.random.random', return_value=0.3):
+            self.assertFalse(should_intercept(request))
+
+    @override_settings(ACCOUNTS_PROFILING_SLOW_MS=60 * 1000)
+    def test_fast_requests_are_dropped_unexplained(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(reverse('userprofile-list')).status_code, 200)
+        self.assertFalse(silk_models.Request.objects.exists())
+        self.assertFalse([query for query in queries if query['sql'].startswith('EXPLAIN')])
+
+    @override_settings(ACCOUNTS_PROFILING_SLOW_MS=0)
+    def test_slow_requests_are_stored_with_plans(self):
+        self.assertEqual(self.client.get(reverse('userprofile-list')).status_code, 200)
+        request = silk_models.Request.objects.get()
+        self.assertTrue(request.queries.exists())
+        self.assertFalse(request.queries.filter(analysis__isnull=True).exists())
+
+    @override_settings(ACCOUNTS_PROFILING_SLOW_MS=0, ACCOUNTS_PROFILING_EXPLAIN=False)
+    def test_plans_can_be_turned_off(self):
+        self.client.get(reverse('userprofile-list'))
+        self.assertFalse(silk_models.SQLQuery.objects.filter(analysis__isnull=False).exists())
+
+
+class MetricsTests(SimpleTestCase):
+    """Histograms render in the Prometheus text format behind an optional token"""
+
+    def histogram(self, **kwargs):
+        histogram = Histogram('test_seconds', 'Test timings.', ['name'], **kwargs)
+        self.addCleanup(REGISTRY.remove, histogram)
+        return histogram
+
+    def test_buckets_are_cumulative(self):
+        histogram = self.histogram(buckets=(1, 5))
+        for value in (0.5, 1, 3, 7):
+            histogram.observe(value, name='a')
+        self.assertEqual(histogram.render().splitlines()[2:], [
+            'test_seconds_bucket{name="a",le="1.0"} 2',
+            'test_seconds_bucket{name="a",le="5.0"} 3',
+            'test_seconds_bucket{name="a",le="+Inf"} 4',
+            'test_seconds_sum{name="a"} 11.5',
+            'test_seconds_count{name="a"} 4',
+        ])
+
+    def test_timed_observes_each_call(self):
+        histogram = self.histogram()
+
+        @timed(histogram)
+        def receiver(value):
+            return value * 2
+
+        self.assertEqual(receiver(2), 4)
+        with self.assertRaises(TypeError):
+            receiver()
+        self.assertIn(f'test_seconds_count{{name="{receiver.__qualname__}"}} 2', histogram.render())
+
+    def test_metric_needs_samples(self):
+        with self.assertRaises(TypeError):
+            type('Gauge', (Metric,), {})('test_gauge', 'Incomplete metric.')
+
+    @override_settings(ACCOUNTS_METRICS_TOKEN='secret')
+    def test_token_is_required_when_set(self):
+        factory = RequestFactory()
+        self.assertEqual(metrics_view(factory.get('/metrics')).status_code, 401)
+        self.assertEqual(metrics_view(factory.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong')).status_code, 401)
+        response = metrics_view(factory.get('/metrics', HTTP_AUTHORIZATION='Bearer secret'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE accounts_http_request_duration_seconds histogram', response.content)
+
+
+@modify_settings(MIDDLEWARE={'remove': 'accounts.profiling.ProfilingMiddleware'})
+class LoadToolingTests(TransactionTestCase):
+    """
+    generate_dataset and run_load at smoke-test size on SQLite.
+    The load runs in its own threads with their own connections, so the data has
+    to be committed.
+    """
+
+    def generate(self, **options):
+        sizes = dict(countries=2, governorates=2, cities=2, job_titles=3, users=12, deductions=30, batch_size=5)
+        return generate_dataset(**{**sizes, **options})
+
+    def test_generate_dataset(self):
+        counts = self.generate()
+        self.assertEqual(counts, {
+            'countries': 2, 'governorates': 4, 'cities': 8, 'job titles': 3, 'users': 12,
+            'job title history': 36, 'salary history': 36, 'deductions': 30,
+        })
+        profiles = UserProfile.objects.filter(user__username__startswith='load')
+        self.assertEqual(profiles.count(), 12)
+        # Profiles copy the geography of their city
+        self.assertFalse(profiles.exclude(governorate=F('city__governorate')).exists())
+        self.assertFalse(profiles.exclude(country=F('city__governorate__country')).exists())
+        for profile in profiles:
+            # Consecutive periods, the last one open and matching the profile
+            periods = list(profile.salaryhistory_set.order_by('start').values_list('start', 'end', 'amount'))
+            self.assertEqual([end for _, end, _ in periods[:-1]], [start for start, _, _ in periods[1:]])
+            self.assertEqual(periods[-1][1:], (None, profile.salary))
+        self.assertEqual(Deduction.objects.count(), 30)
+        self.assertTrue(PayrollRollup.objects.exists())
+
+    def test_generate_dataset_command(self):
+        stdout = io.StringIO()
+        call_command('generate_dataset', users=3, deductions=4, countries=1, stdout=stdout)
+        self.assertIn('3 users', stdout.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('generate_dataset', users=1, stdout=io.StringIO())
+
+    def test_run_load_in_process(self):
+        self.generate()
+        user = User.objects.create_user('loadtest', is_staff=True)
+        token = str(AccessToken.for_user(user))
+        results, elapsed = run_load(lambda: InProcessTransport(token), DEFAULT_MIX, requests=40, seed=1)
+        self.assertEqual(sum(map(len, results.values())), 40)
+        statuses = {name: {status for _, status in samples} for name, samples in results.items()}
+        for name, codes in statuses.items():
+            self.assertTrue(all(code is not None and code < 400 for code in codes), (name, codes))
+        lines = format_report(results, elapsed)
+        self.assertEqual(lines[-1].split()[:2], ['total', '40'])
+
+    def test_load_test_command(self):
+        self.generate()
+        stdout = io.StringIO()
+        call_command('load_test', requests=5, mix='detail=1,list=1', stdout=stdout)
+        self.assertIn('Sent 5 requests', stdout.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('load_test', mix='browse=1', stdout=io.StringIO())
+
+
+class ConnectionModeTests(TestCase):
+    """P_CONN_MODE picks how database connections are kept, and benchmark_connections compares the modes"""
+
+    def settings_in_subprocess(self, code, **env):
+        environ = {key: value for key, value in os.environ.items() if key != 'P_CONN_MODE'}
+        result = subprocess.run(
+            [sys.executable, '-c', code], env={**environ, **env},
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        return result
+
+    def database_settings(self, **env):
+        code = (
+            'import json; from backend.settings import DATABASES as d; '
+            'print(json.dumps([d["default"]["CONN_MAX_AGE"], d["default"]["OPTIONS"].get("pool")]))'
+        )
+        result = self.settings_in_subprocess(code, **env)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return json.loads(result.stdout)
+
+    def test_modes(self):
+        self.assertEqual(self.database_settings(P_CONN_MAX_AGE='30'), [30, None])
+        self.assertEqual(self.database_settings(P_CONN_MODE='none'), [0, None])
+        max_age, pool = self.database_settings(P_CONN_MODE='pool', P_POOL_MAX_SIZE='4')
+        self.assertEqual((max_age, pool['max_size']), (0, 4))
+        result = self.settings_in_subprocess('import backend.settings', P_CONN_MODE='shared')
+        self.assertIn('ImproperlyConfigured', result.stderr)
+
+    def test_asgi_default(self):
+        code = 'import os, backend.asgi; print(os.environ["P_CONN_MODE"])'
+        result = self.settings_in_subprocess(code, P_ENGINE='django.db.backends.sqlite3')
+        self.assertEqual(result.stdout.strip(), 'none', result.stderr)
+
+    def test_benchmark_connections(self):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('benchmark_connections', requests=3, modes='none,persistent,pool', stdout=stdout, stderr=stderr)
+        rows = {line.split()[0]: line.split()[1:3] for line in stdout.getvalue().splitlines()[1:-1]}
+        # Django never closes an in-memory SQLite database, so none cannot reconnect here
+        self.assertEqual(rows, {'none': ['3', '1'], 'persistent': ['3', '1']})
+        self.assertIn('pool: skipped', stderr.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('benchmark_connections', modes='shared', stdout=io.StringIO())
@@ -3,15 +3,25 @@ from rest_framework.routers import DefaultRouter
 
 from accounts.serializers import JobTitleHistorySerializer
 
+from .async_views import (
+    AsyncCityView,
+    AsyncJobTitleHistoryView,
+    AsyncSalaryHistoryView,
+    AsyncUserProfileView,
+)
 from .views import (
     BlackListViewSet,
     CityViewSet,
     CountryViewSet,
     DeductionViewSet,
+    EmployeeImportViewSet,
+    GeographyViewSet,
     GovernorateViewSet,
     JobTitleHistoryViewSet,
     JobTitleViewSet,
     LoggedInUserViewSet,
+    PayrollRollupViewSet,
+    PresenceViewSet,
     SalaryHistoryViewSet,
     UserProfileViewSet,
 )
@@ -21,13 +31,30 @@ router.register(r'blacklist', BlackListViewSet, basename='blacklist')
 router.register(r'cities', CityViewSet, basename='city')
 router.register(r'country', CountryViewSet, basename='country')
 router.register(r'deduction', DeductionViewSet, basename='deduction')
+router.register(r'employee-import', EmployeeImportViewSet, basename='employee_import')
+router.register(r'geography', GeographyViewSet, basename='geography')
 router.register(r'governorate', GovernorateViewSet, basename='governorate')
 router.register(r'job-title', JobTitleViewSet, basename='jobtitle')
 router.register(r'job-title-history', JobTitleHistoryViewSet, basename='jobtitle_history')
 router.register(r'logged-in-user', LoggedInUserViewSet, basename='logged_in_user')
+router.register(r'payroll-rollup', PayrollRollupViewSet, basename='payroll_rollup')
+router.register(r'presence', PresenceViewSet, basename='presence')
 router.register(r'salary-history', SalaryHistoryViewSet, basename='salary_history')
 router.register(r'user-profiles', UserProfileViewSet, basename='userprofile')
 
+# Async read-only counterparts of the read-heavy endpoints, for ASGI deployments
+async_urlpatterns = [
+    path('user-profiles/', AsyncUserProfileView.as_view(), name='async_userprofile-list'),
+    path('user-profiles/<int:pk>/', AsyncUserProfileView.as_view(), name='async_userprofile-detail'),
+    path('cities/', AsyncCityView.as_view(), name='async_city-list'),
+    path('cities/<int:pk>/', AsyncCityView.as_view(), name='async_city-detail'),
+    path('job-title-history/', AsyncJobTitleHistoryView.as_view(), name='async_jobtitle_history-list'),
+    path('job-title-history/<int:pk>/', AsyncJobTitleHistoryView.as_view(), name='async_jobtitle_history-detail'),
+    path('salary-history/', AsyncSalaryHistoryView.as_view(), name='async_salary_history-list'),
+    path('salary-history/<int:pk>/', AsyncSalaryHistoryView.as_view(), name='async_salary_history-detail'),
+]
+
 urlpatterns = [
     path('', include(router.urls)),
+    path('async/', include(async_urlpatterns)),
 ]
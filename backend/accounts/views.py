@@ -1,13 +1,29 @@
+import os
+
+from django.contrib.auth.models import User
 from django.db import transaction
+from django.db.models import Count, F, Sum, Window
+from django.db.models.functions import RowNumber
+from django.http import Http404, HttpResponse
 from django.utils import timezone
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
-from accounts.filters import UserProfileFilter
+from accounts.cache import CachedResponseMixin, ConditionalResponseMixin
+from accounts.export import StreamingExportMixin
+from accounts.filters import DeductionFilter, PayrollRollupFilter, UserProfileFilter
+from accounts.geography import get_document
+from accounts.imports import IMPORT_FORMATS, EmployeeImporter, load_dataset
 from accounts.models import (
     BlacklistedAccessToken,
     City,
@@ -17,39 +33,42 @@ from accounts.models import (
     JobTitle,
     JobTitleHistory,
     LoggedInUser,
+    PayrollRollup,
     SalaryHistory,
     UserProfile,
 )
+from accounts.pagination import SelectablePagination, StandardResultsSetPagination
+from accounts.presence import OnlineIds, presence
+from accounts.search import RankedSearchFilter
 from accounts.serializers import (
     BlacklistedAccessTokenSerializer,
     CityDetailSerializer,
     CityUpdateSerializer,
     CountrySerializer,
     DeductionDetailSerializer,
+    DeductionListSerializer,
     DeductionUpdateSerializer,
     GovernorateDetailSerializer,
     GovernorateUpdateSerializer,
+    JobTitleHistoryListSerializer,
     JobTitleHistorySerializer,
     JobTitleSerializer,
     LoggedInUserSerializer,
+    PayrollRollupSerializer,
+    SalaryHistoryListSerializer,
     SalaryHistorySerializer,
+    UserProfileBulkUpdateSerializer,
     UserProfileDetailSerializer,
+    UserProfileListSerializer,
     UserProfileUpdateSerializer,
 )
+from accounts.temporal import AS_OF_PARAM, AsOfFilter, effective_value, parse_as_of
 
 
-class StandardResultsSetPagination(PageNumberPagination):
-    """
-    Standard pagination class for consistent pagination across viewsets
-    """
-    page_size = 10
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
-
-class JobTitleViewSet(viewsets.ModelViewSet):
+class JobTitleViewSet(ConditionalResponseMixin, CachedResponseMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing JobTitle endpoints.
+    List and detail responses are cached, and revalidated with ETags, until a JobTitle changes.
     """
     queryset = JobTitle.objects.all()
     serializer_class = JobTitleSerializer
@@ -57,9 +76,10 @@ class JobTitleViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
 
-class CountryViewSet(viewsets.ModelViewSet):
+class CountryViewSet(ConditionalResponseMixin, CachedResponseMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing Country endpoints.
+    List and detail responses are cached, and revalidated with ETags, until a Country changes.
     """
     queryset = Country.objects.all()
     serializer_class = CountrySerializer
@@ -67,12 +87,14 @@ class CountryViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
 
-class GovernorateViewSet(viewsets.ModelViewSet):
+class GovernorateViewSet(ConditionalResponseMixin, CachedResponseMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing Governorate objects.
     Dynamically selects serializer class based on the request method.
+    Responses are cached, and revalidated with ETags, until a Governorate or Country changes.
     """
     queryset = Governorate.objects.select_related('country').all()
+    cache_dependencies = (Country,)
     pagination_class = StandardResultsSetPagination
     permission_classes = [IsAuthenticated]
 
@@ -82,12 +104,14 @@ class GovernorateViewSet(viewsets.ModelViewSet):
         return GovernorateUpdateSerializer
 
 
-class CityViewSet(viewsets.ModelViewSet):
+class CityViewSet(ConditionalResponseMixin, CachedResponseMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing City objects.
     Dynamically selects serializer class based on the request method.
+    Responses are cached, and revalidated with ETags, until a City, Governorate or Country changes.
     """
     queryset = City.objects.select_related('governorate', 'governorate__country').all()
+    cache_dependencies = (Governorate, Country)
     pagination_class = StandardResultsSetPagination
     permission_classes = [IsAuthenticated]
 
@@ -97,29 +121,35 @@ class CityViewSet(viewsets.ModelViewSet):
         return CityUpdateSerializer
 
 
-class UserProfileViewSet(viewsets.ModelViewSet):
+class UserProfileViewSet(ConditionalResponseMixin, StreamingExportMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing UserProfile objects.
     Only allows retrieving and updating profiles, as creation and deletion are handled through User model.
     Includes pagination, filtering, and custom actions.
+    List and detail answer conditional requests (ETag / Last-Modified), and with
+    ?as_of= report the job title and salary in effect at that date/time.
     """
     queryset = UserProfile.objects.select_related(
         'user',
         'job_title',
         'city',
-        'city__governorate',
-        'city__governorate__country'
+        'governorate',
+        'country'
     ).all()
     filterset_class = UserProfileFilter
     filter_backends = [
-        filters.SearchFilter,
         filters.OrderingFilter,
+        RankedSearchFilter,
         DjangoFilterBackend
     ]
     search_fields = ['user__username', 'user__email', 'address']
     ordering_fields = ['date_of_birth', 'salary', 'start']
     ordering = ['-start']  # Default ordering
     pagination_class = StandardResultsSetPagination
+    export_serializer_class = UserProfileListSerializer
+    cache_dependencies = (User, JobTitle, City, Governorate, Country)
+    conditional_exempt_params = ('is_online',)  # Presence is not versioned
+    date_dependent = True  # age and years_of_service
     permission_classes = [IsAuthenticated]
     http_method_names = ['get', 'put', 'patch', 'head', 'options']  # Only allow GET and UPDATE operations
 
@@ -128,20 +158,109 @@ class UserProfileViewSet(viewsets.ModelViewSet):
             return UserProfileDetailSerializer
         return UserProfileUpdateSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        as_of = parse_as_of(self.request)
+        # The sync list selects its own as_of columns, see UserProfileListSerializer
+        if as_of is not None and self.action in ('list', 'retrieve'):
+            queryset = queryset.annotate(
+                as_of_job_title=effective_value(JobTitleHistory, 'job_title__name', as_of),
+                as_of_salary=effective_value(SalaryHistory, 'amount', as_of),
+            )
+        return queryset
+
+    def get_cache_models(self):
+        models = super().get_cache_models()
+        if AS_OF_PARAM in self.request.query_params:
+            models += [JobTitleHistory, SalaryHistory]
+        return models
+
+    def get_export_serializer(self):
+        return UserProfileListSerializer(as_of=parse_as_of(self.request))
+
+    def list(self, request, *args, **kwargs):
+        """List profiles through the values()-based fast path, same output as the detail serializer"""
+        return self.conditional_response(request, self.list_values, *args, **kwargs)
+
+    def list_values(self, request, *args, **kwargs):
+        serializer = UserProfileListSerializer(as_of=parse_as_of(request))
+        queryset = serializer.get_queryset(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.many(page))
+        return Response(serializer.many(queryset))
+
+    @action(detail=False, methods=['patch'], url_path='bulk')
+    def bulk_partial_update(self, request):
+        """Partially update many profiles at once, e.g. for annual salary reviews"""
+        ids = UserProfileBulkUpdateSerializer.profile_ids(request.data)
+        profiles = UserProfile.objects.filter(pk__in=ids)
+        serializer = self.get_serializer(
+            list(profiles), data=request.data, many=True, partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        updated = serializer.save()
+        return Response({'updated': len(updated)})
+
+    def summarize_deductions(self, profile_ids):
+        """
+        Summarize the deductions of many profiles in a single query.
+        Window functions compute the total and count per profile and pick the
+        latest deduction as the row numbered 1; ?date_after/?date_before narrow it.
+        """
+        deductions = DeductionFilter(
+            self.request.query_params,
+            queryset=Deduction.objects.filter(user_profile__in=profile_ids),
+        )
+        if not deductions.is_valid():
+            raise ValidationError(deductions.errors)
+
+        partition = [F('user_profile')]
+        latest = deductions.qs.select_related('user_profile__user').annotate(
+            total_deductions=Window(Sum('amount'), partition_by=partition),
+            deduction_count=Window(Count('pk'), partition_by=partition),
+            position=Window(
+                RowNumber(),
+                partition_by=partition,
+                order_by=[F('date').desc(nulls_last=True), F('pk').desc()],
+            ),
+        ).filter(position=1)
+
+        summaries = {
+            pk: {'total_deductions': 0, 'deduction_count': 0, 'latest_deduction': None}
+            for pk in profile_ids
+        }
+        for deduction in latest:
+            summaries[deduction.user_profile_id] = {
+                'total_deductions': deduction.total_deductions,
+                'deduction_count': deduction.deduction_count,
+                'latest_deduction': DeductionDetailSerializer(deduction).data,
+            }
+        return summaries
+
     @action(detail=True, methods=['get'])
     def deductions_summary(self, request, pk=None):
         """Get summary of user's deductions"""
         profile = self.get_object()
-        deductions = profile.deduction_set.all()
-        
-        summary = {
-            'total_deductions': sum(d.amount for d in deductions),
-            'deduction_count': deductions.count(),
-            'latest_deduction': DeductionDetailSerializer(
-                deductions.order_by('-date').first()
-            ).data if deductions.exists() else None
-        }
-        return Response(summary)
+        return Response(self.summarize_deductions([profile.pk])[profile.pk])
+
+    @action(detail=False, methods=['get'], url_path='deductions-summary')
+    def deductions_summaries(self, request):
+        """Get deduction summaries for a page of profiles, optionally limited with ?ids=1,2"""
+        profiles = self.filter_queryset(self.get_queryset())
+        ids = request.query_params.get('ids')
+        if ids:
+            try:
+                profiles = profiles.filter(pk__in=[int(pk) for pk in ids.split(',')])
+            except ValueError:
+                raise ValidationError({'ids': 'Expected a comma separated list of ids'})
+
+        page = self.paginate_queryset(profiles)
+        summaries = self.summarize_deductions([profile.pk for profile in page])
+        return self.get_paginated_response([
+            {'id': profile.pk, 'user': profile.user.username, **summaries[profile.pk]}
+            for profile in page
+        ])
 
     @action(detail=True, methods=['get'])
     def salary_history(self, request, pk=None):
@@ -151,21 +270,25 @@ class UserProfileViewSet(viewsets.ModelViewSet):
         return Response(SalaryHistorySerializer(history, many=True).data)
 
 
-class DeductionViewSet(viewsets.ModelViewSet):
+class DeductionViewSet(ConditionalResponseMixin, StreamingExportMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing Deduction objects.
     Includes pagination, filtering, and error handling.
     """
     queryset = Deduction.objects.select_related("user_profile", "user_profile__user").all()
     filter_backends = [
-        filters.SearchFilter,
         filters.OrderingFilter,
+        RankedSearchFilter,
         DjangoFilterBackend
     ]
-    search_fields = ['name', 'description']
+    filterset_class = DeductionFilter
+    search_fields = ['name', 'discription']
     ordering_fields = ['date', 'amount']
     ordering = ['-date']
-    pagination_class = StandardResultsSetPagination
+    pagination_class = SelectablePagination
+    keyset_ordering = ('-date', '-id')
+    export_serializer_class = DeductionListSerializer
+    cache_dependencies = (UserProfile, User)
     permission_classes = [IsAuthenticated]
 
     def get_serializer_class(self):
@@ -200,24 +323,34 @@ class BlackListViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
 
-class JobTitleHistoryViewSet(viewsets.ModelViewSet):
+class JobTitleHistoryViewSet(ConditionalResponseMixin, StreamingExportMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing JobTitleHistory objects.
+    ?as_of= limits it to the records in effect at that date/time.
     """
-    queryset = JobTitleHistory.objects.select_related("user_profile", "job_title").all()
+    queryset = JobTitleHistory.objects.select_related("user_profile__user", "job_title").all()
     serializer_class = JobTitleHistorySerializer
-    pagination_class = StandardResultsSetPagination
+    filter_backends = [DjangoFilterBackend, AsOfFilter]
+    pagination_class = SelectablePagination
+    keyset_ordering = ('start', 'id')
+    export_serializer_class = JobTitleHistoryListSerializer
+    cache_dependencies = (JobTitle, UserProfile, User)
     permission_classes = [IsAuthenticated]
     http_method_names = ['get']
 
 
-class SalaryHistoryViewSet(viewsets.ModelViewSet):
+class SalaryHistoryViewSet(ConditionalResponseMixin, StreamingExportMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing SalaryHistory objects.
+    ?as_of= limits it to the records in effect at that date/time.
     """
-    queryset = SalaryHistory.objects.select_related("user_profile").all()
+    queryset = SalaryHistory.objects.select_related("user_profile__user").all()
     serializer_class = SalaryHistorySerializer
-    pagination_class = StandardResultsSetPagination
+    filter_backends = [DjangoFilterBackend, AsOfFilter]
+    pagination_class = SelectablePagination
+    keyset_ordering = ('start', 'id')
+    export_serializer_class = SalaryHistoryListSerializer
+    cache_dependencies = (UserProfile, User)
     permission_classes = [IsAuthenticated]
     http_method_names = ['get']
 
@@ -230,3 +363,126 @@ class LoggedInUserViewSet(viewsets.ModelViewSet):
     serializer_class = LoggedInUserSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [IsAuthenticated]
+
+
+class PayrollRollupViewSet(ConditionalResponseMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only ViewSet for the monthly PayrollRollup table.
+    Serves month-end reports without touching the deductions table.
+    """
+    queryset = PayrollRollup.objects.select_related("user_profile__user").all()
+    serializer_class = PayrollRollupSerializer
+    filterset_class = PayrollRollupFilter
+    filter_backends = [filters.OrderingFilter, DjangoFilterBackend]
+    ordering_fields = ['period']
+    ordering = ['-period']
+    pagination_class = SelectablePagination
+    keyset_ordering = ('-period', '-id')
+    cache_dependencies = (UserProfile, User)
+    permission_classes = [IsAuthenticated]
+
+
+class PresenceViewSet(viewsets.ViewSet):
+    """
+    ViewSet for online presence, backed by the presence store.
+    Clients send a heartbeat while active; list and count never touch LoggedInUser.
+    """
+    pagination_class = StandardResultsSetPagination
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        """List online users, reading only the requested page from the store"""
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(OnlineIds(), request, view=self)
+        users = dict(User.objects.filter(pk__in=page).values_list('pk', 'username'))
+        return paginator.get_paginated_response([
+            {'id': user_id, 'username': users[user_id]}
+            for user_id in page if user_id in users
+        ])
+
+    @action(detail=False, methods=['get'])
+    def count(self, request):
+        """Number of online users, e.g. for the status cards"""
+        return Response({'online': presence.count()})
+
+    @action(detail=False, methods=['post'])
+    def heartbeat(self, request):
+        """Mark the current user online for another ACCOUNTS_PRESENCE_TTL seconds"""
+        presence.heartbeat(request.user.pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['post'])
+    def leave(self, request):
+        """Mark the current user offline"""
+        presence.leave(request.user.pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class GeographyViewSet(viewsets.ViewSet):
+    """
+    ViewSet serving the whole Country → Governorate → City hierarchy as one
+    nested document, or the subtree of ?country=<id> or ?governorate=<id>, e.g.
+    for cascading address dropdowns.
+    Documents are built once per geography version and kept in the cache, then
+    served gzipped to clients that accept it and revalidated with ETags.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        """Return the geography tree, or the requested subtree"""
+        scope, pk = 'all', None
+        for param in ('governorate', 'country'):
+            if param in request.query_params:
+                try:
+                    scope, pk = param, int(request.query_params[param])
+                except ValueError:
+                    raise ValidationError({param: 'A valid integer is required.'})
+                break
+
+        document = get_document(scope, pk)
+        if document is None:
+            raise Http404
+        response = get_conditional_response(request, etag=document.etag)
+        if response is None:
+            if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+                response = HttpResponse(document.gzipped, content_type='application/json')
+                response['Content-Encoding'] = 'gzip'
+            else:
+                response = HttpResponse(document.body, content_type='application/json')
+        response['ETag'] = document.etag
+        patch_vary_headers(response, ['Accept-Encoding'])
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class EmployeeImportViewSet(viewsets.ViewSet):
+    """
+    ViewSet for bulk employee onboarding.
+    POST a CSV/XLSX/JSON file as `file` (multipart) or a JSON list of rows; see
+    EmployeeResource for the columns. ?dry_run=true only validates. The import is
+    all-or-nothing: any invalid row returns 400 with the errors of every row.
+    """
+    parser_classes = [JSONParser, MultiPartParser]
+    permission_classes = [IsAdminUser]
+
+    def create(self, request):
+        """Import employees from an uploaded file or a JSON list"""
+        upload = request.FILES.get('file')
+        if upload is not None:
+            extension = os.path.splitext(upload.name)[1].lstrip('.').lower()
+            if extension not in IMPORT_FORMATS:
+                raise ValidationError({'file': [f"Unsupported file type, use one of: {', '.join(IMPORT_FORMATS)}"]})
+            rows = load_dataset(upload, extension)
+        elif isinstance(request.data, list) and all(isinstance(row, dict) for row in request.data):
+            rows = request.data
+        else:
+            raise ValidationError({'file': ['Upload a file or send a list of rows.']})
+
+        dry_run = request.query_params.get('dry_run', '').lower() in ('1', 'true')
+        importer = EmployeeImporter()
+        count = importer.run(rows, dry_run=dry_run)
+        if importer.errors:
+            return Response({'errors': importer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        if dry_run:
+            return Response({'valid': count})
+        return Response({'created': count}, status=status.HTTP_201_CREATED)
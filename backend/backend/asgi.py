@@ -12,5 +12,11 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Persistent connections are not reused across ASGI requests, pool them instead
+# (PostgreSQL only; elsewhere connect per request). P_CONN_MODE still wins.
+if os.getenv('P_ENGINE', 'django.db.backends.postgresql') == 'django.db.backends.postgresql':
+    os.environ.setdefault('P_CONN_MODE', 'pool')
+else:
+    os.environ.setdefault('P_CONN_MODE', 'none')
 
 application = get_asgi_application()
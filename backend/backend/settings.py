@@ -1,6 +1,8 @@
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # import dj_database_url
 from dotenv import load_dotenv
 
@@ -8,6 +10,10 @@ load_dotenv()
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
+def env_flag(name, default='1'):
+    return os.getenv(name, default).lower() not in ('0', 'false', 'no', 'off')
+
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
 
@@ -49,13 +55,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # uvicorn serves no files, static files (admin, silk) are served by the app
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'silk.middleware.SilkyMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -95,9 +102,32 @@ DATABASES = {
         'PASSWORD': os.getenv('P_PASSWORD'),
         'HOST': os.getenv('P_HOST', 'localhost'),
         'PORT': os.getenv('P_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.getenv('P_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': env_flag('P_CONN_HEALTH_CHECKS'),
+        'OPTIONS': {},
     }
 }
 
+# Connection management, P_CONN_MODE:
+#   persistent  each worker thread keeps its connection for P_CONN_MAX_AGE seconds,
+#               checked before reuse when P_CONN_HEALTH_CHECKS is on (default
+#               under WSGI and manage.py)
+#   pool        Django's psycopg 3 pool, shared by the threads of a process; suits
+#               ASGI, where connections are not reused (default in backend.asgi)
+#   none        a new connection for every request
+DATABASE_CONNECTION_MODE = os.getenv('P_CONN_MODE', 'persistent')
+if DATABASE_CONNECTION_MODE == 'pool':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.getenv('P_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.getenv('P_POOL_MAX_SIZE', 10)),
+        'timeout': float(os.getenv('P_POOL_TIMEOUT', 10)),
+    }
+elif DATABASE_CONNECTION_MODE == 'none':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+elif DATABASE_CONNECTION_MODE != 'persistent':
+    raise ImproperlyConfigured("P_CONN_MODE must be 'persistent', 'pool' or 'none'")
+
 # DATABASES = {
 #     'default': {
 #         'ENGINE': 'django.db.backends.sqlite3',
@@ -106,6 +136,24 @@ DATABASES = {
 # }
 
 
+# Cache
+# Redis in production (REDIS_URL), local memory for development and tests
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -141,6 +189,14 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
 STATIC_URL = 'static/'
+# Filled by collectstatic when the container starts
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+# Without collectstatic (development, tests) WhiteNoise finds the files itself
+WHITENOISE_USE_FINDERS = WHITENOISE_AUTOREFRESH = not STATIC_ROOT.is_dir()
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedStaticFilesStorage'},
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -151,12 +207,53 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Django Rest Framework Settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.RevocationJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
 }
 
+# Blacklisted access tokens are checked in process and refreshed from the database
+ACCOUNTS_REVOCATION_REFRESH_SECONDS = int(os.getenv('ACCOUNTS_REVOCATION_REFRESH_SECONDS', 10))
+# Refreshes re-read blacklist rows this much older than the last one, covering
+# rows committed late and clock skew between servers
+ACCOUNTS_REVOCATION_OVERLAP_SECONDS = int(os.getenv('ACCOUNTS_REVOCATION_OVERLAP_SECONDS', 60))
+
+# Seconds a presence heartbeat (POST presence/heartbeat/) keeps a user online
+ACCOUNTS_PRESENCE_TTL = int(os.getenv('ACCOUNTS_PRESENCE_TTL', 120))
+# Seconds a login keeps a user online. Until logout (inf) by default, as the
+# clients do not send heartbeats yet; lower it once they do
+ACCOUNTS_PRESENCE_LOGIN_TTL = float(os.getenv('ACCOUNTS_PRESENCE_LOGIN_TTL', 'inf'))
+
+# Silk profiling
+# ACCOUNTS_PROFILING=0 turns the profiler off. Otherwise a sample of the requests
+# under the allowlisted path prefixes (comma separated, all paths when empty) is
+# profiled, and only those slower than ACCOUNTS_PROFILING_SLOW_MS are stored.
+ACCOUNTS_PROFILING = env_flag('ACCOUNTS_PROFILING')
+ACCOUNTS_PROFILING_SAMPLE_PERCENT = float(os.getenv('ACCOUNTS_PROFILING_SAMPLE_PERCENT', 100))
+ACCOUNTS_PROFILING_PATHS = [path for path in os.getenv('ACCOUNTS_PROFILING_PATHS', '').split(',') if path]
+ACCOUNTS_PROFILING_SLOW_MS = float(os.getenv('ACCOUNTS_PROFILING_SLOW_MS', 0))
+# Query plans of the stored requests are explained after the response; ANALYZE
+# would run every query a second time, so it stays off
+ACCOUNTS_PROFILING_EXPLAIN = env_flag('ACCOUNTS_PROFILING_EXPLAIN')
+SILKY_ANALYZE_QUERIES = False
+if ACCOUNTS_PROFILING:
+    MIDDLEWARE.append('accounts.profiling.ProfilingMiddleware')
+SILKY_MIDDLEWARE_CLASS = 'accounts.profiling.ProfilingMiddleware'
+# Oldest requests are deleted past this many, checked on 10% of the writes
+SILKY_MAX_RECORDED_REQUESTS = int(os.getenv('SILKY_MAX_RECORDED_REQUESTS', 10000))
+SILKY_MAX_REQUEST_BODY_SIZE = int(os.getenv('SILKY_MAX_BODY_SIZE_KB', 64)) * 1024
+SILKY_MAX_RESPONSE_BODY_SIZE = SILKY_MAX_REQUEST_BODY_SIZE
+
+# Request, serializer and signal receiver metrics, served at /metrics when
+# ACCOUNTS_METRICS=1. With ACCOUNTS_METRICS_TOKEN set, scrapers must send it as
+# a Bearer token.
+# Installed inside the profiler so its writes are not counted
+ACCOUNTS_METRICS = env_flag('ACCOUNTS_METRICS', '0')
+ACCOUNTS_METRICS_TOKEN = os.getenv('ACCOUNTS_METRICS_TOKEN', '')
+if ACCOUNTS_METRICS:
+    MIDDLEWARE.append('accounts.metrics.MetricsMiddleware')
+
 # SIMPLE_JWT = {
 #     'SIGNING_KEY': SECRET_KEY,
 #     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),